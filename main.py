@@ -1,35 +1,80 @@
-from testing.test_get_simplified_gta_graph_network import test_get_simplified_gta_graph_network
-from testing.test_get_route_graph import test_get_route_graph
-from testing.test_get_connecting_routes import test_connecting_routes
 import argparse
 
 MIN_STEP = 1
-MAX_STEP = 3
+MAX_STEP = 17
 TEST_MODE = 'testing'
 
-parser = argparse.ArgumentParser(description="GTA Commuter Buddy")
+# Process-pool workers are spawned and import this module as __mp_main__, so they must not
+# pay for importing every test module and its dependencies
+if __name__ == '__main__':
+    from testing.test_get_simplified_gta_graph_network import test_get_simplified_gta_graph_network
+    from testing.test_get_route_graph import test_get_route_graph
+    from testing.test_get_connecting_routes import test_connecting_routes
+    from testing.test_consolidate_intersections import test_consolidate_intersections
+    from testing.test_departure_time_sweep import test_departure_time_sweep
+    from testing.test_routing_client import test_routing_client
+    from testing.test_staged_preprocessing import test_staged_preprocessing
+    from testing.test_builder_snapshot import test_builder_snapshot
+    from testing.test_polyline_simplification import test_polyline_simplification
+    from testing.test_via_selection import test_via_selection
+    from testing.test_graphml_loader import test_graphml_loader
+    from testing.test_local_alternatives import test_local_alternatives
+    from testing.test_map_matching import test_map_matching
+    from testing.test_commute_monitor import test_commute_monitor
+    from testing.test_graph_arena import test_graph_arena
+    from testing.test_matrix_evaluation import test_matrix_evaluation
+    from testing.test_graph_pyramid import test_graph_pyramid
 
-parser.add_argument('--test', '-t', action='store_true', default=True, help='Enable for testing mode')
-parser.add_argument('--step', '-s', type=int, help=f'A test step between {MIN_STEP} and {MAX_STEP}')
+    parser = argparse.ArgumentParser(description="GTA Commuter Buddy")
 
-args = parser.parse_args()
+    parser.add_argument('--test', '-t', action='store_true', default=True, help='Enable for testing mode')
+    parser.add_argument('--step', '-s', type=int, help=f'A test step between {MIN_STEP} and {MAX_STEP}')
 
-if not args.test:
-    raise NotImplementedError('Only testing mode is implemented')
-else:
-    mode = TEST_MODE
+    args = parser.parse_args()
 
-if mode == TEST_MODE:
-    if args.step is None:
-        raise ValueError('Step is required for testing mode')
-    
-    match args.step:
-        case 1:
-            test_get_simplified_gta_graph_network()
-        case 2:
-            test_get_route_graph()
-        case 3:
-            test_connecting_routes()
-        case _:
-            raise ValueError('Invalid step')
+    if not args.test:
+        raise NotImplementedError('Only testing mode is implemented')
+    else:
+        mode = TEST_MODE
 
+    if mode == TEST_MODE:
+        if args.step is None:
+            raise ValueError('Step is required for testing mode')
+    
+        match args.step:
+            case 1:
+                test_get_simplified_gta_graph_network()
+            case 2:
+                test_get_route_graph()
+            case 3:
+                test_connecting_routes()
+            case 4:
+                test_consolidate_intersections()
+            case 5:
+                test_departure_time_sweep()
+            case 6:
+                test_routing_client()
+            case 7:
+                test_staged_preprocessing()
+            case 8:
+                test_builder_snapshot()
+            case 9:
+                test_polyline_simplification()
+            case 10:
+                test_via_selection()
+            case 11:
+                test_graphml_loader()
+            case 12:
+                test_local_alternatives()
+            case 13:
+                test_map_matching()
+            case 14:
+                test_commute_monitor()
+            case 15:
+                test_graph_arena()
+            case 16:
+                test_matrix_evaluation()
+            case 17:
+                test_graph_pyramid()
+            case _:
+                raise ValueError('Invalid step')
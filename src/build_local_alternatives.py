@@ -0,0 +1,71 @@
+import networkx as nx
+import numpy as np
+from typing import Dict, List, Tuple
+
+from src.build_route_graph import RouteGraphBuilder
+from src.helpers.csr_graph import CSRGraph
+from src.helpers.alternative_routes import get_diverse_paths, get_path_cost
+from src.helpers.interchange_connectors import ConnectorIndex, build_routing_graph
+from src.helpers.polyline import Polyline
+from src.helpers.spatial_index import NodeSpatialIndex
+
+from src.utils.timer import Timer
+from src.utils.constants import ALTERNATIVE_COUNT
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+
+class LocalAlternativesBuilder:
+    """
+    Generates k diverse alternative routes locally, without API calls, over the
+    routing graph (simplified major intersections, toll chains and the interchange
+    connectors between them, see build_routing_graph). Routes come back in the same
+    format as the HERE-based route graphs: a route graph per alternative, its polyline
+    and its {polyline_idx: base node id} mapping. Unlike HERE's, the polylines are chord
+    lines straight from node to node, see build_alternatives.
+    """
+    def __init__(self, route_builder: RouteGraphBuilder, connector_index: ConnectorIndex | None = None) -> None:
+        self.route_builder = route_builder
+
+        with Timer('Building local alternatives graphs', 'Built local alternatives graphs'):
+            self.graph = route_builder.routing_graph if connector_index is None else build_routing_graph(
+                route_builder.major_ints_graph, route_builder.toll_graph, connector_index
+            )
+            self.non_toll_graph = self.graph.subgraph(self.graph.node_ids[~self.graph.is_toll])
+        self.snap_indexes = {False: NodeSpatialIndex(self.graph), True: NodeSpatialIndex(self.non_toll_graph)}
+
+    def get_search_graph(self, avoid_tolls: bool) -> CSRGraph:
+        return self.non_toll_graph if avoid_tolls else self.graph
+
+    def build_alternatives(
+        self,
+        start_lat: float,
+        start_lon: float,
+        end_lat: float,
+        end_lon: float,
+        k: int = ALTERNATIVE_COUNT,
+        avoid_tolls: bool = True
+    ) -> Tuple[List[nx.MultiDiGraph], List[Polyline], List[Dict[int, int]]]:
+        """
+        Up to k diverse routes between the graph nodes nearest to the endpoints. Each polyline
+        is the chord line through its path's nodes, with no road geometry in between, and the
+        path positions are its polyline indices: route node j is polyline point j. Anything
+        measured against these polylines downstream, e.g. get_closest_points_on_polyline,
+        measures against the chords, which cut the corners the roads take between nodes.
+        """
+        G = self.get_search_graph(avoid_tolls)
+        (source, target), _ = self.snap_indexes[avoid_tolls].nearest(np.array([start_lon, end_lon]), np.array([start_lat, end_lat]))
+        paths = get_diverse_paths(G, int(source), int(target), k)
+
+        route_graphs, polylines, route_node_mappings = [], [], []
+        for path in paths:
+            # Path positions are the polyline indices of the chord polyline below
+            route_nodes = {i: node for i, node in enumerate(path)}
+            route_graphs.append(self.route_builder.build_route_graph(route_nodes, G))
+            polylines.append(Polyline(G.get_coords(path)[:, ::-1]))
+            route_node_mappings.append(route_nodes)
+
+        logger.info(f'Found {len(paths)} of {k} local alternatives')
+        for i, path in enumerate(paths):
+            logger.info(f'\tAlternative {i + 1}: {len(path)} nodes, {get_path_cost(G, path) / 60:.1f} min free-flow')
+        return route_graphs, polylines, route_node_mappings
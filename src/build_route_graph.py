@@ -2,39 +2,82 @@ from dotenv import load_dotenv
 import os
 import osmnx as ox
 import networkx as nx
-import requests
-from typing import List, Tuple, Dict, Set
-import flexpolyline as fpl
+from typing import Dict
 import numpy as np
-from datetime import datetime, timezone
-import json
-
-from src.helpers.get_and_manipulate_graph import get_subgraph_copy, simplify_node_chain
+from datetime import datetime
+import time
+
+from src.helpers.polyline import Polyline
+from src.helpers.csr_graph import CSRGraph
+from src.helpers.graphml_loader import load_graphml_columns
+from src.helpers.routing_client import RoutingClient, get_routing_client, format_departure_time
+from src.helpers.spatial_index import EdgeSpatialIndex, NodeSpatialIndex
+from src.helpers.map_matching import MapMatcher
+from src.helpers.interchange_connectors import ConnectorIndex, build_routing_graph
+from src.helpers.graph_pyramid import GraphPyramid, GraphLevel
+from src.helpers.route_graph_cache import RouteGraphCache, CachedRouteGraphs
+from src.query_context import QueryContext
 
 from src.utils.timer import Timer
 from src.utils.setup_logger import get_logger
 from src.utils.get_directories import INTERMEDIATE_RESULTS_DIR
-from src.utils.constants import GRAPH_TO_PLINE_MAPPING_DIST
+from src.utils.constants import MAP_MATCH_MIN_TOLL_RUN
 logger = get_logger()
 
+# Options that shape the fetched routes, and therefore the cached route graphs
+ROUTING_OPTIONS = {
+    "transportMode": "car",
+    "return": "polyline,tolls,summary,actions",
+    "routingMode": "fast",
+}
+
 class RouteGraphBuilder:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        routing_client: RoutingClient | None = None,
+        use_pyramid: bool = True,
+        connector_index: ConnectorIndex | None = None
+    ) -> None:
         load_dotenv()
         self.here_api_key = os.getenv('HERE_API_KEY')
+        self.routing_client = routing_client or get_routing_client()
 
         with Timer('Loading graphs', 'Loaded graphs'):
-            self.full_toll_graph = ox.load_graphml(INTERMEDIATE_RESULTS_DIR / 'full_toll_graph.graphml')
-            self.toll_graph = ox.load_graphml(INTERMEDIATE_RESULTS_DIR / 'simplified_toll_graph.graphml')
-            self.major_ints_graph = ox.load_graphml(INTERMEDIATE_RESULTS_DIR / 'major_intersections_simplified.graphml')
-
-        self.combined_graph = nx.MultiDiGraph(nx.compose(self.major_ints_graph, self.toll_graph))
-        assert isinstance(self.combined_graph, nx.MultiDiGraph)
-        toll_graph_sw_to_ne, toll_graph_ne_to_sw = self.get_graph_directional_components(self.toll_graph)
-        self.toll_graph_sw_to_ne, self.toll_graph_ne_to_sw = (
-            get_subgraph_copy(self.toll_graph, toll_graph_sw_to_ne),
-            get_subgraph_copy(self.toll_graph, toll_graph_ne_to_sw)
-        )
-
+            # Base graphs are shared by every query, so they are kept as read-only arrays
+            self.full_toll_graph = CSRGraph.from_graph(load_graphml_columns(INTERMEDIATE_RESULTS_DIR / 'full_toll_graph.graphml'))
+            self.toll_graph = CSRGraph.from_graph(load_graphml_columns(INTERMEDIATE_RESULTS_DIR / 'simplified_toll_graph.graphml'))
+            self.major_ints_graph = CSRGraph.from_graph(load_graphml_columns(INTERMEDIATE_RESULTS_DIR / 'major_intersections_simplified.graphml'))
+
+        self.combined_graph = self.major_ints_graph.compose(self.toll_graph)
+        self.routing_graph = build_routing_graph(self.major_ints_graph, self.toll_graph, connector_index or ConnectorIndex.load())
+
+        self.route_graph_cache = RouteGraphCache(NodeSpatialIndex(self.combined_graph))
+        # Tells toll routes' points on the toll road apart, see match_toll_route
+        self.full_toll_index = EdgeSpatialIndex(self.full_toll_graph)
+        self.route_matcher = MapMatcher(self.routing_graph, split_toll=True)
+        self.major_ints_matcher = MapMatcher(self.major_ints_graph)
+
+        # Queries pick a pyramid level by route length; without a pyramid they use the base graphs
+        self.pyramid = None
+        if use_pyramid and GraphPyramid.exists():
+            with Timer('Loading graph pyramid', 'Loaded graph pyramid'):
+                self.pyramid = GraphPyramid.load()
+
+    def __getstate__(self):
+        # Snapshot only the derived base state; the API key, HTTP client and cached queries are per process
+        state = self.__dict__.copy()
+        state['snap_index'] = self.route_graph_cache.snap_index
+        for key in ['here_api_key', 'routing_client', 'route_graph_cache']:
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        snap_index = state.pop('snap_index')
+        self.__dict__.update(state)
+        load_dotenv()
+        self.here_api_key = os.getenv('HERE_API_KEY')
+        self.routing_client = get_routing_client()
+        self.route_graph_cache = RouteGraphCache(snap_index)
 
     def get_full_route_graph(
         self,
@@ -43,131 +86,134 @@ class RouteGraphBuilder:
         end_lat: float,
         end_lon: float
     ):
-        # Step 1: fetch routes:
-        origin = f'{start_lat},{start_lon}'
-        destination = f'{end_lat},{end_lon}'
-        departure_time = datetime.now(timezone.utc).isoformat()
+        # No level is returned, so stay on the base graphs the base connectors and mappings refer to
+        context = self.build_query_context(start_lat, start_lon, end_lat, end_lon, use_pyramid=False)
+        return context.route_graphs, context.polylines, context.route_node_mappings
 
-        url = "https://router.hereapi.com/v8/routes"
+    def build_query_context(
+        self,
+        start_lat: float,
+        start_lon: float,
+        end_lat: float,
+        end_lon: float,
+        departure_time: datetime | None = None,
+        use_pyramid: bool = True
+    ) -> QueryContext:
+        context = QueryContext((start_lat, start_lon), (end_lat, end_lon))
+        if departure_time is not None:
+            context.departure_time = departure_time
+
+        cache_key = self.route_graph_cache.get_key(context.origin, context.destination, {**ROUTING_OPTIONS, 'use_pyramid': use_pyramid})
+        cached = self.route_graph_cache.get(cache_key)
+        if cached is not None:
+            context.route_graphs = list(cached.route_graphs)
+            context.polylines = list(cached.polylines)
+            context.route_node_mappings = list(cached.route_node_mappings)
+            context.level = cached.level
+            self.route_graph_cache.log_stats()
+            return context
+
+        start_time = time.time()
+        toll_routes, routes = self.fetch_routes(context)
+        self.build_route_graphs(context, toll_routes, routes, use_pyramid)
+        self.route_graph_cache.put(cache_key, CachedRouteGraphs(
+            list(context.route_graphs),
+            list(context.polylines),
+            list(context.route_node_mappings),
+            time.time() - start_time,
+            context.level
+        ))
+        self.route_graph_cache.log_stats()
+        return context
+
+    def fetch_routes(self, context: QueryContext):
         params = {
-            "transportMode": "car",
-            "origin": origin,
-            "destination": destination,
+            **ROUTING_OPTIONS,
+            "origin": context.origin_str,
+            "destination": context.destination_str,
             # "alternatives": 2,
-            "return": "polyline,tolls,summary,actions",
-            "routingMode": "fast",
-            "departureTime": departure_time,
+            "departureTime": format_departure_time(context.departure_time),
             "apiKey": self.here_api_key
         }
-        r = requests.get(url, params=params)
-        r.raise_for_status()
-        toll_routes = r.json()['routes']
+        toll_routes = self.routing_client.get_routes(params)['routes']
         assert len(toll_routes) == 1
 
         params['alternatives'] = 1
         params['avoid[features]'] = 'tollRoad'
-        r = requests.get(url, params=params)
-        r.raise_for_status()
-        routes = r.json()['routes']
+        routes = self.routing_client.get_routes(params)['routes']
 
         logger.info(f'Found {len(routes)} routes')
-        route_graphs: List[nx.MultiDiGraph] = []
-        polylines: List[List[Tuple]] = []
-        p2b_mappings = []
+        return toll_routes, routes
+
+    def get_level(self, level_index: int | None) -> GraphLevel | None:
+        return None if level_index is None else self.pyramid.levels[level_index]
+
+    def choose_level(self, polyline: Polyline) -> GraphLevel | None:
+        """Coarsest pyramid level detailed enough for a route along `polyline`, None without a pyramid."""
+        if self.pyramid is None:
+            return None
+        route_length = polyline.to_projected_linestring().length
+        level = self.pyramid.choose_level(route_length)
+        logger.info(f'\tUsing graph pyramid level {level.index} ({level.simplification_dist} m) for a {route_length / 1000:.1f} km route')
+        return level
+
+    def build_route_graphs(self, context: QueryContext, toll_routes, routes, use_pyramid: bool = True):
+        level = self.choose_level(Polyline.from_flexpolyline(toll_routes[0]['sections'][0]['polyline'])) if use_pyramid else None
+        context.level = None if level is None else level.index
+        # Pyramid levels carry the same graphs and matchers as the builder's base graphs
+        graphs = self if level is None else level
 
         for i, route in enumerate(toll_routes):
-            polyline_str = route['sections'][0]['polyline']
-            decoded = fpl.decode(polyline_str)  # returns list of (lat, lon[, z])
-            latlon = [(lat, lon) for lat, lon, *_ in decoded]
-            polylines.append(latlon)
+            polyline = Polyline.from_flexpolyline(route['sections'][0]['polyline'])
+            context.polylines.append(polyline)
 
-            self.toll_graph = self.choose_directional_graph_from_polyline(latlon, self.toll_graph_sw_to_ne, self.toll_graph_ne_to_sw)
-            toll_nodes = self.get_route_nodes(latlon, self.toll_graph, GRAPH_TO_PLINE_MAPPING_DIST)
-            p2b_mappings.append(toll_nodes)
-            # route_nodes = self.get_route_nodes(latlon, self.major_ints_graph, 50)
-            route_nodes = {} # Excluding non-toll nodes for now because some are too close to toll nodes
-            route_graph = self.build_route_graph(route_nodes | toll_nodes, self.combined_graph)
+            route_nodes = self.match_toll_route(polyline, level)
+            context.route_node_mappings.append(route_nodes)
+            route_graph = self.build_route_graph(route_nodes, graphs.routing_graph)
 
-            route_graphs.append(route_graph)
+            context.route_graphs.append(route_graph)
 
         for i, route in enumerate(routes):
-            polyline_str = route['sections'][0]['polyline']
-            decoded = fpl.decode(polyline_str)  # returns list of (lat, lon[, z])
-            latlon = [(lat, lon) for lat, lon, *_ in decoded]
-            polylines.append(latlon)
+            polyline = Polyline.from_flexpolyline(route['sections'][0]['polyline'])
+            context.polylines.append(polyline)
 
-            route_nodes = self.get_route_nodes(latlon, self.major_ints_graph, GRAPH_TO_PLINE_MAPPING_DIST)
+            # The intersection graph is already simplified (per pyramid level), so every matched node is kept
+            _, route_nodes = graphs.major_ints_matcher.match(polyline)
             logger.info(f'mapped {len(route_nodes)} nodes')
+            context.route_node_mappings.append(route_nodes)
 
-            in_order_node_ids = [item[1] for item in sorted(route_nodes.items(), key=lambda item: item[0])]
-            nodes_to_keep, _ = simplify_node_chain(in_order_node_ids, self.major_ints_graph)
-            nodes_to_keep_set = set(nodes_to_keep)
-            nodes_to_keep = {item[0]: item[1] for item in route_nodes.items() if item[1] in nodes_to_keep_set}
-            p2b_mappings.append(nodes_to_keep)
-            logger.info(f'simplified chain to {len(nodes_to_keep)} nodes')
-
-            route_graph = self.build_route_graph(nodes_to_keep, self.major_ints_graph)
-            route_graphs.append(route_graph)
+            route_graph = self.build_route_graph(route_nodes, graphs.major_ints_graph)
+            context.route_graphs.append(route_graph)
 
-        with Timer('Saving Route Node Mapping', 'Saved Route Node Mapping'):
-            with open(INTERMEDIATE_RESULTS_DIR / 'route_node_mappings.json', 'w', encoding='utf-8') as f:
-                json.dump(p2b_mappings, f, indent=2)
-
-
-        for i, route_graph in enumerate(route_graphs):
-            logger.info(f'Graph {i + 1}: {len(route_graphs[i].nodes)}')
+        for i, route_graph in enumerate(context.route_graphs):
+            logger.info(f'Graph {i + 1}: {len(route_graph.nodes)}')
             logger.info(list(route_graph.nodes))
-            
-        return route_graphs, polylines
-
-    def get_route_nodes(self, polyline_coords: List[Tuple], base_graph: nx.MultiDiGraph, max_dist):
-
-        # Extract coordinate arrays
-        lats, lons = zip(*polyline_coords)
-        # Find nearest nodes and distances (vectorized)
-        nearest_nodes, distances = ox.distance.nearest_nodes(
-            base_graph, lons, lats, return_dist=True
-        )
-        # Make sure there is only one closest node id per point
-        for nearest_node in nearest_nodes:
-            if not isinstance(nearest_node, np.integer):
-                assert False, f'{nearest_node} {type(nearest_node)}'
-        assert len(nearest_nodes) == len(polyline_coords)
-        assert len(distances) == len(polyline_coords)
-
-        node_to_nearest_point = {}
-        for point_idx, (node_id, dist) in enumerate(zip(nearest_nodes, distances)):
-            if node_id not in node_to_nearest_point:
-                node_to_nearest_point[node_id] = (point_idx, dist)
-                continue
-            if dist < node_to_nearest_point[node_id][1]:
-                node_to_nearest_point[node_id] = (point_idx, dist)
-
-        # Accumulate best (min-distance) mapping per node
-        best_map: Dict[int, Tuple[np.float64, int]] = {}
-        for point_idx, (node_id, dist) in enumerate(zip(nearest_nodes, distances)):
-            if dist <= max_dist:
-                node_id = int(node_id)
-                assert isinstance(dist, np.float64)
-                prev = best_map.get(node_id)
-                if prev is None or dist < prev[0]:
-                    best_map[node_id] = (dist, point_idx)
-
-        # Sort selected nodes by their order along the polyline
-        selected = sorted(best_map.items(), key=lambda item: item[1][1])
-        if not selected:
-            assert False # No valid points found
-
-        # NOTE: Code to set graph node x, y values to closest polyline point
-        # Leave commented
-        # for node_id in best_map:
-        #     node = base_graph.nodes[node_id]
-        #     pline_idx = best_map[node_id][1]
-        #     node['x'], node['y'] = lons[pline_idx], lats[pline_idx]
-        
-        return {item[1]: node_id for node_id, item in selected}
 
-    def build_route_graph(self, route_nodes: Dict[int, int], graph: nx.MultiDiGraph):
+    def match_toll_route(self, polyline: Polyline, level: GraphLevel | None = None) -> Dict[int, int]:
+        """
+        {polyline_idx: node_id} of a toll route matched over the routing graph (of `level` if
+        given), so its non-toll ends are kept as well. The points between the first and the last
+        run along the toll road may only match toll nodes, so the match stays on the toll road
+        (whose simplified nodes are far apart) rather than on arterials running next to it, and
+        leaves it through the connectors. Directed transitions keep it on the right carriageway.
+        """
+        graphs = self if level is None else level
+        xy = polyline.project()
+        distance_along = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(xy, axis=0).T))])
+        near = self.full_toll_index.within_projected(xy[:, 0], xy[:, 1], graphs.route_matcher.radius)
+        # Runs of consecutive points near the toll road; short ones cross it rather than travel along it
+        bounds = np.flatnonzero(np.diff(np.concatenate([[0], near.astype(np.int8), [0]])))
+        starts, ends = bounds[::2], bounds[1::2] - 1
+        runs = distance_along[ends] - distance_along[starts] >= MAP_MATCH_MIN_TOLL_RUN
+        # Points within radius of the stretch's ends may still be on the interchange, so they match any node
+        on_toll = np.zeros(len(polyline), dtype=bool)
+        if runs.any():
+            stretch = distance_along[[starts[runs][0], ends[runs][-1]]] + np.array([1, -1]) * graphs.route_matcher.radius
+            on_toll[(distance_along >= stretch[0]) & (distance_along <= stretch[1])] = True
+        _, route_nodes = graphs.route_matcher.match(polyline, on_toll)
+        return route_nodes
+
+    def build_route_graph(self, route_nodes: Dict[int, int], graph: CSRGraph):
         G_sub = nx.MultiDiGraph()
         G_sub.graph.update(graph.graph)
 
@@ -175,7 +221,7 @@ class RouteGraphBuilder:
         for pline_idx in sorted(route_nodes.keys()):
             node_id = route_nodes[pline_idx]
             # Copy node attributes from the base graph
-            G_sub.add_node(pline_idx, **graph.nodes[node_id])
+            G_sub.add_node(pline_idx, **graph.nodes[node_id], base_node_id=node_id)
             if prev_node is not None:
                 # Add directed edge
                 G_sub.add_edge(
@@ -190,44 +236,3 @@ class RouteGraphBuilder:
             prev_node = pline_idx
         
         return G_sub
-
-    def get_graph_directional_components(self, graph: nx.MultiDiGraph):
-        components = nx.weakly_connected_components(graph)
-        sw_to_ne_comp, ne_to_sw_comp = None, None
-        for component in components:
-            starting_nodes = [
-                node for node in component
-                if graph.in_degree(node) == 0 and graph.out_degree(node) == 1
-            ]
-            assert len(starting_nodes) == 1, len(starting_nodes)
-            ending_nodes = [
-                node for node in component
-                if graph.in_degree(node) == 1 and graph.out_degree(node) == 0
-            ]
-            assert len(ending_nodes) == 1
-
-            start_node, end_node = starting_nodes[0], ending_nodes[0]
-            if graph.nodes[start_node]['y'] < graph.nodes[end_node]['y'] and graph.nodes[start_node]['x'] < graph.nodes[end_node]['x']:
-                sw_to_ne_comp = component
-            elif graph.nodes[start_node]['y'] > graph.nodes[end_node]['y'] and graph.nodes[start_node]['x'] > graph.nodes[end_node]['x']:
-                ne_to_sw_comp = component
-            else:
-                assert False
-
-        assert sw_to_ne_comp is not None and ne_to_sw_comp is not None
-
-        return sw_to_ne_comp, ne_to_sw_comp    
-    
-    def choose_directional_graph_from_polyline(
-            self,
-            polyline: List[Tuple],
-            sw_to_ne_graph: nx.MultiDiGraph,
-            ne_to_sw_graph: nx.MultiDiGraph
-        ):
-        (lat1, lon1), (lat2, lon2) = polyline[0], polyline[-1]
-        if (lat2 > lat1 and lon2 > lon1):
-            return sw_to_ne_graph
-        elif (lat2 < lat1 and lon2 < lon1):
-            return ne_to_sw_graph
-        assert False
-    
\ No newline at end of file
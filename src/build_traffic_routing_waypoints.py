@@ -1,13 +1,18 @@
 import networkx as nx
-from typing import List, Tuple
-import osmnx as ox
-import json
+from typing import List, Dict
 import shapely
-from shapely.geometry import LineString, Point
-from shapely.ops import nearest_points
+
+from src.helpers.polyline import Polyline
+from src.helpers.csr_graph import CSRGraph
+from src.helpers.node_mapping import NodeMapping
+from src.helpers.graphml_loader import load_graphml_columns
+from src.helpers.graph_pyramid import GraphPyramid, load_intersection_mappings
+from src.helpers.via_selection import ViaSelector
 
 from src.utils.timer import Timer
+from src.utils.projection import get_node_coords, unproject_coords
 from src.utils.get_directories import INTERMEDIATE_RESULTS_DIR
+from src.utils.constants import POLYLINE_SIMPLIFICATION_TOLERANCE
 from src.utils.setup_logger import get_logger
 logger = get_logger()
 
@@ -15,79 +20,77 @@ logger = get_logger()
 class TrafficWaypointsBuilder:
     def __init__(self) -> None:
         with Timer('Getting intersection simplification mapping', 'Got intersection simplification mapping'):
-            with open(INTERMEDIATE_RESULTS_DIR / 'intersection_simplification_mapping.json', 'r', encoding='utf-8') as f:
-                int_simp_mapping = json.load(f)
-                self.int_simp_mapping = {int(key): value for key, value in int_simp_mapping.items()}
+            self.int_simp_mapping = NodeMapping.load(INTERMEDIATE_RESULTS_DIR / 'intersection_simplification_mapping.npz')
+            # Same mapping for each graph pyramid level's intersections
+            self.level_int_simp_mappings = load_intersection_mappings() if GraphPyramid.exists() else []
 
         with Timer('Loading graphs', 'Loaded graphs'):
-            self.major_ints_graph = ox.load_graphml(INTERMEDIATE_RESULTS_DIR / 'major_intersections.graphml')
+            self.major_ints_graph = CSRGraph.from_graph(load_graphml_columns(INTERMEDIATE_RESULTS_DIR / 'major_intersections.graphml'))
 
-    def get_closest_point_on_polyline(self, G: nx.MultiDiGraph, node_id: int, polyline_coords: List[Tuple[float, float]]):
+    def get_closest_points_on_polyline(
+        self,
+        G: CSRGraph,
+        node_ids: List[int],
+        polyline: Polyline,
+        tolerance: float | None = POLYLINE_SIMPLIFICATION_TOLERANCE
+    ):
         """
-        Finds the closest point on a polyline to a graph node.
-        Assumes input polyline_coords are in (Lat, Lon) format (e.g. HERE API).
+        Finds the closest point on a polyline to each of the given graph nodes.
+        All work is done in the region's projected CRS (metres) in bulk, against the
+        polyline simplified to within `tolerance` metres (the full polyline if None).
+        Locally built alternatives' polylines are chord lines between their nodes (see
+        LocalAlternativesBuilder.build_alternatives), so distances are to those chords.
         """
-        # 1. Create Lat/Lon Geometries
-        node = G.nodes[node_id]
-        
-        # Node is already x=Lon, y=Lat
-        node_point = Point(node['x'], node['y']) 
-        
-        # FIX: Swap input [(Lat, Lon), ...] to [(Lon, Lat), ...] for Shapely
-        polyline_lon_lat = [(lon, lat) for lat, lon in polyline_coords]
-        line_geom = LineString(polyline_lon_lat)
-        
-        # 2. Project both to UTM (Meters)
-        # ox.projection automatically picks the correct local UTM zone (e.g. Zone 17T for Toronto)
-        point_proj, crs = ox.projection.project_geometry(node_point)
-        line_proj, _    = ox.projection.project_geometry(line_geom, to_crs=crs)
-        
-        # 3. Find the closest point in projected space (Meters)
-        # nearest_points returns tuple (closest_on_geom1, closest_on_geom2)
-        closest_point_proj = nearest_points(line_proj, point_proj)[0]
-        
-        # 4. Calculate exact distance in meters
-        # We use shapely.distance(a, b) to avoid IDE type-check errors on the .distance() method
-        dist_meters = shapely.distance(point_proj, closest_point_proj)
-        
-        # 5. Project the closest point back to Lat/Lon
-        closest_point_latlon, _ = ox.projection.project_geometry(
-            closest_point_proj, 
-            crs=crs, 
-            to_latlong=True
-        )
-        
+        node_points = shapely.points(get_node_coords(G, node_ids, projected=True))
+        line_proj = (polyline if tolerance is None else polyline.simplify(tolerance)).to_projected_linestring()
+
+        # Distance along the line of each node's projection, then the point at that distance
+        closest_points_proj = shapely.line_interpolate_point(line_proj, shapely.line_locate_point(line_proj, node_points))
+        dists_meters = shapely.distance(node_points, closest_points_proj)
+
+        closest_coords = shapely.get_coordinates(closest_points_proj)
+        closest_lons, closest_lats = unproject_coords(closest_coords[:, 0], closest_coords[:, 1])
+
         # Return format: Lon (x), Lat (y), Distance (m)
-        return closest_point_latlon.x, closest_point_latlon.y, dist_meters # type: ignore
+        return closest_lons, closest_lats, dists_meters
+
+    def get_closest_point_on_polyline(self, G: CSRGraph, node_id: int, polyline: Polyline):
+        closest_lons, closest_lats, dists_meters = self.get_closest_points_on_polyline(G, [node_id], polyline)
+        return float(closest_lons[0]), float(closest_lats[0]), float(dists_meters[0])
     
-    def get_closest_original_node_to_polyline(self, route_graph: nx.MultiDiGraph, node_id: int, polyline: List[Tuple], route_graph_idx, route_node_mappings):
-        # Loop through simp_to_nonsimp_map[node_id]
-        distances = []
+    def get_closest_original_node_to_polyline(
+        self,
+        route_graph: nx.MultiDiGraph,
+        node_id: int,
+        polyline: Polyline,
+        route_graph_idx,
+        route_node_mappings: List[Dict[int, int]],
+        int_simp_mapping: NodeMapping | None = None
+    ):
         assert node_id in route_node_mappings[route_graph_idx], route_graph_idx
         node_oxid = route_node_mappings[route_graph_idx][node_id]
+        original_node_ids = (int_simp_mapping or self.int_simp_mapping)[node_oxid]
 
-        logger.debug(f'start for {node_oxid}\n')
-        for original_node_id in self.int_simp_mapping[node_oxid]:
-            new_x, new_y = route_graph.nodes[node_id]['x'], route_graph.nodes[node_id]['y']
-            old_x, old_y = self.major_ints_graph.nodes[original_node_id]['x'], self.major_ints_graph.nodes[original_node_id]['y']
-            
-            logger.debug((node_oxid, new_x, new_y))
-            logger.debug((original_node_id, old_x, old_y))
-            logger.debug(ox.distance.great_circle(new_y, new_x, old_y, old_x))
-            logger.debug('')
-
-            closest_x, closest_y, dist = self.get_closest_point_on_polyline(self.major_ints_graph, original_node_id, polyline)
-            distances.append((closest_x, closest_y, dist, self.major_ints_graph.nodes[original_node_id]['x'], self.major_ints_graph.nodes[original_node_id]['y']))
+        logger.debug(f'start for {node_oxid}: {len(original_node_ids)} original nodes\n')
+        closest_lons, closest_lats, dists = self.get_closest_points_on_polyline(self.major_ints_graph, original_node_ids, polyline)
+        best = int(dists.argmin())
+        best_node = self.major_ints_graph.nodes[original_node_ids[best]]
 
-        return min(distances, key=lambda dist: dist[2])
+        return float(closest_lons[best]), float(closest_lats[best]), float(dists[best]), best_node['x'], best_node['y']
     
-    def build_waypoints(self, route_graphs: List[nx.MultiDiGraph], route_polylines: List[List[Tuple]]):
-        with Timer('Getting Route Node Mapping', 'Getting Route Node Mapping'):
-            with open(INTERMEDIATE_RESULTS_DIR / 'route_node_mappings.json', 'r', encoding='utf-8') as f:
-                route_node_mappings = json.load(f)
-
-        route_node_mappings = [{int(p_id): ox_id for p_id, ox_id in route_map.items()} for route_map in route_node_mappings]
-
+    def build_waypoints(
+        self,
+        route_graphs: List[nx.MultiDiGraph],
+        route_polylines: List[Polyline],
+        route_node_mappings: List[Dict[int, int]],
+        via_selector: ViaSelector | None = None,
+        level: int | None = None
+    ):
+        """
+        One via per route graph node, reduced to the route's decision points when a via_selector
+        is given. `level` is the graph pyramid level the route graphs were built from, if any.
+        """
+        int_simp_mapping = self.int_simp_mapping if level is None else self.level_int_simp_mappings[level]
         logger.debug(f'*************{len(route_graphs)}')
         logger.debug(f'*************{len(route_polylines)}')
         all_waypoints = []
@@ -98,7 +101,7 @@ class TrafficWaypointsBuilder:
             dfs_nodes = nx.dfs_preorder_nodes(route_graph, start_node)
             waypoints = []
             for node in dfs_nodes:
-                if i == 0: # toll graph
+                if i == 0 and route_graph.nodes[node]['tag'] == 'toll_route': # toll graph
                     # TODO: the inaccurate waypoints still occurs in this scenario
                     # due to the graph simplification. Fix?
                     waypoints.append(f'{route_graph.nodes[node]['y']},{route_graph.nodes[node]['x']}')
@@ -108,7 +111,9 @@ class TrafficWaypointsBuilder:
                     # reversed_id_map = {value: key for key, value in id_maps[i].items()}
                     # og_node_id = reversed_id_map[node]
 
-                    closest_x, closest_y, dist, node_x, node_y = self.get_closest_original_node_to_polyline(route_graph, node, route_polylines[i], i, route_node_mappings)
+                    closest_x, closest_y, dist, node_x, node_y = self.get_closest_original_node_to_polyline(
+                        route_graph, node, route_polylines[i], i, route_node_mappings, int_simp_mapping
+                    )
                     
                     logger.debug(f'results for node {node}, route_idx {i}')
                     logger.debug((route_graph.nodes[node]['x'], route_graph.nodes[node]['y']))
@@ -116,7 +121,9 @@ class TrafficWaypointsBuilder:
                     logger.debug((closest_x, closest_y, dist))
                     logger.debug('')
                     waypoints.append(f'{closest_y},{closest_x}')
-            
+
+            if via_selector is not None:
+                waypoints = via_selector.select_vias(waypoints, route_polylines[i])
             all_waypoints.append(waypoints)
 
         return all_waypoints
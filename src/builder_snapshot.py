@@ -0,0 +1,109 @@
+import os
+import pickle
+import numpy as np
+from pathlib import Path
+from typing import Dict, Tuple
+
+from src.build_route_graph import RouteGraphBuilder
+from src.build_traffic_routing_waypoints import TrafficWaypointsBuilder
+from src.helpers.interchange_connectors import ConnectorIndex, CONNECTORS_FILE_NAME
+from src.helpers.graph_pyramid import PYRAMID_DIR, LEVELS_FILE_NAME
+
+from src.utils.timer import Timer
+from src.utils.get_directories import INTERMEDIATE_RESULTS_DIR
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+SNAPSHOT_DIR = INTERMEDIATE_RESULTS_DIR / 'builder_snapshot'
+STATE_FILE_NAME = 'state.pkl'
+# Arrays at least this large are written as separate .npy files and memory-mapped on load
+MIN_MMAP_BYTES = 64 * 1024
+# Intermediate results the builders are initialized from
+SOURCE_FILE_NAMES = [
+    'full_toll_graph.graphml',
+    'simplified_toll_graph.graphml',
+    'major_intersections_simplified.graphml',
+    'major_intersections.graphml',
+    'intersection_simplification_mapping.npz',
+    CONNECTORS_FILE_NAME,
+    f'{PYRAMID_DIR.name}/{LEVELS_FILE_NAME}'
+]
+
+
+class SnapshotPickler(pickle.Pickler):
+    def __init__(self, file, snapshot_dir: Path) -> None:
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.snapshot_dir = snapshot_dir
+        self.file_names: Dict[int, str] = {}
+        # Keeps every saved array alive, so ids are not reused while pickling
+        self.arrays = []
+
+    def persistent_id(self, obj):
+        if type(obj) is not np.ndarray or obj.dtype.hasobject or obj.nbytes < MIN_MMAP_BYTES:
+            return None
+        # Arrays referenced from several places (e.g. a graph's node ids and its spatial index) are saved once
+        if id(obj) not in self.file_names:
+            self.file_names[id(obj)] = f'array_{len(self.file_names)}.npy'
+            self.arrays.append(obj)
+            np.save(self.snapshot_dir / self.file_names[id(obj)], obj)
+        return self.file_names[id(obj)]
+
+
+class SnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, file, snapshot_dir: Path) -> None:
+        super().__init__(file)
+        self.snapshot_dir = snapshot_dir
+        self.arrays: Dict[str, np.ndarray] = {}
+
+    def persistent_load(self, pid):
+        if pid not in self.arrays:
+            self.arrays[pid] = np.load(self.snapshot_dir / pid, mmap_mode='r')
+        return self.arrays[pid]
+
+
+def save_builder_snapshot(
+    route_builder: RouteGraphBuilder | None = None,
+    waypoints_builder: TrafficWaypointsBuilder | None = None,
+    connector_index: ConnectorIndex | None = None,
+    snapshot_dir: Path = SNAPSHOT_DIR
+):
+    """
+    Persist the fully initialized builders: derived graphs, spatial index and node mappings.
+    Large numpy arrays, which include every base graph (see CSRGraph), go to their own .npy
+    files so restoring memory-maps them instead of rebuilding the graphs.
+    """
+    route_builder = route_builder or RouteGraphBuilder()
+    waypoints_builder = waypoints_builder or TrafficWaypointsBuilder()
+    connector_index = connector_index or ConnectorIndex.load()
+
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    for old_file in snapshot_dir.glob('array_*.npy'):
+        old_file.unlink()
+    with Timer('Saving builder snapshot', 'Saved builder snapshot'):
+        with open(snapshot_dir / STATE_FILE_NAME, 'wb') as f:
+            pickler = SnapshotPickler(f, snapshot_dir)
+            pickler.dump((route_builder, waypoints_builder, connector_index))
+    logger.info(f'\tBuilder snapshot: {len(pickler.file_names)} memory-mapped arrays')
+
+def load_builder_snapshot(snapshot_dir: Path = SNAPSHOT_DIR) -> Tuple[RouteGraphBuilder, TrafficWaypointsBuilder, ConnectorIndex]:
+    with Timer('Restoring builder snapshot', 'Restored builder snapshot'):
+        with open(snapshot_dir / STATE_FILE_NAME, 'rb') as f:
+            return SnapshotUnpickler(f, snapshot_dir).load()
+
+def is_snapshot_fresh(snapshot_dir: Path = SNAPSHOT_DIR) -> bool:
+    """Whether the snapshot exists and is newer than every intermediate result it was built from."""
+    state_path = snapshot_dir / STATE_FILE_NAME
+    if not state_path.exists():
+        return False
+    snapshot_time = os.path.getmtime(state_path)
+    return all(
+        os.path.getmtime(INTERMEDIATE_RESULTS_DIR / file_name) <= snapshot_time
+        for file_name in SOURCE_FILE_NAMES if (INTERMEDIATE_RESULTS_DIR / file_name).exists()
+    )
+
+def get_builders(snapshot_dir: Path = SNAPSHOT_DIR) -> Tuple[RouteGraphBuilder, TrafficWaypointsBuilder, ConnectorIndex]:
+    """Restore the builders from a fresh snapshot if there is one, otherwise initialize them from the intermediate results."""
+    if is_snapshot_fresh(snapshot_dir):
+        return load_builder_snapshot(snapshot_dir)
+    logger.info('No fresh builder snapshot, initializing builders from intermediate results')
+    return RouteGraphBuilder(), TrafficWaypointsBuilder(), ConnectorIndex.load()
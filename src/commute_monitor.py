@@ -0,0 +1,107 @@
+import asyncio
+import random
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, List, Tuple
+
+from src.build_route_graph import RouteGraphBuilder
+from src.build_traffic_routing_waypoints import TrafficWaypointsBuilder
+from src.get_connecting_routes import get_batched_durations
+from src.helpers.routing_client import RoutingClient
+from src.helpers.via_selection import ViaSelector
+from src.query_context import QueryContext, get_toll_savings
+
+from src.utils.constants import MONITOR_INTERVAL_SECONDS, MONITOR_JITTER, MONITOR_SAVINGS_THRESHOLD_MIN
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+
+@dataclass
+class CommuteEvent:
+    time: datetime
+    # Traffic-aware duration (s) per route, toll route first
+    durations: List[float]
+    toll_savings: float
+    toll_worth_it: bool
+
+
+class CommuteMonitor:
+    """
+    Watches one commute over a departure window. Route graphs and waypoints are built
+    once; each poll only re-queries the traffic-aware durations of the routes, batched
+    into matrix requests by get_batched_durations (so no traffic polylines). An event is
+    emitted on the first poll and whenever the toll route's savings cross `threshold_min`.
+    """
+    def __init__(
+        self,
+        context: QueryContext,
+        threshold_min: float = MONITOR_SAVINGS_THRESHOLD_MIN,
+        interval: float = MONITOR_INTERVAL_SECONDS,
+        jitter: float = MONITOR_JITTER,
+        routing_client: RoutingClient | None = None,
+        on_event: Callable[[CommuteEvent], None] | None = None
+    ) -> None:
+        assert context.waypoints, 'Build the query waypoints before monitoring'
+        self.context = context
+        self.threshold_min = threshold_min
+        self.interval = interval
+        self.jitter = jitter
+        self.routing_client = routing_client
+        self.on_event = on_event
+        self.events: List[CommuteEvent] = []
+        self.toll_worth_it: bool | None = None
+
+    @classmethod
+    def for_commute(
+        cls,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float],
+        route_builder: RouteGraphBuilder | None = None,
+        waypoints_builder: TrafficWaypointsBuilder | None = None,
+        via_selector: ViaSelector | None = None,
+        **monitor_kwargs
+    ):
+        route_builder = route_builder or RouteGraphBuilder()
+        waypoints_builder = waypoints_builder or TrafficWaypointsBuilder()
+        context = route_builder.build_query_context(origin[0], origin[1], destination[0], destination[1])
+        context.waypoints = waypoints_builder.build_waypoints(
+            context.route_graphs, context.polylines, context.route_node_mappings, via_selector, context.level
+        )
+        return cls(context, **monitor_kwargs)
+
+    async def poll(self) -> CommuteEvent | None:
+        departure_time = datetime.now(timezone.utc)
+        durations = await asyncio.to_thread(get_batched_durations, self.context.trips, departure_time, self.routing_client)
+        self.context.departure_time = departure_time
+        self.context.durations = durations.tolist()
+
+        toll_savings = get_toll_savings(self.context.durations)
+        toll_worth_it = toll_savings >= self.threshold_min
+        logger.info(f'{departure_time:%H:%M:%S}: toll route saves {toll_savings:.1f} min')
+        if toll_worth_it == self.toll_worth_it:
+            return None
+
+        self.toll_worth_it = toll_worth_it
+        event = CommuteEvent(departure_time, list(self.context.durations), toll_savings, toll_worth_it)
+        self.events.append(event)
+        logger.info(f'Toll route is {"now" if toll_worth_it else "no longer"} worth it: saves {toll_savings:.1f} min')
+        if self.on_event is not None:
+            self.on_event(event)
+        return event
+
+    def get_sleep_time(self) -> float:
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def run(self, until: datetime | None = None, max_polls: int | None = None) -> List[CommuteEvent]:
+        """Poll until `until` (UTC-aware) or `max_polls` polls, whichever comes first."""
+        polls = 0
+        while True:
+            await self.poll()
+            polls += 1
+            if max_polls is not None and polls >= max_polls:
+                break
+            sleep_time = self.get_sleep_time()
+            if until is not None and (until - datetime.now(timezone.utc)).total_seconds() <= sleep_time:
+                break
+            await asyncio.sleep(sleep_time)
+        return self.events
@@ -0,0 +1,86 @@
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from src.build_route_graph import RouteGraphBuilder
+from src.build_traffic_routing_waypoints import TrafficWaypointsBuilder
+from src.get_connecting_routes import get_batched_durations
+from src.helpers.routing_client import RoutingClient, get_routing_client
+from src.query_context import QueryContext, get_toll_savings
+
+from src.utils.timer import Timer
+from src.utils.constants import SWEEP_INTERVAL_MINUTES, SWEEP_MAX_WORKERS
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+
+def get_departure_times(start: datetime, end: datetime, interval: timedelta = timedelta(minutes=SWEEP_INTERVAL_MINUTES)) -> List[datetime]:
+    departure_times = []
+    departure_time = start
+    while departure_time <= end:
+        departure_times.append(departure_time)
+        departure_time += interval
+    return departure_times
+
+def sweep_departure_times(
+    context: QueryContext,
+    departure_times: List[datetime],
+    max_workers: int = SWEEP_MAX_WORKERS,
+    routing_client: RoutingClient | None = None
+) -> pd.DataFrame:
+    """
+    Evaluate every route graph of an already built query (route graphs and waypoints)
+    at each departure time. The routes of a departure time are evaluated together with
+    get_batched_durations; departure times run concurrently, rate limited by the shared
+    routing client.
+
+    Returns one row per departure time with the toll route's duration, the best
+    non-toll alternative's duration and how much the toll route saves (minutes).
+    """
+    assert context.waypoints, 'Build the query waypoints before sweeping'
+    routing_client = routing_client or get_routing_client()
+    trips = context.trips
+
+    def evaluate(departure_time: datetime) -> List[float]:
+        return get_batched_durations(trips, departure_time, routing_client).tolist()
+
+    with Timer(f'Sweeping {len(departure_times)} departure times', 'Swept departure times'):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            durations = list(executor.map(evaluate, departure_times))
+
+    rows = []
+    for departure_time, route_durations in zip(departure_times, durations):
+        rows.append({
+            'departure_time': departure_time,
+            'toll_duration_min': route_durations[0] / 60,
+            'best_non_toll_duration_min': min(route_durations[1:]) / 60 if len(route_durations) > 1 else float('nan'),
+            'toll_savings_min': get_toll_savings(route_durations)
+        })
+    return pd.DataFrame(rows)
+
+def run_departure_time_sweep(
+    origin: Tuple[float, float],
+    destination: Tuple[float, float],
+    departure_times: List[datetime],
+    route_builder: RouteGraphBuilder | None = None,
+    waypoints_builder: TrafficWaypointsBuilder | None = None,
+    **sweep_kwargs
+) -> pd.DataFrame:
+    """Build the route graphs and waypoints for one OD pair once, then sweep departure times."""
+    route_builder = route_builder or RouteGraphBuilder()
+    waypoints_builder = waypoints_builder or TrafficWaypointsBuilder()
+
+    context = route_builder.build_query_context(origin[0], origin[1], destination[0], destination[1], departure_times[0])
+    context.waypoints = waypoints_builder.build_waypoints(
+        context.route_graphs, context.polylines, context.route_node_mappings, level=context.level
+    )
+    table = sweep_departure_times(context, departure_times, **sweep_kwargs)
+
+    savings = table['toll_savings_min'].dropna()
+    if savings.empty:
+        logger.info('No non-toll alternative to compare the toll route with')
+    else:
+        best = table.loc[savings.idxmax()]
+        logger.info(f'Largest toll savings: {best["toll_savings_min"]:.1f} min leaving at {best["departure_time"]}')
+    return table
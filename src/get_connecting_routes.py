@@ -1,108 +1,182 @@
 import networkx as nx
-from typing import List, Tuple
-import osmnx as ox
+from typing import List, Dict
+import numpy as np
 import requests
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 import os
-import flexpolyline as fpl
+import time
+import shapely
+from concurrent.futures import ThreadPoolExecutor
 
 from src.build_traffic_routing_waypoints import TrafficWaypointsBuilder
+from src.helpers.polyline import Polyline
+from src.helpers.routing_client import RoutingClient, get_routing_client, format_departure_time
+from src.helpers.interchange_connectors import ConnectorIndex
+from src.helpers.matrix_routing import Trip, Leg, get_legs, plan_matrix_batches, request_matrix
 
+from src.utils.timer import Timer
+from src.utils.constants import MATRIX_FALLBACK_WORKERS
 from src.utils.setup_logger import get_logger
 logger = get_logger()
 
 load_dotenv()
 HERE_API_KEY = os.getenv('HERE_API_KEY')
-id_maps = []
-
-def relabel_nodes_in_dfs_order(route_graphs: List[nx.MultiDiGraph]):
-    for i, route_graph in enumerate(route_graphs):
-        start_nodes = [node for node in route_graph.nodes if route_graph.in_degree(node) == 0]
-        assert len(start_nodes) == 1
-        start_node = start_nodes[0]
-        dfs_nodes = nx.dfs_preorder_nodes(route_graph, start_node)
-        new_id_mapping = {old_node_id: (i * 10**6) + j for j, old_node_id in enumerate(dfs_nodes)}
-        id_maps.append(new_id_mapping)
-        route_graph.graph['my_id'] = f'G{i}'
-        nx.relabel_nodes(route_graph, new_id_mapping, copy=False)
-
-def get_connecting_routes(route_graphs: List[nx.MultiDiGraph]):
-    # relabel_nodes_in_dfs_order(route_graphs)
+ROUTE_GRAPH_ID_OFFSET = 10**6
+
+def get_unique_node_id(route_graph_idx: int, node: int) -> int:
+    return (route_graph_idx * ROUTE_GRAPH_ID_OFFSET) + node
+
+def get_connecting_routes(route_graphs: List[nx.MultiDiGraph], connector_index: ConnectorIndex):
+    """
+    Connect the toll route graph (route_graphs[0]) to the other route graphs using the
+    precomputed interchange connectors. Node ids are the unique ids used by build_connected_graph.
+    """
     toll_graph = route_graphs[0]
+    base_to_route_nodes = [
+        {data['base_node_id']: node for node, data in route_graph.nodes(data=True)}
+        for route_graph in route_graphs
+    ]
     connecting_routes = []
-    for toll_node in toll_graph.nodes:
-        for route_graph in route_graphs[1:]:
-            toll_node_x, toll_node_y = toll_graph.nodes[toll_node]['x'], toll_graph.nodes[toll_node]['y']
-            nearest_node = ox.distance.nearest_nodes(route_graph, X=toll_node_x, Y=toll_node_y, return_dist=False)
-            
-            nearest_node_x, nearest_node_y = route_graph.nodes[nearest_node]['x'], route_graph.nodes[nearest_node]['y']
-            if nearest_node in toll_graph.nodes or toll_node in route_graph.nodes:
-                assert nearest_node_x != toll_node_x and nearest_node_y != toll_node_y
-                # TODO: solve the conflicting ids issue?
-
-            # assert nearest_node not in toll_graph.nodes and toll_node not in route_graph.nodes # Ensure non-conflicting node ids for when they're merged
-            connecting_routes.append((nearest_node, toll_node))
-            connecting_routes.append((toll_node, nearest_node))
+    for toll_node, toll_data in toll_graph.nodes(data=True):
+        for connector in connector_index.get_connectors(toll_data['base_node_id']):
+            for i in range(1, len(route_graphs)):
+                route_node = base_to_route_nodes[i].get(connector['intersection_node'])
+                if route_node is None:
+                    continue
+                toll_id, route_id = get_unique_node_id(0, toll_node), get_unique_node_id(i, route_node)
+                u, v = (toll_id, route_id) if connector['kind'] == 'exit' else (route_id, toll_id)
+                connecting_routes.append((u, v, {'length': connector['length'], 'travel_time': connector['travel_time']}))
     return connecting_routes
 
 
-def get_traffic_aware_durations(route_graphs: List[nx.MultiDiGraph], connections, origin, destination, route_polylines: List[List[Tuple]]):
-    waypoints_builder = TrafficWaypointsBuilder()
-    waypoints = waypoints_builder.build_waypoints(route_graphs, route_polylines)
+def request_route_duration(
+    origin: str,
+    destination: str,
+    via: List[str],
+    departure_time: datetime,
+    routing_client: RoutingClient | None = None
+):
+    routing_client = routing_client or get_routing_client()
+    params = {
+        "transportMode": "car",
+        "origin": origin,
+        "destination": destination,
+        "via": via,
+        # "alternatives": 2,
+        "return": "summary,polyline,actions",
+        "routingMode": "fast",
+        "departureTime": format_departure_time(departure_time),
+        "apiKey": HERE_API_KEY
+    }
+    route = routing_client.get_routes(params)['routes'][0]
+    total = 0
+    for _, section in enumerate(route['sections']):
+        total += section['summary']['duration']
+        # print(section['summary']['duration'] / 60)
+        # print(section['summary']['length'])
+    polyline = Polyline.concatenate([
+        Polyline.from_flexpolyline(section['polyline']) for section in route['sections']
+    ])
+    return total, polyline
+
+def get_batched_durations(
+    trips: List[Trip],
+    departure_time: datetime,
+    routing_client: RoutingClient | None = None,
+    max_workers: int = MATRIX_FALLBACK_WORKERS
+) -> np.ndarray:
+    """
+    Traffic-aware duration (s) of each trip, aligned with `trips`. Trips are split into
+    legs, which are evaluated with as few matrix requests as possible. Trips with a leg
+    the matrix could not route (failed request or cell error) fall back to concurrent
+    single route requests.
+
+    A matrix request has a single departure time, so every leg is priced as if it left at
+    `departure_time`, not when the trip gets to it. Later legs of a long trip in changing
+    traffic are therefore off; single route requests (the fallback) account for it.
+    """
+    routing_client = routing_client or get_routing_client()
+    trip_legs = [get_legs(trip) for trip in trips]
+    legs = list(dict.fromkeys(leg for legs in trip_legs for leg in legs))
+
+    leg_durations: Dict[Leg, float] = {}
+    batches = plan_matrix_batches(legs)
+    with Timer(f'Requesting {len(legs)} legs in {len(batches)} matrices', 'Requested leg matrices'):
+        for origins, destinations in batches:
+            try:
+                leg_durations.update(request_matrix(origins, destinations, departure_time, routing_client, HERE_API_KEY))
+            except requests.RequestException as e:
+                # Not the exception text: its URL carries the API key
+                reason = e.response.status_code if e.response is not None else type(e).__name__
+                logger.warning(f'Matrix request for {len(origins)}x{len(destinations)} failed ({reason}), falling back to single requests')
+
+    durations = np.full(len(trips), np.nan)
+    fallback = []
+    for i, legs in enumerate(trip_legs):
+        if all(leg in leg_durations for leg in legs):
+            durations[i] = sum(leg_durations[leg] for leg in legs)
+        else:
+            fallback.append(i)
+
+    if fallback:
+        def request_duration(i: int) -> float:
+            duration, _ = request_route_duration(*trips[i], departure_time, routing_client)
+            return duration
+
+        with Timer(f'Requesting {len(fallback)} trips individually', 'Requested trips individually'):
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                durations[fallback] = list(executor.map(request_duration, fallback))
+    return durations
+
+def get_traffic_aware_durations(
+    route_graphs: List[nx.MultiDiGraph],
+    connections,
+    origin,
+    destination,
+    route_polylines: List[Polyline],
+    route_node_mappings: List[Dict[int, int]],
+    waypoints_builder: TrafficWaypointsBuilder | None = None,
+    departure_time: datetime | None = None,
+    waypoints: List[List[str]] | None = None,
+    level: int | None = None
+):
+    if waypoints is None:
+        if waypoints_builder is None:
+            waypoints_builder = TrafficWaypointsBuilder()
+        waypoints = waypoints_builder.build_waypoints(route_graphs, route_polylines, route_node_mappings, level=level)
     
     origin = f'{origin[0]},{origin[1]}'
     destination = f'{destination[0]},{destination[1]}'
 
     polylines = []
+    durations = []
     for i, route_graph in enumerate(route_graphs):    
-        departure_time = datetime.now(timezone.utc).isoformat()
-
-        url = "https://router.hereapi.com/v8/routes"
-        params = {
-            "transportMode": "car",
-            "origin": origin,
-            "destination": destination,
-            "via": waypoints[i],
-            # "alternatives": 2,
-            "return": "summary,polyline,actions",
-            "routingMode": "fast",
-            "departureTime": departure_time,
-            "apiKey": HERE_API_KEY
-        }
-        r = requests.get(url, params=params)
-        # print(r.text)
-        r.raise_for_status()
-        route = r.json()['routes'][0]
-        total = 0
-        full_polyline = []
-        for _, section in enumerate(route['sections']):
-            polyline_str = section['polyline']
-            polyline_sec = fpl.decode(polyline_str)
-            full_polyline += polyline_sec
-
-            total += section['summary']['duration']
-            # print(section['summary']['duration'] / 60)
-            # print(section['summary']['length'])
-        polylines.append(full_polyline)
-
+        start_time = time.time()
+        total, polyline = request_route_duration(
+            origin, destination, waypoints[i], departure_time or datetime.now(timezone.utc)
+        )
+        latency = time.time() - start_time
+        polylines.append(polyline)
+        durations.append(total)
+
+        deviation = shapely.hausdorff_distance(polyline.to_projected_linestring(), route_polylines[i].to_projected_linestring())
+        logger.info(f'Route {i + 1}: {len(waypoints[i])} vias, request took {latency:.2f} s, {deviation:.0f} m from the original route')
         logger.info(f'non-traffic duration for route {i + 1}: {total / 60}')
         logger.info('end of route\n')
-        # print(len(route['sections']))
-        # print(len(r.json()['routes']))
 
-        connections_from_route = [(u, v) for (u, v) in connections if u in route_graph.nodes]
-        
-    return polylines
+    return polylines, durations
     
 
 
-def build_connected_graph(route_graphs: List[nx.MultiDiGraph], origin, destination):
-    connecting_routes = get_connecting_routes(route_graphs)
-    full_graph = nx.MultiDiGraph(nx.compose_all(route_graphs))
-
-    for u, v in connecting_routes:
-        full_graph.add_edge(u, v)
+def build_connected_graph(route_graphs: List[nx.MultiDiGraph], origin, destination, connector_index: ConnectorIndex | None = None):
+    if connector_index is None:
+        connector_index = ConnectorIndex.load()
+    connecting_routes = get_connecting_routes(route_graphs, connector_index)
+    full_graph = nx.MultiDiGraph(nx.compose_all([
+        nx.relabel_nodes(route_graph, {node: get_unique_node_id(i, node) for node in route_graph.nodes})
+        for i, route_graph in enumerate(route_graphs)
+    ]))
+    full_graph.add_edges_from(connecting_routes)
 
     return full_graph, connecting_routes
-
@@ -1,7 +1,12 @@
 import os
+import multiprocessing
 import osmnx as ox          # Open Street Map Networks
 import networkx as nx       # Graph networks library
 import json
+from pathlib import Path
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict
 
 from src.helpers.get_and_manipulate_graph import (
     download_initial_graph,
@@ -10,56 +15,213 @@ from src.helpers.get_and_manipulate_graph import (
     find_major_intersections,
     get_subgraph_copy,
     merge_nearby_nodes,
-    get_connected_components_dfs,
-    correct_toll_graph,
+    extract_directed_chains,
+    get_chain_graph,
+    get_chain_bearing,
+    bearing_to_compass,
     simplify_node_chain,
     get_mapping_of_merged_nodes
 )
+from src.helpers.interchange_connectors import (
+    build_interchange_connectors,
+    get_connector_search_nodes,
+    save_interchange_connectors,
+    CONNECTORS_FILE_NAME
+)
+from src.helpers.node_mapping import NodeMapping
+from src.helpers.graphml_loader import load_graphml_columns
+from src.helpers.graph_pyramid import (
+    PYRAMID_DIR,
+    LEVELS_FILE_NAME,
+    TOLL_GRAPH_FILE_NAME,
+    TOLL_CHAINS_FILE_NAME,
+    INTERSECTIONS_FILE_NAME,
+    INTERSECTION_MAPPING_FILE_NAME,
+    LEVEL_MAPPING_FILE_NAME,
+    get_level_dir
+)
+from src.builder_snapshot import save_builder_snapshot
 
 from src.utils.timer import Timer
+from src.utils.memory import PeakMemory, MB
+from src.utils.projection import add_projected_coords
 from src.utils.get_directories import INTERMEDIATE_RESULTS_DIR
+from src.utils.constants import GRAPH_SIMPLIFICATION_DIST, PYRAMID_LEVELS
 from src.utils.setup_logger import get_logger
 logger = get_logger()
 REDOWNLOAD_GRAPH = False
+MERGE_DIST = 50
 
-def get_simplified_gta_graph_network():
-    # Step 1: Get initial graph of GTA area with 407
+def load_initial_graph() -> nx.MultiDiGraph:
     initial_graph_file_path = INTERMEDIATE_RESULTS_DIR / "407_graph.graphml"
     if not os.path.exists(initial_graph_file_path) or REDOWNLOAD_GRAPH:
-        G = download_initial_graph()
-    else:
-        with Timer('Loading initial graph', 'Loaded graph'):
-            G = ox.load_graphml(initial_graph_file_path)
+        return download_initial_graph()
+    with Timer('Loading initial graph', 'Loaded graph'):
+        return ox.load_graphml(initial_graph_file_path)
+
+def simplify_toll_chains(toll_graph: nx.MultiDiGraph, toll_chains: List[List[int]], min_dist: float = GRAPH_SIMPLIFICATION_DIST):
+    simplified_chains = []
+    full_edges_to_keep = []
+    for chain in toll_chains:
+        simplified_chain, edges_to_keep = simplify_node_chain(chain, toll_graph, min_dist)
+        simplified_chains.append(simplified_chain)
+        full_edges_to_keep += edges_to_keep
+    simplified_nodes = set(node for chain in simplified_chains for node in chain)
+    simplified_toll_graph = get_subgraph_copy(toll_graph, simplified_nodes)
+    for u, v, len_, time in full_edges_to_keep:
+        if v not in simplified_toll_graph[u]:
+            simplified_toll_graph.add_edge(u, v, length=len_, travel_time=time)
+    return simplified_chains, simplified_toll_graph
+
+def get_toll_chain_records(toll_graph: nx.MultiDiGraph, toll_chains: List[List[int]], simplified_chains: List[List[int]]) -> List[Dict]:
+    toll_chain_records = []
+    for chain, simplified_chain in zip(toll_chains, simplified_chains):
+        bearing = get_chain_bearing(chain, toll_graph)
+        toll_chain_records.append({
+            'nodes': chain,
+            'simplified_nodes': simplified_chain,
+            'bearing': bearing,
+            'direction': bearing_to_compass(bearing)
+        })
+    return toll_chain_records
+
+def save_toll_chains(toll_chain_records: List[Dict]):
+    with open(INTERMEDIATE_RESULTS_DIR / 'toll_chains.json', 'w', encoding='utf-8') as f:
+        json.dump(toll_chain_records, f, indent=2)
+
+def get_toll_level_mapping(
+    toll_chains: List[List[int]],
+    coarse_chains: List[List[int]],
+    fine_chains: List[List[int]]
+) -> Dict[int, List[int]]:
+    """Each fine simplified toll node belongs to the last coarse node at or before it along its chain."""
+    mapping = {}
+    for chain, coarse_chain, fine_chain in zip(toll_chains, coarse_chains, fine_chains):
+        positions = {node: i for i, node in enumerate(chain)}
+        coarse_positions = [positions[node] for node in coarse_chain]
+        for node in coarse_chain:
+            mapping.setdefault(node, [])
+        for node in fine_chain:
+            owner = coarse_chain[max(bisect_right(coarse_positions, positions[node]) - 1, 0)]
+            mapping[owner].append(node)
+    return mapping
+
+def build_graph_pyramid(
+    G: nx.MultiDiGraph,
+    entrance_exit_nodes: set,
+    toll_graph: nx.MultiDiGraph,
+    toll_chain_records: List[Dict],
+    major_int_graph: nx.MultiDiGraph
+) -> List[Dict]:
+    """
+    Simplified toll and intersection graphs, interchange connectors and node mappings for
+    every PYRAMID_LEVELS tolerance. Toll chains are simplified from the full chains at each
+    level; intersections are merged from the previous level's, so levels nest and each
+    level maps to the previous one as well as to the original major intersections.
+    """
+    toll_chains = [record['nodes'] for record in toll_chain_records]
+    levels = []
+    for index, (simplification_dist, merge_dist) in enumerate(PYRAMID_LEVELS):
+        with Timer(f'Building graph pyramid level {index}', f'Built graph pyramid level {index}'):
+            simplified_chains, simplified_toll_graph = simplify_toll_chains(toll_graph, toll_chains, simplification_dist)
+            add_projected_coords(simplified_toll_graph)
+            records = [dict(record, simplified_nodes=chain) for record, chain in zip(toll_chain_records, simplified_chains)]
+
+            if not levels:
+                ints_graph, offsets, old_ids = merge_nearby_nodes(major_int_graph, merge_dist)
+                intersection_mapping = get_mapping_of_merged_nodes(offsets, old_ids)
+                level_mapping = None
+            else:
+                finer = levels[-1]
+                ints_graph, offsets, old_ids = merge_nearby_nodes(finer['major_ints_graph'], merge_dist)
+                intersection_level_mapping = get_mapping_of_merged_nodes(offsets, old_ids)
+                intersection_mapping = intersection_level_mapping.compose(finer['intersection_mapping'])
+                level_mapping = NodeMapping.from_dict({
+                    **get_toll_level_mapping(toll_chains, simplified_chains, finer['simplified_chains']),
+                    **intersection_level_mapping.to_dict()
+                })
+
+            simplified_nodes = set(node for chain in simplified_chains for node in chain)
+            connectors = build_interchange_connectors(
+                G, entrance_exit_nodes, simplified_nodes, intersection_mapping, toll_reach=2 * simplification_dist
+            )
+        levels.append({
+            'simplification_dist': simplification_dist,
+            'merge_dist': merge_dist,
+            'simplified_chains': simplified_chains,
+            'toll_graph': simplified_toll_graph,
+            'toll_chain_records': records,
+            'major_ints_graph': ints_graph,
+            'intersection_mapping': intersection_mapping,
+            'level_mapping': level_mapping,
+            'connectors': connectors
+        })
+        logger.info(f'\tLevel {index}: {len(simplified_toll_graph)} toll nodes, {len(ints_graph)} intersections, {len(connectors)} connectors')
+    return levels
+
+def save_graph_pyramid(levels: List[Dict], pyramid_dir: Path = PYRAMID_DIR):
+    for index, level in enumerate(levels):
+        level_dir = get_level_dir(index, pyramid_dir)
+        level_dir.mkdir(parents=True, exist_ok=True)
+        ox.save_graphml(level['toll_graph'], level_dir / TOLL_GRAPH_FILE_NAME)
+        ox.save_graphml(level['major_ints_graph'], level_dir / INTERSECTIONS_FILE_NAME)
+        with open(level_dir / TOLL_CHAINS_FILE_NAME, 'w', encoding='utf-8') as f:
+            json.dump(level['toll_chain_records'], f, indent=2)
+        level['intersection_mapping'].save(level_dir / INTERSECTION_MAPPING_FILE_NAME)
+        if level['level_mapping'] is not None:
+            level['level_mapping'].save(level_dir / LEVEL_MAPPING_FILE_NAME)
+        save_interchange_connectors(level['connectors'], level_dir / CONNECTORS_FILE_NAME)
+
+    with open(pyramid_dir / LEVELS_FILE_NAME, 'w', encoding='utf-8') as f:
+        json.dump([
+            {
+                'simplification_dist': level['simplification_dist'],
+                'merge_dist': level['merge_dist'],
+                'toll_nodes': len(level['toll_graph']),
+                'intersections': len(level['major_ints_graph'])
+            }
+            for level in levels
+        ], f, indent=2)
+
+def get_simplified_gta_graph_network():
+    # Step 1: Get initial graph of GTA area with 407
+    G = load_initial_graph()
 
     # Step 2: Tag toll nodes
     with Timer('Finding Toll nodes and tagging graph', 'Tagged graph'):
         G, toll_node_ids, non_toll_node_ids = tag_toll_nodes(G)
+        entrance_exit_nodes = toll_node_ids.intersection(non_toll_node_ids)
+
+    with Timer('Adding free-flow travel times', 'Added free-flow travel times'):
+        G = ox.routing.add_edge_speeds(G)
+        G = ox.routing.add_edge_travel_times(G)
 
     # Step 3: Get separate 407 and major intersection graphs and simplify them
     toll_graph = filter_tagged_nodes(G, 'toll_route')
-    correct_toll_graph(toll_graph)
+    with Timer('Extracting toll chains', 'Extracted toll chains'):
+        toll_chains = extract_directed_chains(toll_graph)
+        toll_graph = get_chain_graph(toll_graph, toll_chains)
     with Timer('Simplifying toll graph', 'Simplified toll graph'):
-        # simplified_toll_graph = merge_nearby_nodes(toll_graph, merge_dist=300)
-        components_dfs = get_connected_components_dfs(toll_graph)
-        simplified_components = []
-        full_edges_to_keep = []
-        for component in components_dfs:
-            simplified_component, edges_to_keep = simplify_node_chain(component, toll_graph)
-            simplified_components.append(simplified_component)
-            full_edges_to_keep += edges_to_keep
-        simplified_nodes = set(node for component in simplified_components for node in component)
-        simplified_toll_graph = get_subgraph_copy(toll_graph, simplified_nodes)
-        for u, v, len_ in full_edges_to_keep:
-            if v not in simplified_toll_graph[u]:
-                simplified_toll_graph.add_edge(u, v, length=len_)
+        simplified_chains, simplified_toll_graph = simplify_toll_chains(toll_graph, toll_chains)
+        simplified_nodes = set(node for chain in simplified_chains for node in chain)
+    toll_chain_records = get_toll_chain_records(toll_graph, toll_chains, simplified_chains)
 
     major_intersections = find_major_intersections(G)
     major_int_graph = get_subgraph_copy(G, major_intersections)
     major_int_graph_simplified = major_int_graph
 
     with Timer('Simplifying major intersection graph', 'Simplified major intersection graph'):
-        major_int_graph_simplified = merge_nearby_nodes(major_int_graph, merge_dist=50)
-        node_mapping = get_mapping_of_merged_nodes(major_int_graph, major_int_graph_simplified)
+        major_int_graph_simplified, merge_offsets, merge_old_ids = merge_nearby_nodes(major_int_graph, merge_dist=MERGE_DIST)
+        node_mapping = get_mapping_of_merged_nodes(merge_offsets, merge_old_ids)
+
+    with Timer('Building interchange connectors', 'Built interchange connectors'):
+        connectors = build_interchange_connectors(G, entrance_exit_nodes, simplified_nodes, node_mapping)
+
+    with Timer('Projecting node coordinates', 'Projected node coordinates'):
+        for graph in [toll_graph, major_int_graph, simplified_toll_graph]:
+            add_projected_coords(graph)
+
+    graph_pyramid = build_graph_pyramid(G, entrance_exit_nodes, toll_graph, toll_chain_records, major_int_graph)
 
     # Step 4: Save graphs and print details
     ox.save_graphml(toll_graph, INTERMEDIATE_RESULTS_DIR / 'full_toll_graph.graphml')
@@ -68,17 +230,163 @@ def get_simplified_gta_graph_network():
     ox.save_graphml(simplified_toll_graph, INTERMEDIATE_RESULTS_DIR / 'simplified_toll_graph.graphml')
 
     with Timer('Saving Intersection Simplification Mapping', 'Saved Intersection Simplification Mapping'):
-        with open(INTERMEDIATE_RESULTS_DIR / 'intersection_simplification_mapping.json', 'w', encoding='utf-8') as f:
-            json.dump(node_mapping, f, indent=2)
+        node_mapping.save(INTERMEDIATE_RESULTS_DIR / 'intersection_simplification_mapping.npz')
+
+    with Timer('Saving interchange connectors', 'Saved interchange connectors'):
+        save_interchange_connectors(connectors)
+
+    with Timer('Saving toll chains', 'Saved toll chains'):
+        save_toll_chains(toll_chain_records)
+
+    with Timer('Saving graph pyramid', 'Saved graph pyramid'):
+        save_graph_pyramid(graph_pyramid)
+
+    # Last, once every intermediate result the builders load is written
+    save_builder_snapshot()
 
     logger.info(f'Length of original full graph: {len(G.nodes)}')
     logger.info(f'Length of toll graph: {len(toll_graph.nodes)}')
     logger.info(f'Length of simplified toll graph: {len(simplified_toll_graph)}')
+    for record in toll_chain_records:
+        logger.info(f'\tToll chain heading {record["direction"]}: {len(record["nodes"])} nodes, {len(record["simplified_nodes"])} simplified')
     logger.info(f'Major intersections identified: {len(major_intersections)}')
     logger.info(f'Simplified intersections: {len(major_int_graph_simplified)}')
+    logger.info(f'Interchange connectors: {len(connectors)}')
+
+    return toll_graph, major_int_graph, major_int_graph_simplified, simplified_toll_graph, simplified_chains
+
+
+# Staged mode: each stage runs in a fresh process, reloads what it needs from disk and
+# persists its outputs, so only one stage's working set is alive at a time. Only the first
+# stage holds the full drive graph; it persists the subgraphs the later stages work on.
+CONNECTOR_SEARCH_GRAPH_FILE_NAME = 'connector_search_graph.graphml'
+ENTRANCE_EXIT_NODES_FILE_NAME = 'entrance_exit_nodes.json'
+
+def load_stage_graph(file_name: str) -> nx.MultiDiGraph:
+    with Timer(f'Loading {file_name}', f'Loaded {file_name}'):
+        return load_graphml_columns(INTERMEDIATE_RESULTS_DIR / file_name, None, None, lazy_geometry=False)
+
+def load_entrance_exit_nodes() -> set:
+    with open(INTERMEDIATE_RESULTS_DIR / ENTRANCE_EXIT_NODES_FILE_NAME, 'r', encoding='utf-8') as f:
+        return set(json.load(f))
+
+def run_tag_graph_stage():
+    G = load_initial_graph()
+    with Timer('Finding Toll nodes and tagging graph', 'Tagged graph'):
+        G, toll_node_ids, non_toll_node_ids = tag_toll_nodes(G)
+        entrance_exit_nodes = toll_node_ids.intersection(non_toll_node_ids)
+        del toll_node_ids, non_toll_node_ids
+    with Timer('Adding free-flow travel times', 'Added free-flow travel times'):
+        G = ox.routing.add_edge_speeds(G)
+        G = ox.routing.add_edge_travel_times(G)
+
+    # The toll nodes and their interchanges' surroundings, for the toll chain and connector stages
+    with Timer('Extracting connector search graph', 'Extracted connector search graph'):
+        connector_search_graph = get_subgraph_copy(G, get_connector_search_nodes(G, entrance_exit_nodes))
+    major_intersections = find_major_intersections(G)
+    major_int_graph = get_subgraph_copy(G, major_intersections)
+    logger.info(f'Length of original full graph: {len(G.nodes)}')
+    del G
+
+    add_projected_coords(major_int_graph)
+    ox.save_graphml(connector_search_graph, INTERMEDIATE_RESULTS_DIR / CONNECTOR_SEARCH_GRAPH_FILE_NAME)
+    ox.save_graphml(major_int_graph, INTERMEDIATE_RESULTS_DIR / 'major_intersections.graphml')
+    with open(INTERMEDIATE_RESULTS_DIR / ENTRANCE_EXIT_NODES_FILE_NAME, 'w', encoding='utf-8') as f:
+        json.dump(sorted(entrance_exit_nodes), f)
+    logger.info(f'Connector search graph: {len(connector_search_graph)} nodes')
+    logger.info(f'Major intersections identified: {len(major_intersections)}')
+
+def run_toll_chains_stage():
+    toll_graph = filter_tagged_nodes(load_stage_graph(CONNECTOR_SEARCH_GRAPH_FILE_NAME), 'toll_route')
+
+    with Timer('Extracting toll chains', 'Extracted toll chains'):
+        toll_chains = extract_directed_chains(toll_graph)
+        toll_graph = get_chain_graph(toll_graph, toll_chains)
+    with Timer('Simplifying toll graph', 'Simplified toll graph'):
+        simplified_chains, simplified_toll_graph = simplify_toll_chains(toll_graph, toll_chains)
+    toll_chain_records = get_toll_chain_records(toll_graph, toll_chains, simplified_chains)
+
+    for graph in [toll_graph, simplified_toll_graph]:
+        add_projected_coords(graph)
+    ox.save_graphml(toll_graph, INTERMEDIATE_RESULTS_DIR / 'full_toll_graph.graphml')
+    ox.save_graphml(simplified_toll_graph, INTERMEDIATE_RESULTS_DIR / 'simplified_toll_graph.graphml')
+    save_toll_chains(toll_chain_records)
+
+    logger.info(f'Length of toll graph: {len(toll_graph.nodes)}')
+    logger.info(f'Length of simplified toll graph: {len(simplified_toll_graph)}')
+
+def run_major_intersections_stage():
+    major_int_graph = load_stage_graph('major_intersections.graphml')
+
+    with Timer('Simplifying major intersection graph', 'Simplified major intersection graph'):
+        major_int_graph_simplified, merge_offsets, merge_old_ids = merge_nearby_nodes(major_int_graph, merge_dist=MERGE_DIST)
+        node_mapping = get_mapping_of_merged_nodes(merge_offsets, merge_old_ids)
+
+    ox.save_graphml(major_int_graph_simplified, INTERMEDIATE_RESULTS_DIR / 'major_intersections_simplified.graphml')
+    node_mapping.save(INTERMEDIATE_RESULTS_DIR / 'intersection_simplification_mapping.npz')
+    logger.info(f'Simplified intersections: {len(major_int_graph_simplified)}')
+
+def run_interchange_connectors_stage():
+    entrance_exit_nodes = load_entrance_exit_nodes()
+    with open(INTERMEDIATE_RESULTS_DIR / 'toll_chains.json', 'r', encoding='utf-8') as f:
+        simplified_nodes = set(node for record in json.load(f) for node in record['simplified_nodes'])
+    node_mapping = NodeMapping.load(INTERMEDIATE_RESULTS_DIR / 'intersection_simplification_mapping.npz')
+    connector_search_graph = load_stage_graph(CONNECTOR_SEARCH_GRAPH_FILE_NAME)
+
+    with Timer('Building interchange connectors', 'Built interchange connectors'):
+        connectors = build_interchange_connectors(connector_search_graph, entrance_exit_nodes, simplified_nodes, node_mapping)
+    save_interchange_connectors(connectors)
+    logger.info(f'Interchange connectors: {len(connectors)}')
+
+def run_graph_pyramid_stage():
+    entrance_exit_nodes = load_entrance_exit_nodes()
+    with open(INTERMEDIATE_RESULTS_DIR / 'toll_chains.json', 'r', encoding='utf-8') as f:
+        toll_chain_records = json.load(f)
+    toll_graph = load_stage_graph('full_toll_graph.graphml')
+    major_int_graph = load_stage_graph('major_intersections.graphml')
+    connector_search_graph = load_stage_graph(CONNECTOR_SEARCH_GRAPH_FILE_NAME)
+
+    graph_pyramid = build_graph_pyramid(connector_search_graph, entrance_exit_nodes, toll_graph, toll_chain_records, major_int_graph)
+    save_graph_pyramid(graph_pyramid)
+
+def run_builder_snapshot_stage():
+    save_builder_snapshot()
 
-    return toll_graph, major_int_graph, major_int_graph_simplified, simplified_toll_graph, simplified_components
+PREPROCESSING_STAGES = {
+    'tag_graph': run_tag_graph_stage,
+    'toll_chains': run_toll_chains_stage,
+    'major_intersections': run_major_intersections_stage,
+    'interchange_connectors': run_interchange_connectors_stage,
+    'graph_pyramid': run_graph_pyramid_stage,
+    'builder_snapshot': run_builder_snapshot_stage
+}
 
+def run_preprocessing_stage(stage_name: str, budget_bytes: int | None) -> int:
+    """Run one stage under the memory budget, returning its peak RSS (bytes)."""
+    with Timer(f'Running preprocessing stage {stage_name}', f'Finished preprocessing stage {stage_name}'):
+        with PeakMemory(stage_name, budget_bytes) as peak_memory:
+            PREPROCESSING_STAGES[stage_name]()
+    return peak_memory.peak_rss
 
+def get_simplified_gta_graph_network_staged(memory_budget_mb: float | None = None, start_stage: str | None = None) -> Dict[str, int]:
+    """
+    Memory-budgeted alternative to get_simplified_gta_graph_network that writes the same
+    intermediate results. Stages run in order from `start_stage` (earlier stages' outputs
+    must already be on disk), each in a fresh process, so its peak RSS is its own working
+    set rather than memory an earlier stage freed but the allocator kept. A stage whose
+    RSS crosses the budget is interrupted with MemoryBudgetExceeded, so the run can be
+    resumed from that stage on a bigger machine.
 
+    Returns the peak RSS (bytes) of each stage that ran.
+    """
+    stage_names = list(PREPROCESSING_STAGES)
+    if start_stage is not None:
+        assert start_stage in PREPROCESSING_STAGES, f'Unknown stage {start_stage}, expected one of {stage_names}'
+        stage_names = stage_names[stage_names.index(start_stage):]
+    budget_bytes = None if memory_budget_mb is None else int(memory_budget_mb * MB)
 
+    peak_rss = {}
+    for stage_name in stage_names:
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            peak_rss[stage_name] = executor.submit(run_preprocessing_stage, stage_name, budget_bytes).result()
+    return peak_rss
@@ -0,0 +1,147 @@
+import io
+import pickle
+import numpy as np
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Tuple
+
+from src.build_route_graph import RouteGraphBuilder
+from src.build_traffic_routing_waypoints import TrafficWaypointsBuilder
+from src.helpers.interchange_connectors import ConnectorIndex
+
+from src.utils.timer import Timer
+from src.utils.memory import MB
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+# Arrays smaller than this stay in the pickled builder state
+MIN_SHARED_BYTES = 4096
+ARENA_ALIGNMENT = 64
+STATE_ARRAY_NAME = 'state'
+
+
+class ArenaPickler(pickle.Pickler):
+    """Pickles builder state, collecting its large arrays (the CSRGraphs' included) for the arena."""
+    def __init__(self, file) -> None:
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arrays: Dict[str, np.ndarray] = {}
+        self.pids: Dict[int, str] = {}
+        # Keeps every collected array alive, so ids are not reused while pickling
+        self.objects = []
+
+    def persistent_id(self, obj):
+        if type(obj) is not np.ndarray or obj.dtype.hasobject or obj.nbytes < MIN_SHARED_BYTES:
+            return None
+        # Arrays referenced from several places (e.g. a graph's node ids and its map matcher's) are stored once
+        if id(obj) not in self.pids:
+            self.pids[id(obj)] = f'array_{len(self.pids)}'
+            self.arrays[self.pids[id(obj)]] = obj
+            self.objects.append(obj)
+        return self.pids[id(obj)]
+
+
+class ArenaUnpickler(pickle.Unpickler):
+    def __init__(self, file, arena: 'GraphArena') -> None:
+        super().__init__(file)
+        self.arena = arena
+        self.objects = {}
+
+    def persistent_load(self, name):
+        if name not in self.objects:
+            self.objects[name] = self.arena.get_array(name)
+        return self.objects[name]
+
+
+@dataclass(frozen=True)
+class ArenaManifest:
+    """What a worker needs to attach: the segment name and {array name: (offset, dtype, shape)}."""
+    name: str
+    layout: Dict[str, Tuple[int, np.dtype, Tuple[int, ...]]]
+
+
+class GraphArena:
+    """
+    The builders' large arrays in one multiprocessing.shared_memory segment. The parent
+    creates it once; process-pool workers attach with the manifest and get read-only
+    views. The base graphs are CSRGraphs, so their node, coordinate, adjacency and weight
+    arrays are used in place and workers route directly on the shared pages, as they do
+    on the merge mapping and spatial index coordinates. Only the small pickled remainder
+    of the builders (and the spatial indexes' trees) is private to each worker.
+    Workers must be started by the creating process (as multiprocessing pools are), so
+    they share its resource tracker and the segment outlives them.
+    """
+    def __init__(self, shm: SharedMemory, manifest: ArenaManifest, is_owner: bool) -> None:
+        self.shm = shm
+        self.manifest = manifest
+        self.is_owner = is_owner
+
+    @classmethod
+    def create(
+        cls,
+        route_builder: RouteGraphBuilder | None = None,
+        waypoints_builder: TrafficWaypointsBuilder | None = None,
+        connector_index: ConnectorIndex | None = None
+    ):
+        route_builder = route_builder or RouteGraphBuilder()
+        waypoints_builder = waypoints_builder or TrafficWaypointsBuilder()
+        connector_index = connector_index or ConnectorIndex.load()
+
+        with Timer('Creating graph arena', 'Created graph arena'):
+            buffer = io.BytesIO()
+            pickler = ArenaPickler(buffer)
+            pickler.dump((route_builder, waypoints_builder, connector_index))
+            arrays = {**pickler.arrays, STATE_ARRAY_NAME: np.frombuffer(buffer.getvalue(), dtype=np.uint8)}
+
+            layout, size = {}, 0
+            for name, array in arrays.items():
+                offset = -(-size // ARENA_ALIGNMENT) * ARENA_ALIGNMENT
+                layout[name] = (offset, array.dtype, array.shape)
+                size = offset + array.nbytes
+            shm = SharedMemory(create=True, size=max(size, 1))
+            arena = cls(shm, ArenaManifest(shm.name, layout), is_owner=True)
+            for name, array in arrays.items():
+                arena.get_array(name, writable=True)[...] = array
+        logger.info(f'\tGraph arena: {len(arrays)} arrays, {size / MB:.1f} MB')
+        return arena
+
+    @classmethod
+    def attach(cls, manifest: ArenaManifest):
+        return cls(SharedMemory(name=manifest.name), manifest, is_owner=False)
+
+    def get_array(self, name: str, writable: bool = False) -> np.ndarray:
+        offset, dtype, shape = self.manifest.layout[name]
+        array = np.ndarray(shape, dtype, buffer=self.shm.buf, offset=offset)
+        array.flags.writeable = writable
+        return array
+
+    def load_builders(self) -> Tuple[RouteGraphBuilder, TrafficWaypointsBuilder, ConnectorIndex]:
+        with Timer('Loading builders from graph arena', 'Loaded builders from graph arena'):
+            state = io.BytesIO(self.get_array(STATE_ARRAY_NAME))
+            return ArenaUnpickler(state, self).load()
+
+    def close(self):
+        """Only possible once no views into the segment are left."""
+        self.shm.close()
+        if self.is_owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# Set in each pool worker by init_worker
+worker_arena: GraphArena | None = None
+worker_builders: Tuple[RouteGraphBuilder, TrafficWaypointsBuilder, ConnectorIndex] | None = None
+
+def init_worker(manifest: ArenaManifest):
+    """Process pool initializer: attach the arena and load the builders once per worker."""
+    global worker_arena, worker_builders
+    worker_arena = GraphArena.attach(manifest)
+    worker_builders = worker_arena.load_builders()
+
+def get_worker_builders() -> Tuple[RouteGraphBuilder, TrafficWaypointsBuilder, ConnectorIndex]:
+    assert worker_builders is not None, 'init_worker was not run in this process'
+    return worker_builders
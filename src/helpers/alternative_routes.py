@@ -0,0 +1,58 @@
+import networkx as nx
+import numpy as np
+from typing import List
+
+from src.helpers.csr_graph import CSRGraph
+from src.utils.constants import ALTERNATIVE_PENALTY_FACTOR, ALTERNATIVE_MAX_OVERLAP, ALTERNATIVE_MAX_STRETCH
+
+
+def get_path_cost(G: CSRGraph, path: List[int]) -> float:
+    return G.get_path_weight(path, 'travel_time')
+
+def get_path_overlap(G: CSRGraph, path: List[int], other_path: List[int]) -> float:
+    """Fraction of `path`'s length on edges it shares with `other_path`."""
+    other_edges = set(zip(other_path, other_path[1:]))
+    edge_lengths = [(edge, G.get_edge_weight(*edge)) for edge in zip(path, path[1:])]
+    total = sum(length for _, length in edge_lengths)
+    shared = sum(length for edge, length in edge_lengths if edge in other_edges)
+    return shared / total if total > 0 else 1.0
+
+def get_diverse_paths(
+    G: CSRGraph,
+    source: int,
+    target: int,
+    k: int,
+    penalty_factor: float = ALTERNATIVE_PENALTY_FACTOR,
+    max_overlap: float = ALTERNATIVE_MAX_OVERLAP,
+    max_stretch: float = ALTERNATIVE_MAX_STRETCH,
+    max_iterations: int | None = None
+) -> List[List[int]]:
+    """
+    Up to k fastest paths from source to target that are mutually diverse, by the
+    penalty method: after each search the edges of the path found are made
+    `penalty_factor` times more expensive (both directions, so the opposite
+    carriageway is not an alternative). A path is kept if it shares at most
+    `max_overlap` of its length with every kept path and its unpenalized travel time
+    is within `max_stretch` of the fastest path's.
+    """
+    # Penalized travel time per edge, in G's edge order
+    penalized = G.travel_time.copy()
+
+    paths = []
+    fastest_cost = None
+    for _ in range(max_iterations or 4 * k):
+        try:
+            path = G.shortest_path(source, target, weights=penalized)
+        except nx.NetworkXNoPath:
+            break
+        cost = get_path_cost(G, path)
+        fastest_cost = cost if fastest_cost is None else fastest_cost
+        if cost > max_stretch * fastest_cost:
+            break
+        if all(get_path_overlap(G, path, other_path) <= max_overlap for other_path in paths):
+            paths.append(path)
+            if len(paths) == k:
+                break
+        edges = [G.find_edge(u, v) for u, v in zip(path, path[1:])] + [G.find_edge(v, u) for u, v in zip(path, path[1:])]
+        penalized[np.array([i for i in edges if i is not None], dtype=np.int64)] *= penalty_factor
+    return paths
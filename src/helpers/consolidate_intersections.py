@@ -0,0 +1,101 @@
+import numpy as np
+import networkx as nx
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.neighbors import radius_neighbors_graph
+from typing import Tuple
+
+from src.utils.projection import get_node_coords, unproject_coords
+
+
+def cluster_nearby_nodes(xy: np.ndarray, ui: np.ndarray, vi: np.ndarray, merge_dist: float) -> np.ndarray:
+    """
+    Cluster label per node, following osmnx's consolidate_intersections rules:
+    nodes whose `merge_dist` buffers overlap are merged, then each cluster is
+    split into its weakly connected components. `ui`/`vi` are edge endpoint indices into `xy`.
+    """
+    n = len(xy)
+    # Buffers of radius merge_dist overlap when nodes are within 2 * merge_dist
+    proximity = radius_neighbors_graph(xy, radius=2 * merge_dist, mode='connectivity', include_self=False)
+    _, proximity_labels = connected_components(proximity, directed=False)
+
+    inside = proximity_labels[ui] == proximity_labels[vi]
+    intra_edges = coo_matrix((np.ones(inside.sum()), (ui[inside], vi[inside])), shape=(n, n))
+    _, labels = connected_components(intra_edges, directed=True, connection='weak')
+    return labels
+
+def consolidate_nodes(G: nx.MultiDiGraph, merge_dist: float) -> Tuple[nx.MultiDiGraph, np.ndarray, np.ndarray]:
+    """
+    Merge nodes within `merge_dist` metres of each other, like osmnx's
+    consolidate_intersections but using a radius-neighbour search on projected
+    coordinates and rebuilding edges in bulk. As osmnx does by default, dead ends
+    (street_count <= 1) are discarded first, so they are not in the mapping either.
+
+    Returns the consolidated graph (new node ids 0..n-1, lat/lon x/y) and the
+    new->old node mapping in CSR form: the old ids of new node i are
+    old_ids[offsets[i]:offsets[i + 1]].
+    """
+    nodes = np.array([node for node, count in G.nodes(data='street_count') if count is None or count > 1], dtype=np.int64)
+    xy = get_node_coords(G, nodes, projected=True)
+    node_index = dict(zip(nodes.tolist(), range(len(nodes))))
+    edges = [edge for edge in G.edges(keys=True, data=True) if edge[0] in node_index and edge[1] in node_index]
+    ui = np.array([node_index[u] for u, _, _, _ in edges], dtype=np.int64)
+    vi = np.array([node_index[v] for _, v, _, _ in edges], dtype=np.int64)
+    labels = cluster_nearby_nodes(xy, ui, vi, merge_dist)
+    n_new = int(labels.max()) + 1 if len(labels) else 0
+
+    counts = np.bincount(labels, minlength=n_new)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    members = np.argsort(labels, kind='stable')
+    old_ids = nodes[members]
+
+    centroids = np.column_stack([
+        np.bincount(labels, weights=xy[:, 0], minlength=n_new) / counts,
+        np.bincount(labels, weights=xy[:, 1], minlength=n_new) / counts
+    ])
+    lons, lats = unproject_coords(centroids[:, 0], centroids[:, 1])
+
+    Gc = nx.MultiDiGraph()
+    Gc.graph.update(G.graph)
+    Gc.graph['consolidated'] = True
+    for new_id in range(n_new):
+        cluster = old_ids[offsets[new_id]:offsets[new_id + 1]].tolist()
+        if len(cluster) == 1:
+            node_attrs = dict(G.nodes[cluster[0]], osmid_original=cluster[0])
+        else:
+            # Keep attributes the merged nodes agree on, as osmnx does
+            node_attrs = {'osmid_original': cluster}
+            for key, value in G.nodes[cluster[0]].items():
+                if isinstance(value, (list, dict)) or key == 'street_count':
+                    continue
+                if all(G.nodes[old_id].get(key) == value for old_id in cluster[1:]):
+                    node_attrs[key] = value
+        node_attrs.update(x=float(lons[new_id]), y=float(lats[new_id]), x_proj=float(centroids[new_id, 0]), y_proj=float(centroids[new_id, 1]))
+        Gc.add_node(new_id, **node_attrs)
+
+    # Rebuild edges between clusters in bulk, extending lengths to the new centroids and
+    # travel times in proportion
+    u_new, v_new = labels[ui], labels[vi]
+    keep = (u_new != v_new) | (ui == vi)
+    merged = counts > 1
+    extension = (
+        np.where(merged[u_new], np.hypot(*(centroids[u_new] - xy[ui]).T), 0.0)
+        + np.where(merged[v_new], np.hypot(*(centroids[v_new] - xy[vi]).T), 0.0)
+    )
+    new_edges = []
+    for i in np.flatnonzero(keep).tolist():
+        u, v, _, data = edges[i]
+        data = dict(data, u_original=u, v_original=v)
+        data.pop('geometry', None)
+        if 'length' in data:
+            length = data['length'] + float(extension[i])
+            if 'travel_time' in data and data['length'] > 0:
+                data['travel_time'] = data['travel_time'] * length / data['length']
+            data['length'] = length
+        new_edges.append((int(u_new[i]), int(v_new[i]), data))
+    Gc.add_edges_from(new_edges)
+
+    street_counts = {node: sum(1 for _ in nx.all_neighbors(Gc, node)) for node in Gc.nodes if 'street_count' not in Gc.nodes[node]}
+    nx.set_node_attributes(Gc, street_counts, name='street_count')
+
+    return Gc, offsets, old_ids
@@ -0,0 +1,340 @@
+import networkx as nx
+import numpy as np
+from collections.abc import Mapping
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from src.utils.projection import project_coords
+
+TOLL_TAG = 'toll_route'
+# The node and edge attributes routing reads, see QUERY_NODE_ATTRS and QUERY_EDGE_ATTRS
+COORD_ATTRS = ('x', 'y', 'x_proj', 'y_proj')
+WEIGHT_ATTRS = ('length', 'travel_time')
+# scipy.sparse.csgraph's predecessor of sources and unreached nodes
+NO_PREDECESSOR = -9999
+
+
+class CSRNodeView(Mapping):
+    """G.nodes for a CSRGraph: node id -> attribute dict, built on access."""
+    def __init__(self, G: 'CSRGraph') -> None:
+        self.G = G
+
+    def __getitem__(self, node: int) -> dict:
+        return self.G.get_node_data(self.G.get_position(node))
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.G.node_ids.tolist())
+
+    def __len__(self) -> int:
+        return len(self.G.node_ids)
+
+    def __contains__(self, node) -> bool:
+        return self.G.find_position(node) is not None
+
+    def __call__(self, data: bool = False):
+        if not data:
+            return iter(self)
+        return ((node, self.G.get_node_data(i)) for i, node in enumerate(self.G.node_ids.tolist()))
+
+
+class CSRGraph:
+    """
+    Read-only directed graph held in numpy arrays, the form the builders keep their base
+    graphs in. Node ids are sorted; the out-edges of the i-th node are indptr[i]:indptr[i + 1],
+    whose targets are node positions in `indices`, sorted within each row. Parallel edges
+    are collapsed into one edge per (u, v) carrying the minimum of each weight, which is
+    what routing with min_edge_weight sees. Only plain arrays are held, so pickles can
+    memory-map them (builder snapshot) or place them in shared memory (graph arena), and
+    shortest paths run on them in place with scipy.sparse.csgraph.
+
+    Reads mirror the parts of the networkx API the query path uses: G.nodes[node], len(G),
+    `node in G`, G.has_edge(u, v), G.successors(u) and G.edges().
+    """
+    def __init__(
+        self,
+        node_ids: np.ndarray,
+        coords: Dict[str, np.ndarray],
+        is_toll: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        weights: Dict[str, np.ndarray],
+        graph: dict | None = None
+    ) -> None:
+        self.node_ids = node_ids
+        self.x, self.y, self.x_proj, self.y_proj = (coords[attr] for attr in COORD_ATTRS)
+        self.is_toll = is_toll
+        self.indptr = indptr
+        self.indices = indices
+        self.length, self.travel_time = (weights[attr] for attr in WEIGHT_ATTRS)
+        self.graph = graph or {}
+        self.matrices: Dict[str, csr_matrix] = {}
+
+    def __getstate__(self):
+        # Matrices are views over the arrays, rebuilt on first use
+        state = self.__dict__.copy()
+        state['matrices'] = {}
+        return state
+
+    @classmethod
+    def from_edges(
+        cls,
+        node_ids: np.ndarray,
+        coords: Dict[str, np.ndarray],
+        is_toll: np.ndarray,
+        sources: np.ndarray,
+        targets: np.ndarray,
+        weights: Dict[str, np.ndarray],
+        graph: dict | None = None
+    ):
+        """From node arrays and edges given as node positions; parallel edges collapse to per-weight minima."""
+        order = np.argsort(node_ids, kind='stable')
+        new_positions = np.empty(len(order), dtype=np.int64)
+        new_positions[order] = np.arange(len(order))
+        sources, targets = new_positions[sources], new_positions[targets]
+
+        edge_order = np.lexsort((targets, sources))
+        sources, targets = sources[edge_order], targets[edge_order]
+        is_first = np.ones(len(sources), dtype=bool)
+        is_first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        starts = np.flatnonzero(is_first)
+        collapsed = {
+            attr: np.minimum.reduceat(values[edge_order], starts) if len(starts) else np.empty(0)
+            for attr, values in weights.items()
+        }
+        counts = np.bincount(sources[starts], minlength=len(node_ids))
+        return cls(
+            np.ascontiguousarray(node_ids[order], dtype=np.int64),
+            {attr: np.ascontiguousarray(coords[attr][order], dtype=np.float64) for attr in COORD_ATTRS},
+            np.ascontiguousarray(is_toll[order], dtype=bool),
+            np.concatenate([[0], np.cumsum(counts)]).astype(np.int32),
+            targets[starts].astype(np.int32),
+            {attr: np.ascontiguousarray(collapsed[attr], dtype=np.float64) for attr in WEIGHT_ATTRS},
+            graph
+        )
+
+    @classmethod
+    def from_graph(cls, G: nx.MultiDiGraph):
+        """Array form of a networkx graph's routing attributes; every edge needs a length and a free-flow travel time."""
+        nodes = list(G.nodes)
+        positions = {node: i for i, node in enumerate(nodes)}
+        edges = list(G.edges(data=True))
+        coords = {attr: np.array([G.nodes[node].get(attr, np.nan) for node in nodes], dtype=np.float64) for attr in COORD_ATTRS}
+        if np.isnan(coords['x_proj']).any():
+            coords['x_proj'], coords['y_proj'] = project_coords(coords['x'], coords['y'])
+        return cls.from_edges(
+            np.array(nodes, dtype=np.int64),
+            coords,
+            np.array([G.nodes[node].get('tag') == TOLL_TAG for node in nodes], dtype=bool),
+            np.array([positions[u] for u, _, _ in edges], dtype=np.int64),
+            np.array([positions[v] for _, v, _ in edges], dtype=np.int64),
+            {attr: np.array([data[attr] for *_, data in edges], dtype=np.float64) for attr in WEIGHT_ATTRS},
+            dict(G.graph)
+        )
+
+    def get_edge_arrays(self) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        """Source positions, target positions and weights of every edge."""
+        sources = np.repeat(np.arange(len(self.node_ids)), np.diff(self.indptr))
+        return sources, self.indices.astype(np.int64), {'length': self.length, 'travel_time': self.travel_time}
+
+    def get_coord_arrays(self) -> Dict[str, np.ndarray]:
+        return {attr: getattr(self, attr) for attr in COORD_ATTRS}
+
+    def compose(self, other: 'CSRGraph') -> 'CSRGraph':
+        """Union of both graphs, like nx.compose: node attributes of `other` win where nodes overlap."""
+        node_ids = np.concatenate([self.node_ids, other.node_ids])
+        # The last occurrence of each node id, i.e. other's where both have it
+        unique_ids, last = np.unique(node_ids[::-1], return_index=True)
+        keep = len(node_ids) - 1 - last
+        positions = np.searchsorted(unique_ids, node_ids)
+        self_sources, self_targets, self_weights = self.get_edge_arrays()
+        other_sources, other_targets, other_weights = other.get_edge_arrays()
+        offset = len(self.node_ids)
+        return CSRGraph.from_edges(
+            unique_ids,
+            {attr: np.concatenate([getattr(self, attr), getattr(other, attr)])[keep] for attr in COORD_ATTRS},
+            np.concatenate([self.is_toll, other.is_toll])[keep],
+            positions[np.concatenate([self_sources, other_sources + offset])],
+            positions[np.concatenate([self_targets, other_targets + offset])],
+            {attr: np.concatenate([self_weights[attr], other_weights[attr]]) for attr in WEIGHT_ATTRS},
+            {**self.graph, **other.graph}
+        )
+
+    def subgraph(self, nodes: Iterable[int]) -> 'CSRGraph':
+        keep = np.isin(self.node_ids, np.fromiter(nodes, dtype=np.int64))
+        new_positions = np.cumsum(keep) - 1
+        sources, targets, weights = self.get_edge_arrays()
+        kept_edges = keep[sources] & keep[targets]
+        return CSRGraph.from_edges(
+            self.node_ids[keep],
+            {attr: values[keep] for attr, values in self.get_coord_arrays().items()},
+            self.is_toll[keep],
+            new_positions[sources[kept_edges]],
+            new_positions[targets[kept_edges]],
+            {attr: values[kept_edges] for attr, values in weights.items()},
+            dict(self.graph)
+        )
+
+    def with_edges(self, us: Iterable[int], vs: Iterable[int], weights: Dict[str, Iterable[float]]) -> 'CSRGraph':
+        """Copy with extra edges between existing nodes; edges with an endpoint not in the graph are skipped."""
+        us, vs = np.fromiter(us, dtype=np.int64), np.fromiter(vs, dtype=np.int64)
+        extra_weights = {attr: np.fromiter(weights[attr], dtype=np.float64) for attr in WEIGHT_ATTRS}
+        u_positions, v_positions = self.find_positions(us), self.find_positions(vs)
+        valid = (u_positions >= 0) & (v_positions >= 0)
+        sources, targets, base_weights = self.get_edge_arrays()
+        return CSRGraph.from_edges(
+            self.node_ids,
+            self.get_coord_arrays(),
+            self.is_toll,
+            np.concatenate([sources, u_positions[valid]]),
+            np.concatenate([targets, v_positions[valid]]),
+            {attr: np.concatenate([base_weights[attr], extra_weights[attr][valid]]) for attr in WEIGHT_ATTRS},
+            dict(self.graph)
+        )
+
+    @property
+    def nodes(self) -> CSRNodeView:
+        return CSRNodeView(self)
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.nodes)
+
+    def __contains__(self, node) -> bool:
+        return node in self.nodes
+
+    def number_of_nodes(self) -> int:
+        return len(self.node_ids)
+
+    def number_of_edges(self) -> int:
+        return len(self.indices)
+
+    def find_positions(self, nodes: np.ndarray) -> np.ndarray:
+        """Positions of node ids, -1 for ids not in the graph."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.node_ids, nodes), max(len(self.node_ids) - 1, 0))
+        found = len(self.node_ids) > 0 and self.node_ids[positions] == nodes
+        return np.where(found, positions, -1)
+
+    def find_position(self, node) -> int | None:
+        if not isinstance(node, (int, np.integer)):
+            return None
+        position = int(self.find_positions(np.array([node]))[0])
+        return None if position < 0 else position
+
+    def get_position(self, node: int) -> int:
+        position = self.find_position(node)
+        if position is None:
+            raise KeyError(node)
+        return position
+
+    def get_node_data(self, position: int) -> dict:
+        # Untagged nodes read back from GraphML as the string 'None'
+        data = {attr: float(getattr(self, attr)[position]) for attr in COORD_ATTRS}
+        data['tag'] = TOLL_TAG if self.is_toll[position] else 'None'
+        return data
+
+    def get_coords(self, nodes: Iterable[int] | None = None, projected: bool = False) -> np.ndarray:
+        """(N, 2) array of node (x, y), in lon/lat or in the projected CRS (metres)."""
+        x, y = (self.x_proj, self.y_proj) if projected else (self.x, self.y)
+        if nodes is None:
+            return np.column_stack([x, y])
+        positions = self.find_positions(np.fromiter(nodes, dtype=np.int64))
+        if (positions < 0).any():
+            raise KeyError('Nodes not in the graph')
+        return np.column_stack([x[positions], y[positions]])
+
+    def get_row(self, position: int) -> slice:
+        return slice(int(self.indptr[position]), int(self.indptr[position + 1]))
+
+    def successors(self, node: int) -> List[int]:
+        return self.node_ids[self.indices[self.get_row(self.get_position(node))]].tolist()
+
+    def find_edge(self, u: int, v: int) -> int | None:
+        u_position, v_position = self.find_position(u), self.find_position(v)
+        if u_position is None or v_position is None:
+            return None
+        row = self.get_row(u_position)
+        i = row.start + int(np.searchsorted(self.indices[row], v_position))
+        return i if i < row.stop and self.indices[i] == v_position else None
+
+    def has_edge(self, u: int, v: int) -> bool:
+        return self.find_edge(u, v) is not None
+
+    def get_edge_weight(self, u: int, v: int, weight: str = 'length') -> float:
+        i = self.find_edge(u, v)
+        if i is None:
+            raise KeyError((u, v))
+        return float(getattr(self, weight)[i])
+
+    def get_path_weight(self, path: List[int], weight: str = 'length') -> float:
+        return sum(self.get_edge_weight(u, v, weight) for u, v in zip(path, path[1:]))
+
+    def edges(self, data: bool = False):
+        sources, targets, weights = self.get_edge_arrays()
+        us, vs = self.node_ids[sources].tolist(), self.node_ids[targets].tolist()
+        if not data:
+            return zip(us, vs)
+        return ((u, v, {attr: float(weights[attr][i]) for attr in WEIGHT_ATTRS}) for i, (u, v) in enumerate(zip(us, vs)))
+
+    def get_matrix(self, weight: str = 'length', weights: np.ndarray | None = None) -> csr_matrix:
+        """Sparse adjacency over the graph's own arrays; `weights` (one per edge) replaces the named weight."""
+        n = len(self.node_ids)
+        if weights is not None:
+            return csr_matrix((weights, self.indices, self.indptr), shape=(n, n))
+        if weight not in self.matrices:
+            self.matrices[weight] = csr_matrix((getattr(self, weight), self.indices, self.indptr), shape=(n, n))
+        return self.matrices[weight]
+
+    def dijkstra(
+        self,
+        sources: Iterable[int],
+        weight: str = 'length',
+        limit: float = np.inf,
+        weights: np.ndarray | None = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Distances from the nearest source and predecessors, indexed by node position (inf / NO_PREDECESSOR where unreached)."""
+        positions = self.find_positions(np.fromiter(sources, dtype=np.int64))
+        if (positions < 0).any():
+            raise nx.NodeNotFound('Source not in the graph')
+        dists, predecessors, _ = dijkstra(
+            self.get_matrix(weight, weights), directed=True, indices=positions,
+            limit=limit, return_predecessors=True, min_only=True
+        )
+        return dists, predecessors
+
+    def get_path(self, predecessors: np.ndarray, target_position: int) -> List[int]:
+        path = [target_position]
+        while predecessors[path[-1]] != NO_PREDECESSOR:
+            path.append(int(predecessors[path[-1]]))
+        return self.node_ids[path[::-1]].tolist()
+
+    def shortest_path(self, source: int, target: int, weight: str = 'length', weights: np.ndarray | None = None) -> List[int]:
+        dists, predecessors = self.dijkstra([source], weight, weights=weights)
+        target_position = self.find_position(target)
+        if target_position is None or not np.isfinite(dists[target_position]):
+            raise nx.NetworkXNoPath(f'No path from {source} to {target}')
+        return self.get_path(predecessors, target_position)
+
+    def get_reach(self, source: int, cutoff: float, weight: str = 'length') -> Tuple[Dict[int, float], Dict[int, int]]:
+        """
+        Distances to the nodes within `cutoff` of `source`, and the predecessor of each
+        reached node other than the source (see get_reach_path), by node id.
+        """
+        dists, predecessors = self.dijkstra([source], weight, cutoff)
+        reached = np.flatnonzero(np.isfinite(dists))
+        has_predecessor = reached[predecessors[reached] != NO_PREDECESSOR]
+        return (
+            dict(zip(self.node_ids[reached].tolist(), dists[reached].tolist())),
+            dict(zip(self.node_ids[has_predecessor].tolist(), self.node_ids[predecessors[has_predecessor]].tolist()))
+        )
+
+
+def get_reach_path(predecessors: Dict[int, int], target: int) -> List[int]:
+    """Path from the source of CSRGraph.get_reach to a reached target."""
+    path = [target]
+    while path[-1] in predecessors:
+        path.append(predecessors[path[-1]])
+    return path[::-1]
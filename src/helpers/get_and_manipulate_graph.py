@@ -1,12 +1,14 @@
 import osmnx as ox          # Open Street Map Networks
-import pyproj               # cartographic projections library
+import numpy as np
 import networkx as nx       # Graph networks library
 import time
 import os
 from typing import Set, List, Dict
 
-from src.utils.constants import GRAPH_SIMPLIFICATION_DIST
+from src.utils.constants import GRAPH_SIMPLIFICATION_DIST, MIN_CHAIN_LENGTH, TOLL_HIGHWAY_REFS
 from src.utils.get_directories import INTERMEDIATE_RESULTS_DIR
+from src.helpers.consolidate_intersections import consolidate_nodes
+from src.helpers.node_mapping import NodeMapping
 from src.utils.setup_logger import get_logger
 logger = get_logger()
 
@@ -46,25 +48,25 @@ def tag_toll_nodes(G: nx.MultiDiGraph):
     # Find toll nodes
     toll_node_ids = set()
     non_toll_node_ids = set()
-    marked_as_toll, ref_407, name_407 = 0, 0, 0
+    marked_as_toll, ref_highway, name_highway = 0, 0, 0
 
     for u, v, k, data in G.edges(keys=True, data=True):
         if data.get('toll') == 'yes':
             toll_node_ids.update([u, v])
             marked_as_toll += 1
-        elif 'ref' in data and '407' in str(data['ref']):
+        elif 'ref' in data and any(ref in str(data['ref']) for ref in TOLL_HIGHWAY_REFS):
             toll_node_ids.update([u, v])
-            ref_407 += 1
-        elif 'name' in data and '407' in str(data['name']):
+            ref_highway += 1
+        elif 'name' in data and any(ref in str(data['name']) for ref in TOLL_HIGHWAY_REFS):
             toll_node_ids.update([u, v])
-            name_407 += 1
+            name_highway += 1
         else:
             non_toll_node_ids.update([u, v])
         
 
     logger.info(f'\tMarked as toll: {marked_as_toll}')
-    logger.info(f'\tHas 407 ref: {ref_407}')
-    logger.info(f'\tHas name 407: {name_407}')
+    logger.info(f'\tHas toll highway ref: {ref_highway}')
+    logger.info(f'\tHas toll highway name: {name_highway}')
 
     # Find toll entrances/exits
     entrance_exit_nodes = set()
@@ -127,68 +129,29 @@ def find_major_intersections(G: nx.MultiDiGraph, min_degree: int = 1):
 def merge_nearby_nodes(
     G: nx.MultiDiGraph,
     merge_dist: float,
-) -> nx.MultiDiGraph:
-    crs = G.graph.get("crs")
-    is_projected = pyproj.CRS(crs).is_projected
-    # logger.debug((crs, "projected?", is_projected))
-    if not is_projected:
-        G = ox.project_graph(G)
-    
-    # nodes, edges = ox.graph_to_gdfs(G)
-    # logger.debug(nodes.head())
-    # logger.debug(nodes.columns)
-
-    G_simplified = ox.simplification.consolidate_intersections(
-        G,
-        tolerance=merge_dist
-    )
-    assert isinstance(G_simplified, nx.MultiDiGraph)
-
-    return ox.project_graph(G_simplified, to_crs=crs)
-
-def get_mapping_of_merged_nodes(G: nx.MultiDiGraph, G_simplified: nx.MultiDiGraph):
-    # Extract the mapping (New Node ID -> List of Old Node IDs)
-    # The 'osmid_original' attribute can be a single value or a list.
-    # We normalize it to always be a list for consistency.
-    node_mapping: Dict[int, List[int]] = {}
+):
+    """
+    Consolidate nodes within `merge_dist` metres. Returns the consolidated graph and
+    the new->old node mapping as CSR arrays (see consolidate_nodes).
+    """
+    G_simplified, offsets, old_ids = consolidate_nodes(G, merge_dist)
+    logger.info(f'\tConsolidated {len(G.nodes)} nodes into {len(G_simplified.nodes)}')
+    return G_simplified, offsets, old_ids
 
-    for node, data in G_simplified.nodes(data=True):
-        original_ids = data.get("osmid_original")
-        
-        # If the node wasn't merged, osmid_original might not exist or be a single value
-        if original_ids is None:
-            # Fallback if attribute is missing (rare, but good for safety)
-            assert False
-            node_mapping[node] = [node]
-        elif isinstance(original_ids, list):
-            node_mapping[node] = original_ids
-        else:
-            # It's a single scalar value (e.g. an int or string)
-            node_mapping[node] = [original_ids]
-
-    # Example: Print first 5 mappings
-    for new_id, old_ids in list(node_mapping.items()):
-        logger.debug(f"New Node {new_id} contains original nodes: {old_ids}")
-        for old_id in old_ids:
-            new_x, new_y = G_simplified.nodes[new_id]['x'], G_simplified.nodes[new_id]['y']
-            old_x, old_y = G.nodes[old_id]['x'], G.nodes[old_id]['y']
-            
-            logger.debug(f'results for node {new_id}')
-            logger.debug((new_x, new_y))
-            logger.debug((old_x, old_y))
-            logger.debug(ox.distance.great_circle(new_y, new_x, old_y, old_x))
-            logger.debug('')
-    
-    return node_mapping
+def get_mapping_of_merged_nodes(offsets: np.ndarray, old_ids: np.ndarray) -> NodeMapping:
+    # New Node ID -> Old Node IDs
+    return NodeMapping(offsets, old_ids)
 
 def simplify_node_chain(in_order_node_ids: List[int], graph: nx.MultiDiGraph, min_dist=GRAPH_SIMPLIFICATION_DIST):
     nodes_to_keep = [in_order_node_ids[0]]
     edges_to_keep = []
     prev_node = None
+    last_node = None
     cur_len = 0
+    cur_time = 0
     for node_id in in_order_node_ids:
         if prev_node is None:
-            prev_node = node_id
+            prev_node = last_node = node_id
             continue
         # TODO: change to using length property?
         dist = ox.distance.great_circle(
@@ -197,70 +160,121 @@ def simplify_node_chain(in_order_node_ids: List[int], graph: nx.MultiDiGraph, mi
             graph.nodes[node_id]['y'],
             graph.nodes[node_id]['x'],
         )
-        cur_len += dist
+        # Length of the kept edge is the length along the chain, not the sum of distances from prev_node
+        cur_len += ox.distance.great_circle(
+            graph.nodes[last_node]['y'],
+            graph.nodes[last_node]['x'],
+            graph.nodes[node_id]['y'],
+            graph.nodes[node_id]['x'],
+        )
+        # Likewise its travel time is summed along the chain's edges
+        cur_time += get_edge_travel_time(graph, last_node, node_id)
+        last_node = node_id
         if dist >= min_dist:
             nodes_to_keep.append(node_id)
-            edges_to_keep.append((prev_node, node_id, cur_len))
+            edges_to_keep.append((prev_node, node_id, cur_len, cur_time))
             prev_node = node_id
             cur_len = 0
+            cur_time = 0
     return nodes_to_keep, edges_to_keep
 
-def correct_toll_graph(graph: nx.MultiDiGraph):
+def get_edge_length(graph: nx.MultiDiGraph, u: int, v: int) -> float:
+    lengths = [data['length'] for data in graph[u][v].values() if 'length' in data]
+    if lengths:
+        return float(min(lengths))
+    return ox.distance.great_circle(
+        graph.nodes[u]['y'], graph.nodes[u]['x'], graph.nodes[v]['y'], graph.nodes[v]['x']
+    )
+
+def get_edge_travel_time(graph: nx.MultiDiGraph, u: int, v: int) -> float:
+    return float(min(data['travel_time'] for data in graph[u][v].values()))
+
+def extract_directed_chains(graph: nx.MultiDiGraph, min_chain_length: float = MIN_CHAIN_LENGTH) -> List[List[int]]:
     """
-    NOTE: This algorithm is specific to the 407 toll graph.
-    Possible general strategy for removing cycles: for each node in the component,
-    select it as the starting node for dfs traversal and
-    check if len(dfs_preorder_nodes) == len(component).
-    Then, follow the edges in that preorder and remove any extraneous edges
+    Decompose a directed highway graph into ordered, node-disjoint chains, one per
+    carriageway of each corridor (e.g. 407 EB/WB, 412 NB/SB, 418 NB/SB).
+
+    A single memoized DFS computes the longest downstream reach from every node in
+    linear time (back edges of cycles are ignored), then chains are walked along those
+    longest-reach pointers, starting from the nodes with the largest reach; sorting the
+    start nodes makes the whole O(n log n). Short leftovers such as ramps are dropped.
     """
-    components = list(nx.weakly_connected_components(graph))
+    reach: Dict[int, float] = {}
+    next_node: Dict[int, int | None] = {}
+    on_stack = set()
 
-    for i, component in enumerate(components):
-        if i == 0:
+    for root in graph.nodes:
+        if root in reach:
             continue
-        ne_node = max(component,
-            key=lambda n: (
-                graph.nodes[n]['y'] if 'y' in graph.nodes[n] else float('inf'),
-                graph.nodes[n]['x'] if 'x' in graph.nodes[n] else float('inf')
-            )
-        )
-        dfs_nodes = list(nx.dfs_preorder_nodes(graph.to_undirected(), source=ne_node))
-        for j, node in enumerate(dfs_nodes):
-            edges_to_remove = []
-            visited = set()
-            for u, v, k in graph.out_edges(node, keys=True):
-                if v in visited:
-                    edges_to_remove.append((u, v, k))
+        stack = [(root, iter(graph.successors(root)))]
+        on_stack.add(root)
+        while stack:
+            node, successors = stack[-1]
+            descended = False
+            for succ in successors:
+                if succ == node or succ in on_stack:
+                    continue # back edge or self loop
+                if succ not in reach:
+                    stack.append((succ, iter(graph.successors(succ))))
+                    on_stack.add(succ)
+                    descended = True
+                    break
+            if descended:
+                continue
+            stack.pop()
+            on_stack.discard(node)
+            best_reach, best_next = 0.0, None
+            for succ in graph.successors(node):
+                if succ == node or succ not in reach:
                     continue
-                visited.add(v)
-                if v != dfs_nodes[j + 1]:
-                    edges_to_remove.append((u, v, k))
-            
-            for u, v, k in edges_to_remove:
-                graph.remove_edge(u, v, k)
-
-    node_to_rid_map = {}
-    for i, component in enumerate(components):
-        for j, node in enumerate(component):
-            node_to_rid_map[node] = f'{i}-{j}'
-    
-def get_connected_components_dfs(graph: nx.MultiDiGraph) -> List[List[int]]:
-    G_undirected = graph.to_undirected()
-    
-    # Get connected components
-    components = list(nx.weakly_connected_components(graph))
-    
-    result = []
-    node_to_rid_map = {}
-    for j, component in enumerate(components):
-        starting_nodes = [
-            node for node in component
-            if graph.in_degree(node) == 0 and graph.out_degree(node) == 1
-        ]
-
-        assert len(starting_nodes) == 1, len(starting_nodes)
-        dfs_nodes = list(nx.dfs_preorder_nodes(G_undirected, source=starting_nodes[0]))
-
-        result.append(dfs_nodes)
-
-    return result
\ No newline at end of file
+                succ_reach = get_edge_length(graph, node, succ) + reach[succ]
+                if succ_reach > best_reach:
+                    best_reach, best_next = succ_reach, succ
+            reach[node], next_node[node] = best_reach, best_next
+
+    # Sources first so each corridor is read from its upstream end, then anything only reachable through a cycle
+    start_nodes = sorted(graph.nodes, key=lambda n: (graph.in_degree(n) != 0, -reach[n]))
+    visited = set()
+    chains = []
+    for start in start_nodes:
+        if start in visited:
+            continue
+        chain = []
+        chain_length = 0.0
+        node = start
+        while node is not None and node not in visited:
+            visited.add(node)
+            if chain:
+                chain_length += get_edge_length(graph, chain[-1], node)
+            chain.append(node)
+            node = next_node[node]
+        if chain_length >= min_chain_length:
+            chains.append(chain)
+
+    return chains
+
+def get_chain_graph(graph: nx.MultiDiGraph, chains: List[List[int]]) -> nx.MultiDiGraph:
+    """Subgraph containing only the chain nodes and the edges between consecutive chain nodes."""
+    chain_graph = nx.MultiDiGraph()
+    chain_graph.graph.update(graph.graph)
+    for chain in chains:
+        chain_graph.add_nodes_from((node, graph.nodes[node]) for node in chain)
+        for u, v in zip(chain, chain[1:]):
+            key, data = min(graph[u][v].items(), key=lambda item: item[1].get('length', float('inf')))
+            chain_graph.add_edge(u, v, key=key, **data)
+    return chain_graph
+
+def get_bearing(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    return float(ox.bearing.calculate_bearing(lat1, lon1, lat2, lon2))
+
+def get_chain_bearing(chain: List[int], graph: nx.MultiDiGraph) -> float:
+    start, end = graph.nodes[chain[0]], graph.nodes[chain[-1]]
+    return get_bearing(start['y'], start['x'], end['y'], end['x'])
+
+def get_bearing_difference(bearing1: float, bearing2: float) -> float:
+    diff = abs(bearing1 - bearing2) % 360
+    return min(diff, 360 - diff)
+
+def bearing_to_compass(bearing: float) -> str:
+    directions = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
+    return directions[int(((bearing % 360) + 22.5) // 45) % 8]
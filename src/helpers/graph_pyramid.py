@@ -0,0 +1,94 @@
+import json
+from pathlib import Path
+from typing import List
+
+from src.helpers.csr_graph import CSRGraph
+from src.helpers.graphml_loader import load_graphml_columns
+from src.helpers.interchange_connectors import ConnectorIndex, CONNECTORS_FILE_NAME, build_routing_graph
+from src.helpers.map_matching import MapMatcher
+from src.helpers.node_mapping import NodeMapping
+
+from src.utils.get_directories import INTERMEDIATE_RESULTS_DIR
+from src.utils.constants import PYRAMID_MIN_ROUTE_NODES
+
+PYRAMID_DIR = INTERMEDIATE_RESULTS_DIR / 'graph_pyramid'
+# Written last when the pyramid is saved, so it also marks a complete pyramid
+LEVELS_FILE_NAME = 'levels.json'
+# Per level, same contents as the base intermediate results of the same names
+TOLL_GRAPH_FILE_NAME = 'simplified_toll_graph.graphml'
+TOLL_CHAINS_FILE_NAME = 'toll_chains.json'
+INTERSECTIONS_FILE_NAME = 'major_intersections_simplified.graphml'
+INTERSECTION_MAPPING_FILE_NAME = 'intersection_simplification_mapping.npz'
+# Level node -> the nodes of the next finer level it stands for (toll and intersection nodes)
+LEVEL_MAPPING_FILE_NAME = 'level_mapping.npz'
+
+
+def get_level_dir(index: int, pyramid_dir: Path = PYRAMID_DIR) -> Path:
+    return pyramid_dir / f'level_{index}'
+
+def load_levels_info(pyramid_dir: Path = PYRAMID_DIR) -> List[dict]:
+    with open(pyramid_dir / LEVELS_FILE_NAME, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_intersection_mappings(pyramid_dir: Path = PYRAMID_DIR) -> List[NodeMapping]:
+    """Per level, simplified intersection -> original major intersections."""
+    return [
+        NodeMapping.load(get_level_dir(index, pyramid_dir) / INTERSECTION_MAPPING_FILE_NAME)
+        for index in range(len(load_levels_info(pyramid_dir)))
+    ]
+
+
+class GraphLevel:
+    """
+    One level of the graph pyramid. Attribute names match RouteGraphBuilder's base graphs,
+    so route graphs can be built from either.
+    """
+    def __init__(self, index: int, simplification_dist: float, merge_dist: float, level_dir: Path) -> None:
+        self.index = index
+        self.simplification_dist = simplification_dist
+        self.merge_dist = merge_dist
+        self.toll_graph = CSRGraph.from_graph(load_graphml_columns(level_dir / TOLL_GRAPH_FILE_NAME))
+        self.major_ints_graph = CSRGraph.from_graph(load_graphml_columns(level_dir / INTERSECTIONS_FILE_NAME))
+        self.connector_index = ConnectorIndex.load(level_dir / CONNECTORS_FILE_NAME)
+        self.level_mapping = NodeMapping.load(level_dir / LEVEL_MAPPING_FILE_NAME) if index > 0 else None
+
+        self.combined_graph = self.major_ints_graph.compose(self.toll_graph)
+        self.routing_graph = build_routing_graph(self.major_ints_graph, self.toll_graph, self.connector_index)
+        self.route_matcher = MapMatcher(self.routing_graph, split_toll=True)
+        self.major_ints_matcher = MapMatcher(self.major_ints_graph)
+
+
+class GraphPyramid:
+    """
+    Toll and intersection graphs simplified at several tolerances, finest level first.
+    Consecutive levels are linked by level mappings (coarse node -> finer nodes).
+    """
+    def __init__(self, levels: List[GraphLevel], min_route_nodes: int = PYRAMID_MIN_ROUTE_NODES) -> None:
+        self.levels = levels
+        self.min_route_nodes = min_route_nodes
+
+    @staticmethod
+    def exists(pyramid_dir: Path = PYRAMID_DIR) -> bool:
+        return (pyramid_dir / LEVELS_FILE_NAME).exists()
+
+    @classmethod
+    def load(cls, pyramid_dir: Path = PYRAMID_DIR):
+        levels = [
+            GraphLevel(index, info['simplification_dist'], info['merge_dist'], get_level_dir(index, pyramid_dir))
+            for index, info in enumerate(load_levels_info(pyramid_dir))
+        ]
+        return cls(levels)
+
+    def choose_level(self, route_length: float) -> GraphLevel:
+        """The coarsest level that still keeps `min_route_nodes` nodes along a route of this length (m)."""
+        max_spacing = route_length / self.min_route_nodes
+        chosen = self.levels[0]
+        for level in self.levels[1:]:
+            if level.simplification_dist <= max_spacing:
+                chosen = level
+        return chosen
+
+    def get_finer_nodes(self, level_index: int, node: int) -> List[int]:
+        """Nodes of level `level_index - 1` that `node` of level `level_index` stands for."""
+        assert level_index > 0, 'The finest level has no finer nodes'
+        return self.levels[level_index].level_mapping[node]
@@ -0,0 +1,138 @@
+import ast
+import contextlib
+import networkx as nx
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from shapely import wkt
+from typing import Callable, Dict, Iterable
+
+from src.utils.projection import PROJECTED_NODE_DTYPES
+
+GRAPHML_NS = '{http://graphml.graphdrawing.org/xmlns}'
+
+# Attributes the query path reads; everything else in the artifacts is only needed for inspection
+QUERY_NODE_ATTRS = ('x', 'y', 'x_proj', 'y_proj', 'tag')
+QUERY_EDGE_ATTRS = ('length', 'travel_time', 'highway', 'toll')
+
+
+def convert_bool_string(value: str) -> bool:
+    if value not in {'True', 'False'}:
+        raise ValueError(f'Invalid literal for boolean: {value!r}')
+    return value == 'True'
+
+# Same conversions as ox.load_graphml
+GRAPH_DTYPES: Dict[str, Callable] = {'consolidated': convert_bool_string, 'simplified': convert_bool_string}
+NODE_DTYPES: Dict[str, Callable] = {
+    'elevation': float, 'elevation_res': float, 'osmid': int, 'street_count': int, 'x': float, 'y': float,
+    **PROJECTED_NODE_DTYPES
+}
+EDGE_DTYPES: Dict[str, Callable] = {
+    'bearing': float, 'grade': float, 'grade_abs': float, 'length': float, 'oneway': convert_bool_string,
+    'osmid': int, 'reversed': convert_bool_string, 'speed_kph': float, 'travel_time': float
+}
+
+
+class LazyWKT(str):
+    """Unparsed WKT geometry, parsed by LazyGeometryDict on first access."""
+
+
+class LazyGeometryDict(dict):
+    """
+    Edge attribute dict that parses its `geometry` the first time it is read. Overriding
+    __iter__ also makes dict.update take the key-by-key path, so copying an edge's
+    attributes into another graph hands over a parsed geometry.
+    """
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if type(value) is LazyWKT:
+            value = wkt.loads(value)
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __iter__(self):
+        return super().__iter__()
+
+    def items(self):
+        return [(key, self[key]) for key in super().keys()]
+
+    def values(self):
+        return [self[key] for key in super().keys()]
+
+    def pop(self, key, *default):
+        value = super().pop(key, *default)
+        return wkt.loads(value) if type(value) is LazyWKT else value
+
+    def copy(self):
+        return dict(self.items())
+
+
+class LazyGeometryMultiDiGraph(nx.MultiDiGraph):
+    edge_attr_dict_factory = LazyGeometryDict
+
+
+def convert_value(value: str, dtype: Callable | None):
+    # Stringified lists/dicts/sets (e.g. simplified edges' osmid or highway) are evaluated first, as osmnx does
+    if (value.startswith('[') and value.endswith(']')) or (value.startswith('{') and value.endswith('}')):
+        with contextlib.suppress(SyntaxError, ValueError):
+            evaluated = ast.literal_eval(value)
+            if dtype is not None and isinstance(evaluated, list):
+                return [dtype(item) for item in evaluated]
+            return evaluated
+    return value if dtype is None else dtype(value)
+
+def load_graphml_columns(
+    path: Path,
+    node_attrs: Iterable[str] | None = QUERY_NODE_ATTRS,
+    edge_attrs: Iterable[str] | None = QUERY_EDGE_ATTRS,
+    lazy_geometry: bool = True
+) -> nx.MultiDiGraph:
+    """
+    Stream a GraphML artifact written by ox.save_graphml, keeping only the requested node
+    and edge attributes (all of them if None) and converting types like ox.load_graphml.
+    Edge geometries, if requested, are kept as WKT and parsed on first access.
+    """
+    node_attrs = None if node_attrs is None else set(node_attrs)
+    edge_attrs = None if edge_attrs is None else set(edge_attrs)
+    G = LazyGeometryMultiDiGraph() if lazy_geometry else nx.MultiDiGraph()
+
+    keys: Dict[str, tuple] = {}
+    # iterparse keeps every parsed element attached to its parent, so processed nodes and edges
+    # are removed from the graph element to keep only one of them in memory at a time
+    context = ET.iterparse(path, events=('start', 'end'))
+    _, graph_element = next(context)
+    for event, element in context:
+        tag = element.tag.removeprefix(GRAPHML_NS)
+        if event == 'start':
+            if tag == 'graph':
+                graph_element = element
+            continue
+        if tag == 'key':
+            keys[element.get('id')] = (element.get('for'), element.get('attr.name'))
+        elif tag == 'node':
+            data = {}
+            for item in element:
+                _, name = keys[item.get('key')]
+                if node_attrs is None or name in node_attrs:
+                    data[name] = convert_value(item.text or '', NODE_DTYPES.get(name))
+            G.add_node(int(element.get('id')), **data)
+            graph_element.remove(element)
+        elif tag == 'edge':
+            data = {}
+            for item in element:
+                _, name = keys[item.get('key')]
+                if edge_attrs is not None and name not in edge_attrs:
+                    continue
+                if name == 'geometry':
+                    data[name] = LazyWKT(item.text) if lazy_geometry else wkt.loads(item.text)
+                else:
+                    data[name] = convert_value(item.text or '', EDGE_DTYPES.get(name))
+            G.add_edge(int(element.get('source')), int(element.get('target')), key=int(element.get('id', 0)), **data)
+            graph_element.remove(element)
+        elif tag == 'graph':
+            for item in element.findall(f'{GRAPHML_NS}data'):
+                _, name = keys[item.get('key')]
+                G.graph[name] = convert_value(item.text or '', GRAPH_DTYPES.get(name))
+    return G
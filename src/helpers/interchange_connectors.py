@@ -0,0 +1,164 @@
+import json
+import networkx as nx
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+from src.helpers.csr_graph import CSRGraph
+from src.helpers.node_mapping import NodeMapping
+from src.utils.constants import (
+    GRAPH_SIMPLIFICATION_DIST,
+    CONNECTOR_MAX_DIST,
+    CONNECTORS_PER_INTERCHANGE
+)
+from src.utils.get_directories import INTERMEDIATE_RESULTS_DIR
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+CONNECTORS_FILE_NAME = 'interchange_connectors.json'
+
+
+def is_toll_edge(G: nx.MultiDiGraph, u: int, v: int) -> bool:
+    return G.nodes[u].get('tag') == 'toll_route' and G.nodes[v].get('tag') == 'toll_route'
+
+def min_edge_weight(weight: str):
+    def get_weight(u, v, data):
+        return min(edge_data.get(weight, float('inf')) for edge_data in data.values())
+    return get_weight
+
+def get_path_travel_time(G: nx.MultiDiGraph, path: List[int]) -> float:
+    return sum(
+        min(data.get('travel_time', 0.0) for data in G[u][v].values())
+        for u, v in zip(path, path[1:])
+    )
+
+def get_reach(G: nx.MultiDiGraph, sources: Set[int], cutoff: float):
+    distances, paths = nx.multi_source_dijkstra(G, sources, cutoff=cutoff, weight=min_edge_weight('length'))
+    return distances, paths
+
+def get_connector_search_nodes(G: nx.MultiDiGraph, entrance_exit_nodes: Set[int], max_dist: float = CONNECTOR_MAX_DIST) -> Set[int]:
+    """
+    Every node build_interchange_connectors can visit: the toll nodes and the nodes within
+    `max_dist` of an entrance/exit along non-toll edges, in either direction. Connectors
+    built on the subgraph of G induced by these nodes are the same as on G.
+    """
+    non_toll_view = nx.subgraph_view(G, filter_edge=lambda u, v, k: not is_toll_edge(G, u, v))
+    nodes = {node for node, tag in G.nodes(data='tag') if tag == 'toll_route'}
+    for graph in [non_toll_view, non_toll_view.reverse(copy=False)]:
+        nodes.update(nx.multi_source_dijkstra_path_length(graph, entrance_exit_nodes, cutoff=max_dist, weight=min_edge_weight('length')))
+    return nodes
+
+def build_interchange_connectors(
+    G: nx.MultiDiGraph,
+    entrance_exit_nodes: Set[int],
+    simplified_toll_nodes: Set[int],
+    node_mapping: NodeMapping,
+    max_dist: float = CONNECTOR_MAX_DIST,
+    connectors_per_interchange: int = CONNECTORS_PER_INTERCHANGE,
+    toll_reach: float = 2 * GRAPH_SIMPLIFICATION_DIST
+) -> List[Dict]:
+    """
+    Precompute connector edges between the simplified toll graph and the simplified
+    major intersection graph, with real path lengths and free-flow travel times.
+
+    Two multi-source searches are run per direction on the drive graph `G`, or its
+    get_connector_search_nodes subgraph (with `length` and `travel_time` edge attributes):
+      - along toll edges only, from the simplified toll nodes to every entrance/exit
+      - along non-toll edges only, from every entrance/exit to nearby major intersections
+    and joined at the entrance/exit. Exits are searched on `G`, entrances on its reverse.
+    `toll_reach` bounds the toll search, so it should cover the spacing of the simplified toll nodes.
+    """
+    old_to_new = node_mapping.inverse
+    toll_view = nx.subgraph_view(G, filter_edge=lambda u, v, k: is_toll_edge(G, u, v))
+    non_toll_view = nx.subgraph_view(G, filter_edge=lambda u, v, k: not is_toll_edge(G, u, v))
+
+    connectors = []
+    for kind, toll_graph, non_toll_graph in [
+        ('exit', toll_view, non_toll_view),
+        ('entrance', toll_view.reverse(copy=False), non_toll_view.reverse(copy=False))
+    ]:
+        toll_dists, toll_paths = get_reach(toll_graph, simplified_toll_nodes, toll_reach)
+        interchanges = {node for node in entrance_exit_nodes if node in toll_dists}
+        if not interchanges:
+            continue
+        arterial_dists, arterial_paths = get_reach(non_toll_graph, interchanges, max_dist)
+
+        # Best connector per (toll node, simplified intersection), grouped by the interchange it uses
+        best: Dict[Tuple[int, int], Dict] = {}
+        for target, arterial_dist in arterial_dists.items():
+            if target not in old_to_new or G.nodes[target].get('tag') == 'toll_route':
+                continue
+            interchange = arterial_paths[target][0]
+            toll_node = toll_paths[interchange][0]
+            path = toll_paths[interchange] + arterial_paths[target][1:]
+            if kind == 'entrance':
+                path = path[::-1]
+            key = (toll_node, old_to_new[target])
+            length = toll_dists[interchange] + arterial_dist
+            if key in best and best[key]['length'] <= length:
+                continue
+            best[key] = {
+                'kind': kind,
+                'u': toll_node if kind == 'exit' else old_to_new[target],
+                'v': old_to_new[target] if kind == 'exit' else toll_node,
+                'toll_node': toll_node,
+                'intersection_node': old_to_new[target],
+                'interchange': interchange,
+                'length': length,
+                'travel_time': get_path_travel_time(G, path)
+            }
+
+        by_interchange: Dict[int, List[Dict]] = {}
+        for connector in best.values():
+            by_interchange.setdefault(connector['interchange'], []).append(connector)
+        for interchange_connectors in by_interchange.values():
+            interchange_connectors.sort(key=lambda connector: connector['length'])
+            connectors += interchange_connectors[:connectors_per_interchange]
+
+        logger.info(f'\t{kind} connectors: {sum(1 for c in connectors if c["kind"] == kind)} from {len(by_interchange)} interchanges')
+
+    return connectors
+
+def save_interchange_connectors(connectors: List[Dict], path: Path = INTERMEDIATE_RESULTS_DIR / CONNECTORS_FILE_NAME):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(connectors, f, indent=2)
+
+
+class ConnectorIndex:
+    """Lookup of precomputed connector edges by simplified toll node."""
+    def __init__(self, connectors: List[Dict]) -> None:
+        self.connectors = connectors
+        self.by_toll_node: Dict[int, List[Dict]] = {}
+        for connector in connectors:
+            self.by_toll_node.setdefault(connector['toll_node'], []).append(connector)
+
+    @classmethod
+    def load(cls, path: Path = INTERMEDIATE_RESULTS_DIR / CONNECTORS_FILE_NAME):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def get_connectors(self, toll_node: int) -> List[Dict]:
+        return self.by_toll_node.get(toll_node, [])
+
+
+def add_connector_edges(G: CSRGraph, connector_index: ConnectorIndex) -> CSRGraph:
+    """Copy of G (the combined route graph) with the connectors added as edges between toll and intersection nodes."""
+    connectors = connector_index.connectors
+    is_exit = np.array([connector['kind'] == 'exit' for connector in connectors], dtype=bool)
+    toll_nodes = np.array([connector['toll_node'] for connector in connectors], dtype=np.int64)
+    intersection_nodes = np.array([connector['intersection_node'] for connector in connectors], dtype=np.int64)
+    return G.with_edges(
+        np.where(is_exit, toll_nodes, intersection_nodes),
+        np.where(is_exit, intersection_nodes, toll_nodes),
+        {attr: [connector[attr] for connector in connectors] for attr in ['length', 'travel_time']}
+    )
+
+def build_routing_graph(major_ints_graph: CSRGraph, toll_graph: CSRGraph, connector_index: ConnectorIndex) -> CSRGraph:
+    """
+    The graph toll routes are matched and routed over: the intersections off the toll road,
+    the simplified toll chains and the connectors between them. The intersection graph's
+    own copy of the toll road (its motorway nodes) is left out, so toll routes stay on the
+    simplified toll nodes the connectors refer to.
+    """
+    non_toll_ints_graph = major_ints_graph.subgraph(major_ints_graph.node_ids[~major_ints_graph.is_toll])
+    return add_connector_edges(non_toll_ints_graph.compose(toll_graph), connector_index)
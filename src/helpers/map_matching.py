@@ -0,0 +1,176 @@
+import networkx as nx
+import numpy as np
+from typing import Dict, List, Tuple
+
+from src.helpers.csr_graph import CSRGraph, get_reach_path
+from src.helpers.polyline import Polyline
+from src.helpers.spatial_index import NodeSpatialIndex
+from src.utils.constants import (
+    MAP_MATCH_RADIUS,
+    MAP_MATCH_BEAM,
+    MAP_MATCH_SIGMA,
+    MAP_MATCH_BETA,
+    MAP_MATCH_MAX_DETOUR,
+    MAP_MATCH_MAX_SKIP,
+    POLYLINE_SIMPLIFICATION_TOLERANCE,
+    POLYLINE_SAMPLE_SPACING
+)
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+
+class MapMatcher:
+    """
+    HMM map matching of polylines onto a graph's nodes (Newson & Krumm style). Hidden
+    states are the `beam` nearest nodes within `radius` of each reduced polyline point;
+    emissions score the snapping distance, transitions score how much the graph distance
+    between consecutive candidates differs from the distance along the polyline. Viterbi
+    picks the most likely node sequence, which is stitched into connected paths.
+    """
+    def __init__(
+        self,
+        G: CSRGraph,
+        radius: float = MAP_MATCH_RADIUS,
+        beam: int = MAP_MATCH_BEAM,
+        sigma: float = MAP_MATCH_SIGMA,
+        beta: float = MAP_MATCH_BETA,
+        max_detour: float = MAP_MATCH_MAX_DETOUR,
+        max_skip: float = MAP_MATCH_MAX_SKIP,
+        split_toll: bool = False
+    ) -> None:
+        self.graph = G
+        self.snap_index = NodeSpatialIndex(G)
+        # With split_toll, toll nodes are also indexed on their own, so match can be told which points are on the toll road
+        self.toll_snap_index = NodeSpatialIndex(G.subgraph(G.node_ids[G.is_toll])) if split_toll else None
+        self.radius = radius
+        self.beam = beam
+        self.sigma = sigma
+        self.beta = beta
+        self.max_detour = max_detour
+        self.max_skip = max_skip
+
+    def get_candidates(self, xy: np.ndarray, on_toll: np.ndarray | None = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (M, beam) candidate node ids and emission log-likelihoods, -inf where there is no candidate.
+        Where `on_toll` is given, points flagged as on the toll road only get toll node candidates.
+        """
+        nodes, emissions = self.query_candidates(self.snap_index, xy)
+        if on_toll is not None and on_toll.any():
+            assert self.toll_snap_index is not None, 'Matching with on_toll needs split_toll'
+            nodes[on_toll], emissions[on_toll] = self.query_candidates(self.toll_snap_index, xy[on_toll])
+        return nodes, emissions
+
+    def query_candidates(self, snap_index: NodeSpatialIndex, xy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        dists, idxs = snap_index.tree.query(xy, k=self.beam, distance_upper_bound=self.radius)
+        dists, idxs = dists.reshape(len(xy), -1), idxs.reshape(len(xy), -1)
+        valid = np.isfinite(dists)
+        nodes = np.where(valid, snap_index.node_ids[np.minimum(idxs, len(snap_index.node_ids) - 1)], -1)
+        emissions = np.where(valid, -0.5 * (dists / self.sigma) ** 2, -np.inf)
+        return nodes, emissions
+
+    def match(
+        self,
+        polyline: Polyline,
+        on_toll: np.ndarray | None = None,
+        sample_spacing: float | None = POLYLINE_SAMPLE_SPACING
+    ) -> Tuple[List[List[int]], Dict[int, int]]:
+        """
+        Returns the matched node paths and the {polyline_idx: node_id} mapping of their
+        nodes, with indices increasing along the paths. Each path is connected in the graph;
+        there is more than one only where the graph has no path between consecutive matches.
+        `on_toll` optionally flags the polyline points on the toll road, see get_candidates.
+        Only the polyline reduced by Douglas-Peucker and resampled every `sample_spacing`
+        metres is matched (all of its points if None); indices stay into the full polyline.
+        """
+        if sample_spacing is None:
+            point_idxs = np.arange(len(polyline))
+        else:
+            point_idxs = polyline.get_simplified_indices(POLYLINE_SIMPLIFICATION_TOLERANCE, sample_spacing)
+            logger.info(f'\tReduced polyline from {len(polyline)} to {len(point_idxs)} points for matching')
+        xy_full = polyline.project()
+        distance_along = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(xy_full, axis=0).T))])
+
+        nodes, emissions = self.get_candidates(xy_full[point_idxs], None if on_toll is None else on_toll[point_idxs])
+        observed = np.isfinite(emissions).any(axis=1)
+        point_idxs, nodes, emissions = point_idxs[observed], nodes[observed], emissions[observed]
+        if len(point_idxs) == 0:
+            return [], {}
+
+        # Bounded shortest paths from each candidate, shared between steps
+        reach: Dict[int, Tuple[float, Dict[int, float], Dict[int, int]]] = {}
+        def get_reach(node: int, cutoff: float):
+            if node not in reach or reach[node][0] < cutoff:
+                dists, predecessors = self.graph.get_reach(node, cutoff)
+                reach[node] = (cutoff, dists, predecessors)
+            return reach[node]
+
+        # Viterbi over the observed points. A point no candidate of the previous accepted point can
+        # reach is skipped as an outlier (e.g. only the opposite carriageway is in range); after
+        # `max_skip` metres of skipped points the segment is closed and matching restarts.
+        segments = []
+        accepted, scores, backpointers, skipped_from = [0], emissions[0], [], None
+        for t in range(1, len(point_idxs)):
+            prev = accepted[-1]
+            along = distance_along[point_idxs[t]] - distance_along[point_idxs[prev]]
+            cutoff = self.max_detour * along + 2 * self.radius
+            transitions = np.full((self.beam, self.beam), -np.inf)
+            for a in np.flatnonzero(np.isfinite(scores)):
+                _, dists, _ = get_reach(int(nodes[prev, a]), cutoff)
+                for b in np.flatnonzero(nodes[t] >= 0):
+                    dist = dists.get(int(nodes[t, b]))
+                    if dist is not None:
+                        transitions[a, b] = -abs(dist - along) / self.beta
+            totals = scores[:, None] + transitions
+            new_scores = totals.max(axis=0) + emissions[t]
+            if np.isfinite(new_scores).any():
+                accepted.append(t)
+                backpointers.append(totals.argmax(axis=0))
+                scores, skipped_from = new_scores, None
+                continue
+            skipped_from = t if skipped_from is None else skipped_from
+            if distance_along[point_idxs[t]] - distance_along[point_idxs[skipped_from]] > self.max_skip:
+                segments.append((accepted, scores, backpointers))
+                accepted, scores, backpointers, skipped_from = [t], emissions[t], [], None
+        segments.append((accepted, scores, backpointers))
+
+        # Backtrack each segment to the node matched at every accepted point
+        matched: List[Tuple[int, int]] = []
+        for accepted, final_scores, segment_backpointers in segments:
+            state = int(final_scores.argmax())
+            states = [state]
+            for pointers in reversed(segment_backpointers):
+                state = int(pointers[state])
+                states.append(state)
+            states.reverse()
+            matched += [(int(point_idxs[t]), int(nodes[t, state])) for t, state in zip(accepted, states)]
+
+        return self.stitch(matched, get_reach)
+
+    def stitch(self, matched: List[Tuple[int, int]], get_reach) -> Tuple[List[List[int]], Dict[int, int]]:
+        # Position of each matched node among the nodes of all paths
+        paths, point_of_node, n_nodes = [[matched[0][1]]], {0: matched[0][0]}, 1
+        for (_, prev_node), (point_idx, node) in zip(matched, matched[1:]):
+            if node == paths[-1][-1]:
+                continue
+            _, dists, predecessors = get_reach(prev_node, 0)
+            if node in dists:
+                leg = get_reach_path(predecessors, node)[1:]
+            else:
+                try:
+                    leg = self.graph.shortest_path(prev_node, node)[1:]
+                except nx.NetworkXNoPath:
+                    # No edge is made up: the current path ends and a new one starts here
+                    logger.warning(f'Map matching could not connect node {prev_node} to {node}, starting a new path')
+                    paths.append([])
+                    leg = [node]
+            paths[-1] += leg
+            n_nodes += len(leg)
+            point_of_node[n_nodes - 1] = point_idx
+
+        # Nodes filled in between matched points take the next free polyline indices
+        route_nodes, prev_idx = {}, -1
+        for i, node in enumerate(node for path in paths for node in path):
+            point_idx = max(point_of_node.get(i, prev_idx + 1), prev_idx + 1)
+            route_nodes[point_idx] = node
+            prev_idx = point_idx
+        return paths, route_nodes
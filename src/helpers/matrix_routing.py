@@ -0,0 +1,76 @@
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from src.helpers.routing_client import RoutingClient, format_departure_time
+from src.utils.constants import MATRIX_MAX_ORIGINS, MATRIX_MAX_DESTINATIONS, MATRIX_REGION_MARGIN
+
+# (origin, destination, vias), as 'lat,lon' strings like request_route_duration takes them
+Trip = Tuple[str, str, List[str]]
+Leg = Tuple[str, str]
+
+
+def get_legs(trip: Trip) -> List[Leg]:
+    """
+    Consecutive point pairs of a trip, the sections a route request through the same vias
+    is split into. Routed on their own, legs can still differ from those sections: nothing
+    carries the heading through a via, so a leg may start or end in the other direction.
+    """
+    origin, destination, via = trip
+    points = [origin, *via, destination]
+    return list(zip(points[:-1], points[1:]))
+
+def to_matrix_point(point: str) -> Dict[str, float]:
+    lat, lon = point.split(',')[:2]
+    return {'lat': float(lat), 'lng': float(lon)}
+
+def plan_matrix_batches(
+    legs: List[Leg],
+    max_origins: int = MATRIX_MAX_ORIGINS,
+    max_destinations: int = MATRIX_MAX_DESTINATIONS
+) -> List[Tuple[List[str], List[str]]]:
+    """
+    Cover every leg with (origins, destinations) matrices within the request size limits.
+    Origins are taken in chunks; each chunk gets only the destinations its legs need.
+    """
+    destinations_by_origin: Dict[str, List[str]] = {}
+    for origin, destination in legs:
+        destinations = destinations_by_origin.setdefault(origin, [])
+        if destination not in destinations:
+            destinations.append(destination)
+
+    origins = list(destinations_by_origin)
+    batches = []
+    for i in range(0, len(origins), max_origins):
+        origin_chunk = origins[i:i + max_origins]
+        destinations = list(dict.fromkeys(d for origin in origin_chunk for d in destinations_by_origin[origin]))
+        for j in range(0, len(destinations), max_destinations):
+            batches.append((origin_chunk, destinations[j:j + max_destinations]))
+    return batches
+
+def request_matrix(
+    origins: List[str],
+    destinations: List[str],
+    departure_time: datetime,
+    routing_client: RoutingClient,
+    api_key: str | None
+) -> Dict[Leg, float]:
+    """Traffic-aware travel times (s) of every origin/destination cell the matrix could route."""
+    body = {
+        'origins': [to_matrix_point(point) for point in origins],
+        'destinations': [to_matrix_point(point) for point in destinations],
+        'regionDefinition': {'type': 'autoCircle', 'margin': MATRIX_REGION_MARGIN},
+        'departureTime': format_departure_time(departure_time),
+        'transportMode': 'car',
+        'routingMode': 'fast',
+        'matrixAttributes': ['travelTimes']
+    }
+    matrix = routing_client.get_matrix({'async': 'false', 'apiKey': api_key}, body)['matrix']
+    travel_times = np.array(matrix['travelTimes'], dtype=np.float64).reshape(len(origins), len(destinations))
+    error_codes = np.array(matrix.get('errorCodes', np.zeros(travel_times.size)), dtype=np.int64).reshape(travel_times.shape)
+    return {
+        (origin, destination): float(travel_times[i, j])
+        for i, origin in enumerate(origins)
+        for j, destination in enumerate(destinations)
+        if error_codes[i, j] == 0
+    }
@@ -0,0 +1,86 @@
+import numpy as np
+from pathlib import Path
+from typing import Dict, List
+
+
+class NodeMapping:
+    """
+    One-to-many mapping from new (merged) node ids to old node ids, stored CSR style:
+    the old ids of the i-th new node are old_ids[offsets[i]:offsets[i + 1]].
+    Forward and inverse lookups are O(1).
+    """
+    def __init__(self, offsets: np.ndarray, old_ids: np.ndarray, new_ids: np.ndarray | None = None) -> None:
+        self.offsets = offsets
+        self.old_ids = old_ids
+        self.new_ids = np.arange(len(offsets) - 1, dtype=np.int64) if new_ids is None else new_ids
+        # Consolidated graphs number their nodes 0..n-1, so rows can be indexed directly
+        self._contiguous = bool(np.array_equal(self.new_ids, np.arange(len(self.new_ids))))
+        self._rows: Dict[int, int] | None = None
+        self._inverse: Dict[int, int] | None = None
+
+    @classmethod
+    def from_dict(cls, mapping: Dict[int, List[int]]):
+        new_ids = np.array(list(mapping.keys()), dtype=np.int64)
+        counts = np.array([len(old_ids) for old_ids in mapping.values()], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        old_ids = np.array([old_id for old_ids in mapping.values() for old_id in old_ids], dtype=np.int64)
+        return cls(offsets, old_ids, new_ids)
+
+    @classmethod
+    def load(cls, path: Path):
+        with np.load(path) as arrays:
+            return cls(arrays['offsets'], arrays['old_ids'], arrays['new_ids'])
+
+    def save(self, path: Path):
+        np.savez(path, offsets=self.offsets, old_ids=self.old_ids, new_ids=self.new_ids)
+
+    def __getstate__(self):
+        # Lookup dicts are rebuilt lazily, only the arrays are persisted
+        return {'offsets': self.offsets, 'old_ids': self.old_ids, 'new_ids': self.new_ids}
+
+    def __setstate__(self, state):
+        self.__init__(state['offsets'], state['old_ids'], state['new_ids'])
+
+    def __len__(self) -> int:
+        return len(self.new_ids)
+
+    def __contains__(self, new_id: int) -> bool:
+        return self._get_row(new_id) is not None
+
+    def __getitem__(self, new_id: int) -> List[int]:
+        return self.get_old_ids(new_id).tolist()
+
+    def _get_row(self, new_id: int) -> int | None:
+        if self._contiguous:
+            return int(new_id) if 0 <= new_id < len(self.new_ids) else None
+        if self._rows is None:
+            self._rows = dict(zip(self.new_ids.tolist(), range(len(self.new_ids))))
+        return self._rows.get(new_id)
+
+    def get_old_ids(self, new_id: int) -> np.ndarray:
+        row = self._get_row(new_id)
+        if row is None:
+            raise KeyError(new_id)
+        return self.old_ids[self.offsets[row]:self.offsets[row + 1]]
+
+    @property
+    def inverse(self) -> Dict[int, int]:
+        """old id -> new id"""
+        if self._inverse is None:
+            owners = np.repeat(self.new_ids, np.diff(self.offsets))
+            self._inverse = dict(zip(self.old_ids.tolist(), owners.tolist()))
+        return self._inverse
+
+    def get_new_id(self, old_id: int) -> int:
+        return self.inverse[old_id]
+
+    def compose(self, inner: 'NodeMapping') -> 'NodeMapping':
+        """Mapping from this mapping's new ids to `inner`'s old ids, where this mapping's old ids are `inner`'s new ids."""
+        rows = np.array([inner._get_row(old_id) for old_id in self.old_ids.tolist()], dtype=np.int64)
+        counts = np.diff(inner.offsets)[rows]
+        old_ids = np.concatenate([inner.old_ids[inner.offsets[row]:inner.offsets[row + 1]] for row in rows.tolist()] or [np.empty(0, dtype=np.int64)])
+        ends = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return NodeMapping(ends[self.offsets], old_ids, self.new_ids)
+
+    def to_dict(self) -> Dict[int, List[int]]:
+        return {new_id: self[new_id] for new_id in self.new_ids.tolist()}
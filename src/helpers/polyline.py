@@ -0,0 +1,132 @@
+import itertools
+import numpy as np
+import shapely
+import flexpolyline as fpl
+from typing import Dict, List, Tuple
+
+from src.utils.projection import REGION_CRS, project_coords
+
+
+def get_segment_distances(points: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Distance from each of the (N, 2) points to the segment start-end."""
+    segment = end - start
+    segment_length_sq = segment @ segment
+    if segment_length_sq == 0:
+        return np.hypot(*(points - start).T)
+    t = np.clip((points - start) @ segment / segment_length_sq, 0, 1)
+    return np.hypot(*(points - start - t[:, None] * segment).T)
+
+def douglas_peucker_indices(xy: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Sorted indices of the points Douglas-Peucker keeps so that no dropped point is more
+    than `tolerance` from the simplified line. Each span is handled in one numpy pass.
+    """
+    n = len(xy)
+    if n <= 2:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    spans = [(0, n - 1)]
+    while spans:
+        start, end = spans.pop()
+        if end - start < 2:
+            continue
+        dists = get_segment_distances(xy[start + 1:end], xy[start], xy[end])
+        farthest = int(dists.argmax())
+        if dists[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            spans += [(start, split), (split, end)]
+    return np.flatnonzero(keep)
+
+
+class Polyline:
+    """
+    Polyline backed by a contiguous float64 (N, 2) array of (lat, lon) points,
+    the order used by the HERE API and folium.
+    """
+    def __init__(self, coords) -> None:
+        self.coords = np.ascontiguousarray(coords, dtype=np.float64).reshape(-1, 2)
+        self._projected: np.ndarray | None = None
+        self._simplified_indices: Dict[Tuple[float, float | None], np.ndarray] = {}
+
+    @classmethod
+    def from_flexpolyline(cls, encoded: str):
+        # Decode straight into a flat float array, dropping any third dimension
+        width = 2 if fpl.get_third_dimension(encoded) == fpl.ABSENT else 3
+        flat = np.fromiter(itertools.chain.from_iterable(fpl.iter_decode(encoded)), dtype=np.float64)
+        return cls(flat.reshape(-1, width)[:, :2])
+
+    @classmethod
+    def concatenate(cls, polylines: List['Polyline']):
+        return cls(np.concatenate([polyline.coords for polyline in polylines]))
+
+    @property
+    def lat(self) -> np.ndarray:
+        return self.coords[:, 0]
+
+    @property
+    def lon(self) -> np.ndarray:
+        return self.coords[:, 1]
+
+    @property
+    def lonlat(self) -> np.ndarray:
+        """(N, 2) view in (lon, lat) order, as used by shapely and pyproj."""
+        return self.coords[:, ::-1]
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (slice, np.ndarray)):
+            return Polyline(self.coords[idx])
+        lat, lon = self.coords[idx]
+        return float(lat), float(lon)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self) -> List[Tuple[float, float]]:
+        return [(lat, lon) for lat, lon in self.coords.tolist()]
+
+    def to_linestring(self) -> shapely.LineString:
+        return shapely.linestrings(self.lonlat)
+
+    def to_points(self) -> np.ndarray:
+        return shapely.points(self.lonlat)
+
+    def project(self, to_crs: str = REGION_CRS) -> np.ndarray:
+        """(N, 2) array of (x, y) coordinates in `to_crs`. Region projections are cached."""
+        if to_crs != REGION_CRS:
+            return np.column_stack(project_coords(self.lon, self.lat, to_crs))
+        if self._projected is None:
+            self._projected = np.column_stack(project_coords(self.lon, self.lat))
+        return self._projected
+
+    def to_projected_linestring(self) -> shapely.LineString:
+        return shapely.linestrings(self.project())
+
+    def get_simplified_indices(self, tolerance: float, sample_spacing: float | None = None) -> np.ndarray:
+        """
+        Indices of the points kept by Douglas-Peucker with a `tolerance` in metres. With a
+        `sample_spacing`, original points are also kept about every `sample_spacing` metres
+        along the line, so long straight stretches are still sampled densely enough to snap
+        to nearby graph nodes. Results are cached, indices refer to this polyline.
+        """
+        key = (tolerance, sample_spacing)
+        if key not in self._simplified_indices:
+            xy = self.project()
+            indices = douglas_peucker_indices(xy, tolerance)
+            if sample_spacing is not None and len(xy) > 2:
+                distance_along = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(xy, axis=0).T))])
+                sample_distances = np.arange(0, distance_along[-1], sample_spacing)
+                sampled = np.searchsorted(distance_along, sample_distances).clip(max=len(xy) - 1)
+                indices = np.union1d(indices, sampled)
+            self._simplified_indices[key] = indices
+        return self._simplified_indices[key]
+
+    def simplify(self, tolerance: float) -> 'Polyline':
+        indices = self.get_simplified_indices(tolerance)
+        simplified = self[indices]
+        simplified._projected = self.project()[indices]
+        return simplified
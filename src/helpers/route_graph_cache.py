@@ -0,0 +1,105 @@
+import threading
+import networkx as nx
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from src.helpers.polyline import Polyline
+from src.helpers.spatial_index import NodeSpatialIndex
+from src.utils.projection import project_coords
+from src.utils.constants import ROUTE_CACHE_GRID_SIZE, ROUTE_CACHE_MAX_BYTES
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+# Rough per node/edge footprint of a small networkx graph with osmnx attributes
+GRAPH_ELEMENT_BYTES = 600
+
+
+@dataclass
+class CachedRouteGraphs:
+    route_graphs: List[nx.MultiDiGraph]
+    polylines: List[Polyline]
+    route_node_mappings: List[Dict[int, int]]
+    # Seconds it took to fetch and build these route graphs, i.e. what a hit saves
+    build_time: float
+    # Graph pyramid level the route graphs were built from, None for the base graphs
+    level: int | None = None
+
+    @property
+    def size_bytes(self) -> int:
+        graph_bytes = sum(
+            (graph.number_of_nodes() + graph.number_of_edges()) * GRAPH_ELEMENT_BYTES for graph in self.route_graphs
+        )
+        polyline_bytes = sum(polyline.coords.nbytes for polyline in self.polylines)
+        mapping_bytes = sum(len(mapping) * 2 * 64 for mapping in self.route_node_mappings)
+        return graph_bytes + polyline_bytes + mapping_bytes
+
+
+class RouteGraphCache:
+    """
+    LRU memoization of built route graphs for repeat commutes. Keys are the query
+    endpoints quantized to a `grid_size` metre grid and snapped to graph nodes, plus
+    the routing options, so endpoints a few metres apart share an entry.
+    """
+    def __init__(
+        self,
+        snap_index: NodeSpatialIndex,
+        grid_size: float = ROUTE_CACHE_GRID_SIZE,
+        max_bytes: int = ROUTE_CACHE_MAX_BYTES
+    ) -> None:
+        self.snap_index = snap_index
+        self.grid_size = grid_size
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[Tuple, CachedRouteGraphs] = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.time_saved = 0.0
+        self.lock = threading.Lock()
+
+    def get_key(self, origin: Tuple[float, float], destination: Tuple[float, float], options: Dict) -> Tuple:
+        lats, lons = np.array([origin[0], destination[0]]), np.array([origin[1], destination[1]])
+        x, y = project_coords(lons, lats)
+        # Snap the centre of each endpoint's grid cell to the nearest graph node
+        cell_x = (np.floor(x / self.grid_size) + 0.5) * self.grid_size
+        cell_y = (np.floor(y / self.grid_size) + 0.5) * self.grid_size
+        (origin_node, destination_node), _ = self.snap_index.nearest_projected(cell_x, cell_y)
+        return int(origin_node), int(destination_node), tuple(sorted(options.items()))
+
+    def get(self, key: Tuple) -> CachedRouteGraphs | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.time_saved += entry.build_time
+            return entry
+
+    def put(self, key: Tuple, entry: CachedRouteGraphs):
+        for graph in entry.route_graphs:
+            nx.freeze(graph) # Entries are shared between queries
+        size = entry.size_bytes
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.current_bytes -= self.entries.pop(key).size_bytes
+            self.entries[key] = entry
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= evicted.size_bytes
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def log_stats(self):
+        logger.info(
+            f'Route graph cache: {self.hits} hits, {self.misses} misses ({self.hit_rate:.1%} hit rate), '
+            f'{self.time_saved:.2f} s saved, {len(self.entries)} entries, {self.current_bytes / 1024**2:.1f} MB'
+        )
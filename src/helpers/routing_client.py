@@ -0,0 +1,225 @@
+import os
+import random
+import re
+import threading
+import time
+import requests
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Deque, Dict, Tuple
+
+from src.utils.rate_limiter import TokenBucket
+from src.utils.constants import (
+    ROUTING_REQUESTS_PER_SECOND,
+    ROUTING_MAX_RETRIES,
+    ROUTING_BACKOFF_BASE,
+    ROUTING_BACKOFF_MAX,
+    ROUTING_TIMEOUT,
+    ROUTING_MIN_REQUESTS_PER_SECOND,
+    ROUTING_RATE_DECREASE,
+    ROUTING_RATE_INCREASE,
+    ROUTING_WAIT_SAMPLES
+)
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+HERE_ROUTER_BASE_URL = os.getenv('HERE_ROUTER_BASE_URL', 'https://router.hereapi.com')
+HERE_MATRIX_BASE_URL = os.getenv('HERE_MATRIX_BASE_URL', 'https://matrix.router.hereapi.com')
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+API_KEY_PATTERN = re.compile(r'(apiKey=)[^&\s\'"]+')
+
+
+def format_departure_time(departure_time: datetime) -> str:
+    # Minute resolution so concurrent queries for the same trip produce identical requests
+    return departure_time.replace(second=0, microsecond=0).isoformat()
+
+def redact_api_key(text: str) -> str:
+    """Request URLs carry the API key as a query parameter; keep it out of logs and exception text."""
+    return API_KEY_PATTERN.sub(r'\1REDACTED', text)
+
+def get_request_key(method: str, url: str, params: Dict, json_body: Dict | None) -> Tuple:
+    def freeze(value):
+        if isinstance(value, dict):
+            return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+        if isinstance(value, (list, tuple)):
+            return tuple(freeze(item) for item in value)
+        return value
+    return method, url, freeze(params), freeze(json_body)
+
+
+@dataclass
+class RoutingClientMetrics:
+    requests: int = 0
+    deduplicated: int = 0
+    retries: int = 0
+    throttled: int = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    rate: float = 0.0
+    min_rate: float = float('inf')
+    # Only the most recent waits, so long-running processes (e.g. the commute monitor) stay bounded
+    wait_times: Deque[float] = field(default_factory=lambda: deque(maxlen=ROUTING_WAIT_SAMPLES))
+
+    def snapshot(self) -> Dict:
+        waits = sorted(self.wait_times)
+        return {
+            'rate': self.rate,
+            'min_rate': self.min_rate,
+            'requests': self.requests,
+            'deduplicated': self.deduplicated,
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'mean_wait': sum(waits) / len(waits) if waits else 0.0,
+            'max_wait': waits[-1] if waits else 0.0
+        }
+
+
+class RoutingClient:
+    """
+    Call layer for the HERE routing APIs shared by every query in a process:
+      - identical in-flight requests are collapsed into one (single flight)
+      - outbound requests are admitted through a token bucket whose rate adapts (AIMD):
+        halved on every 429, raised a little on every success, up to `requests_per_second`
+      - 429 and 5xx responses are retried with jittered exponential backoff
+    """
+    def __init__(
+        self,
+        base_url: str = HERE_ROUTER_BASE_URL,
+        matrix_base_url: str = HERE_MATRIX_BASE_URL,
+        requests_per_second: float = ROUTING_REQUESTS_PER_SECOND,
+        min_requests_per_second: float = ROUTING_MIN_REQUESTS_PER_SECOND,
+        max_retries: int = ROUTING_MAX_RETRIES,
+        backoff_base: float = ROUTING_BACKOFF_BASE,
+        backoff_max: float = ROUTING_BACKOFF_MAX,
+        timeout: float = ROUTING_TIMEOUT
+    ) -> None:
+        self.base_url = base_url.rstrip('/')
+        self.matrix_base_url = matrix_base_url.rstrip('/')
+        self.limiter = TokenBucket(requests_per_second)
+        self.max_rate = requests_per_second
+        self.min_rate = min(min_requests_per_second, requests_per_second)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.metrics = RoutingClientMetrics(rate=requests_per_second, min_rate=requests_per_second)
+        self.in_flight: Dict[Tuple, Future] = {}
+        self.lock = threading.Lock()
+
+    def get(self, path: str, params: Dict) -> Dict:
+        return self.request('GET', self.base_url + path, params)
+
+    def get_routes(self, params: Dict) -> Dict:
+        return self.get('/v8/routes', params)
+
+    def get_matrix(self, params: Dict, json_body: Dict) -> Dict:
+        return self.request('POST', self.matrix_base_url + '/v8/matrix', params, json_body)
+
+    def request(self, method: str, url: str, params: Dict, json_body: Dict | None = None) -> Dict:
+        key = get_request_key(method, url, params, json_body)
+        with self.lock:
+            future = self.in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self.in_flight[key] = future
+            else:
+                self.metrics.deduplicated += 1
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = self.request_with_retries(method, url, params, json_body)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def request_with_retries(self, method: str, url: str, params: Dict, json_body: Dict | None) -> Dict:
+        for attempt in range(self.max_retries + 1):
+            self.wait_for_token()
+            try:
+                r = requests.request(method, url, params=params, json=json_body, timeout=self.timeout)
+            except requests.RequestException as e:
+                # Connection errors name the full URL too; the original is not chained for the same reason
+                raise type(e)(redact_api_key(str(e)), response=e.response) from None
+            with self.lock:
+                self.metrics.requests += 1
+                if r.status_code == 429:
+                    self.metrics.throttled += 1
+            self.adapt_rate(r.status_code)
+
+            if r.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self.get_backoff(attempt, r.headers.get('Retry-After'))
+                logger.debug(f'{method} {url} returned {r.status_code}, retrying in {delay:.2f} s')
+                with self.lock:
+                    self.metrics.retries += 1
+                time.sleep(delay)
+                continue
+            try:
+                r.raise_for_status()
+            except requests.HTTPError as e:
+                raise requests.HTTPError(redact_api_key(str(e)), response=r) from None
+            return r.json()
+        assert False
+
+    def wait_for_token(self):
+        with self.lock:
+            self.metrics.queue_depth += 1
+            self.metrics.max_queue_depth = max(self.metrics.max_queue_depth, self.metrics.queue_depth)
+        wait = self.limiter.acquire()
+        with self.lock:
+            self.metrics.queue_depth -= 1
+            self.metrics.wait_times.append(wait)
+
+    def adapt_rate(self, status_code: int):
+        with self.lock:
+            if status_code == 429:
+                rate = max(self.min_rate, self.limiter.rate * ROUTING_RATE_DECREASE)
+            elif status_code < 400:
+                rate = min(self.max_rate, self.limiter.rate + ROUTING_RATE_INCREASE)
+            else:
+                return
+            if rate != self.limiter.rate:
+                self.limiter.set_rate(rate)
+                self.metrics.rate = rate
+                self.metrics.min_rate = min(self.metrics.min_rate, rate)
+
+    def get_backoff(self, attempt: int, retry_after: str | None) -> float:
+        # Full jitter, but never sooner than the server asked for, up to backoff_max
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            try:
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            except ValueError:
+                pass
+        return delay
+
+    def log_metrics(self):
+        logger.info(f'Routing client: {self.metrics.snapshot()}')
+
+
+_routing_client: RoutingClient | None = None
+_routing_client_lock = threading.Lock()
+
+def get_routing_client() -> RoutingClient:
+    """Process-wide client, so all queries share one rate limit and in-flight table."""
+    global _routing_client
+    with _routing_client_lock:
+        if _routing_client is None:
+            _routing_client = RoutingClient()
+        return _routing_client
+
+def set_routing_client(routing_client: RoutingClient):
+    global _routing_client
+    with _routing_client_lock:
+        _routing_client = routing_client
@@ -0,0 +1,56 @@
+import numpy as np
+import shapely
+import networkx as nx
+from scipy.spatial import cKDTree
+from typing import Tuple
+
+from src.helpers.csr_graph import CSRGraph
+from src.utils.projection import get_node_coords, project_coords
+
+
+class NodeSpatialIndex:
+    """KD-tree over a graph's node coordinates in the region's projected CRS (metres)."""
+    def __init__(self, G: nx.MultiDiGraph) -> None:
+        # Array-backed graphs (CSRGraph) share their node id array
+        self.node_ids = G.node_ids if hasattr(G, 'node_ids') else np.array(list(G.nodes), dtype=np.int64)
+        self.xy = get_node_coords(G, self.node_ids, projected=True)
+        self.tree = cKDTree(self.xy)
+
+    def __getstate__(self):
+        return {'node_ids': self.node_ids, 'xy': self.xy}
+
+    def __setstate__(self, state):
+        self.node_ids, self.xy = state['node_ids'], state['xy']
+        self.tree = cKDTree(self.xy)
+
+    def nearest_projected(self, x, y) -> Tuple[np.ndarray, np.ndarray]:
+        dists, idxs = self.tree.query(np.column_stack([np.atleast_1d(x), np.atleast_1d(y)]))
+        return self.node_ids[idxs], dists
+
+    def nearest(self, lon, lat) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest node ids and distances (m) for arrays of lon/lat."""
+        return self.nearest_projected(*project_coords(np.atleast_1d(lon), np.atleast_1d(lat)))
+
+
+class EdgeSpatialIndex:
+    """STR-tree over a graph's edges as straight projected segments, for distances to the road itself rather than its nodes."""
+    def __init__(self, G: CSRGraph) -> None:
+        sources, targets, _ = G.get_edge_arrays()
+        xy = get_node_coords(G, G.node_ids, projected=True)
+        self.segments = np.stack([xy[sources], xy[targets]], axis=1)
+        self.tree = shapely.STRtree(shapely.linestrings(self.segments))
+
+    def __getstate__(self):
+        return {'segments': self.segments}
+
+    def __setstate__(self, state):
+        self.segments = state['segments']
+        self.tree = shapely.STRtree(shapely.linestrings(self.segments))
+
+    def within_projected(self, x, y, max_dist: float) -> np.ndarray:
+        """Mask of the points within `max_dist` (m) of any edge."""
+        points = shapely.points(np.column_stack([np.atleast_1d(x), np.atleast_1d(y)]))
+        point_idxs, _ = self.tree.query_nearest(points, max_distance=max_dist, all_matches=False)
+        mask = np.zeros(len(points), dtype=bool)
+        mask[point_idxs] = True
+        return mask
@@ -0,0 +1,73 @@
+import networkx as nx
+import numpy as np
+import shapely
+from typing import List
+
+from src.helpers.csr_graph import CSRGraph
+from src.helpers.polyline import Polyline
+from src.helpers.spatial_index import NodeSpatialIndex
+from src.helpers.interchange_connectors import ConnectorIndex, add_connector_edges
+from src.utils.projection import get_node_coords
+from src.utils.constants import VIA_CORRIDOR_TOLERANCE, POLYLINE_SIMPLIFICATION_TOLERANCE
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+
+def parse_waypoint(waypoint: str):
+    lat, lon = waypoint.split(',')
+    return float(lat), float(lon)
+
+
+class ViaSelector:
+    """
+    Picks the fewest via waypoints that keep a re-routed trip on the original route.
+    The provider's router is approximated by fastest paths on a local graph (the
+    combined route graph plus interchange connectors): a via is only needed where the
+    local fastest path to a later waypoint would leave a `corridor_tolerance` metre
+    corridor around the original polyline, i.e. at the route's decision points.
+    """
+    def __init__(
+        self,
+        G: CSRGraph,
+        connector_index: ConnectorIndex | None = None,
+        corridor_tolerance: float = VIA_CORRIDOR_TOLERANCE
+    ) -> None:
+        self.graph = add_connector_edges(G, connector_index) if connector_index is not None else G
+        self.snap_index = NodeSpatialIndex(self.graph)
+        self.corridor_tolerance = corridor_tolerance
+
+    def is_in_corridor(self, source: int, target: int, corridor: shapely.LineString) -> bool:
+        """Whether every node on the local fastest path from source to target lies within the corridor."""
+        try:
+            path = self.graph.shortest_path(source, target, weight='travel_time')
+        except nx.NetworkXNoPath:
+            return False
+        path_points = shapely.points(get_node_coords(self.graph, path, projected=True))
+        return bool(shapely.distance(path_points, corridor).max() <= self.corridor_tolerance)
+
+    def select_vias(self, waypoints: List[str], polyline: Polyline) -> List[str]:
+        """
+        Greedily skip ahead from each kept waypoint to the farthest later waypoint (or the
+        route's end) still reachable inside the corridor. Waypoint order is preserved.
+        """
+        if not waypoints:
+            return waypoints
+        coords = np.array([polyline[0]] + [parse_waypoint(waypoint) for waypoint in waypoints] + [polyline[-1]])
+        nodes, _ = self.snap_index.nearest(coords[:, 1], coords[:, 0])
+        corridor = polyline.simplify(POLYLINE_SIMPLIFICATION_TOLERANCE).to_projected_linestring()
+
+        # Points are [route start, *waypoints, route end]
+        last = len(nodes) - 1
+        anchor, selected = 0, []
+        while anchor < last:
+            next_anchor = anchor + 1
+            for k in range(anchor + 2, last + 1):
+                if not self.is_in_corridor(nodes[anchor], nodes[k], corridor):
+                    break
+                next_anchor = k
+            if next_anchor != last:
+                selected.append(next_anchor - 1)
+            anchor = next_anchor
+
+        logger.info(f'\tSelected {len(selected)} of {len(waypoints)} vias')
+        return [waypoints[i] for i in selected]
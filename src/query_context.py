@@ -0,0 +1,54 @@
+import networkx as nx
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import List, Tuple, Dict
+
+from src.helpers.matrix_routing import Trip
+from src.helpers.polyline import Polyline
+
+
+def get_toll_savings(durations: List[float]) -> float:
+    """Minutes the toll route (the first) saves over the best non-toll route, nan without alternatives."""
+    if len(durations) < 2:
+        return float('nan')
+    return (min(durations[1:]) - durations[0]) / 60
+
+
+@dataclass
+class QueryContext:
+    """
+    Everything that belongs to a single origin/destination query. Builders only hold
+    read-only base graphs, so queries with separate contexts can run in parallel threads.
+    """
+    origin: Tuple[float, float]
+    destination: Tuple[float, float]
+    departure_time: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    # Graph pyramid level the route graphs are built from, None for the base graphs
+    level: int | None = None
+    route_graphs: List[nx.MultiDiGraph] = field(default_factory=list)
+    polylines: List[Polyline] = field(default_factory=list)
+    # {polyline_idx: base graph node id} per route graph
+    route_node_mappings: List[Dict[int, int]] = field(default_factory=list)
+    connected_graph: nx.MultiDiGraph | None = None
+    connecting_routes: list = field(default_factory=list)
+    waypoints: List[List[str]] = field(default_factory=list)
+    traffic_polylines: List[Polyline] = field(default_factory=list)
+    # Traffic-aware duration (s) per route graph
+    durations: List[float] = field(default_factory=list)
+
+    @property
+    def origin_str(self) -> str:
+        return f'{self.origin[0]},{self.origin[1]}'
+
+    @property
+    def destination_str(self) -> str:
+        return f'{self.destination[0]},{self.destination[1]}'
+
+    @property
+    def trips(self) -> List[Trip]:
+        """One trip per route graph, through its waypoints, as get_batched_durations takes them."""
+        return [(self.origin_str, self.destination_str, waypoints) for waypoints in self.waypoints]
+
+    @property
+    def toll_savings(self) -> float:
+        return get_toll_savings(self.durations)
@@ -0,0 +1,116 @@
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import lru_cache
+from datetime import datetime
+from typing import List, Tuple
+
+from src.build_route_graph import RouteGraphBuilder
+from src.build_traffic_routing_waypoints import TrafficWaypointsBuilder
+from src.builder_snapshot import get_builders
+from src.graph_arena import GraphArena, init_worker, get_worker_builders
+from src.get_connecting_routes import build_connected_graph, get_traffic_aware_durations
+from src.helpers.interchange_connectors import ConnectorIndex
+from src.helpers.via_selection import ViaSelector
+from src.query_context import QueryContext
+
+from src.utils.timer import Timer
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+DEFAULT_QUERY_WORKERS = 8
+
+
+def run_query(
+    route_builder: RouteGraphBuilder,
+    waypoints_builder: TrafficWaypointsBuilder,
+    connector_index: ConnectorIndex,
+    origin: Tuple[float, float],
+    destination: Tuple[float, float],
+    departure_time: datetime | None = None,
+    via_selector: ViaSelector | None = None
+) -> QueryContext:
+    context = route_builder.build_query_context(origin[0], origin[1], destination[0], destination[1], departure_time)
+    # Connectors join the simplified nodes of the graphs the route graphs were built from
+    level = route_builder.get_level(context.level)
+    context.connected_graph, context.connecting_routes = build_connected_graph(
+        context.route_graphs, origin, destination, connector_index if level is None else level.connector_index
+    )
+    context.waypoints = waypoints_builder.build_waypoints(
+        context.route_graphs, context.polylines, context.route_node_mappings, via_selector, context.level
+    )
+    context.traffic_polylines, context.durations = get_traffic_aware_durations(
+        context.route_graphs,
+        context.connecting_routes,
+        origin,
+        destination,
+        context.polylines,
+        context.route_node_mappings,
+        departure_time=context.departure_time,
+        waypoints=context.waypoints
+    )
+    return context
+
+def run_queries_parallel(
+    od_pairs: List[Tuple[Tuple[float, float], Tuple[float, float]]],
+    route_builder: RouteGraphBuilder | None = None,
+    waypoints_builder: TrafficWaypointsBuilder | None = None,
+    connector_index: ConnectorIndex | None = None,
+    max_workers: int = DEFAULT_QUERY_WORKERS,
+    minimize_vias: bool = True
+) -> List[QueryContext]:
+    """
+    Run many queries in one process. The builders and connector index are loaded once
+    and shared read-only; each query keeps its state in its own QueryContext, so the
+    threads only overlap their HTTP waits.
+    """
+    if route_builder is None and waypoints_builder is None and connector_index is None:
+        route_builder, waypoints_builder, connector_index = get_builders()
+    route_builder = route_builder or RouteGraphBuilder()
+    waypoints_builder = waypoints_builder or TrafficWaypointsBuilder()
+    connector_index = connector_index or ConnectorIndex.load()
+    via_selector = ViaSelector(route_builder.routing_graph) if minimize_vias else None
+
+    with Timer(f'Running {len(od_pairs)} queries', f'Ran {len(od_pairs)} queries'):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(run_query, route_builder, waypoints_builder, connector_index, origin, destination, None, via_selector)
+                for origin, destination in od_pairs
+            ]
+            return [future.result() for future in futures]
+
+@lru_cache(maxsize=None)
+def get_worker_via_selector() -> ViaSelector:
+    route_builder, _, _ = get_worker_builders()
+    return ViaSelector(route_builder.routing_graph)
+
+def run_worker_query(origin: Tuple[float, float], destination: Tuple[float, float], minimize_vias: bool) -> QueryContext:
+    route_builder, waypoints_builder, connector_index = get_worker_builders()
+    via_selector = get_worker_via_selector() if minimize_vias else None
+    return run_query(route_builder, waypoints_builder, connector_index, origin, destination, None, via_selector)
+
+def run_queries_in_processes(
+    od_pairs: List[Tuple[Tuple[float, float], Tuple[float, float]]],
+    route_builder: RouteGraphBuilder | None = None,
+    waypoints_builder: TrafficWaypointsBuilder | None = None,
+    connector_index: ConnectorIndex | None = None,
+    max_workers: int = DEFAULT_QUERY_WORKERS,
+    minimize_vias: bool = True
+) -> List[QueryContext]:
+    """
+    Like run_queries_parallel, but across worker processes. The builders are placed in a
+    shared-memory GraphArena once; each worker attaches to it instead of loading the
+    intermediate results itself.
+    """
+    if route_builder is None and waypoints_builder is None and connector_index is None:
+        route_builder, waypoints_builder, connector_index = get_builders()
+
+    with GraphArena.create(route_builder, waypoints_builder, connector_index) as arena:
+        with Timer(f'Running {len(od_pairs)} queries in processes', f'Ran {len(od_pairs)} queries in processes'):
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+                initargs=(arena.manifest,)
+            ) as executor:
+                futures = [executor.submit(run_worker_query, origin, destination, minimize_vias) for origin, destination in od_pairs]
+                return [future.result() for future in futures]
@@ -1,2 +1,84 @@
 GRAPH_SIMPLIFICATION_DIST = 5_000
-GRAPH_TO_PLINE_MAPPING_DIST = 100
\ No newline at end of file
+
+# Highway refs treated as directed toll/highway corridors
+TOLL_HIGHWAY_REFS = ('407', '412', '418')
+# Chains shorter than this (ramps, stubs left after walking a corridor) are dropped
+MIN_CHAIN_LENGTH = 2_000
+
+# Search radius (m) from a toll entrance/exit to the major intersections it connects to
+CONNECTOR_MAX_DIST = 3_000
+# Nearest simplified intersections kept per toll entrance/exit
+CONNECTORS_PER_INTERCHANGE = 3
+
+# Route graph memoization: endpoint quantization grid (m) and memory cap (bytes)
+ROUTE_CACHE_GRID_SIZE = 100
+ROUTE_CACHE_MAX_BYTES = 256 * 1024**2
+
+# Departure-time sweep defaults
+SWEEP_INTERVAL_MINUTES = 15
+SWEEP_MAX_WORKERS = 8
+
+# Outbound routing calls: rate limit, retries with jittered backoff (s), request timeout (s)
+ROUTING_REQUESTS_PER_SECOND = 10
+ROUTING_MAX_RETRIES = 4
+ROUTING_BACKOFF_BASE = 0.5
+ROUTING_BACKOFF_MAX = 8
+ROUTING_TIMEOUT = 30
+# Adaptive rate (AIMD): floor (requests/s), factor applied on 429 and increase (requests/s) per success
+ROUTING_MIN_REQUESTS_PER_SECOND = 1
+ROUTING_RATE_DECREASE = 0.5
+ROUTING_RATE_INCREASE = 0.1
+# Recent limiter waits kept for the metrics
+ROUTING_WAIT_SAMPLES = 1000
+
+# Peak RSS (MB) allowed per staged preprocessing stage, and how often (s) it is checked while a stage runs
+PREPROCESSING_MEMORY_BUDGET_MB = 4_096
+MEMORY_POLL_INTERVAL = 0.05
+
+# Polyline reduction before snapping and closest-point work: Douglas-Peucker tolerance (m)
+# and the maximum spacing (m) between points kept for snapping to graph nodes
+POLYLINE_SIMPLIFICATION_TOLERANCE = 5
+POLYLINE_SAMPLE_SPACING = 25
+
+# Maximum distance (m) a local fastest path between kept vias may stray from the original route
+VIA_CORRIDOR_TOLERANCE = 250
+
+# Local alternative routes (penalty method): number of alternatives, edge penalty per reuse,
+# maximum shared length fraction between alternatives and maximum travel time relative to the fastest
+ALTERNATIVE_COUNT = 3
+ALTERNATIVE_PENALTY_FACTOR = 1.4
+ALTERNATIVE_MAX_OVERLAP = 0.6
+ALTERNATIVE_MAX_STRETCH = 1.5
+
+# HMM map matching: candidate search radius (m), candidates kept per point (beam), GPS-style
+# emission noise (m), transition scale (m), maximum route/along-polyline distance ratio and
+# distance (m) of unreachable points skipped before matching restarts
+MAP_MATCH_RADIUS = 100
+MAP_MATCH_BEAM = 5
+MAP_MATCH_SIGMA = 20
+MAP_MATCH_BETA = 50
+MAP_MATCH_MAX_DETOUR = 2
+MAP_MATCH_MAX_SKIP = 500
+# A toll route is on the toll road where its polyline stays within MAP_MATCH_RADIUS of it for at least this long (m)
+MAP_MATCH_MIN_TOLL_RUN = 1_000
+
+# Commute monitor: seconds between duration re-queries, +/- fraction of random jitter on that
+# interval, and the toll savings (min) above which the toll route is reported as worth it
+MONITOR_INTERVAL_SECONDS = 300
+MONITOR_JITTER = 0.2
+MONITOR_SAVINGS_THRESHOLD_MIN = 5
+
+# Batched traffic evaluation: origins and destinations per synchronous HERE matrix request,
+# margin (m) of the matrix's auto circle region and concurrent single requests in the fallback
+MATRIX_MAX_ORIGINS = 15
+MATRIX_MAX_DESTINATIONS = 100
+MATRIX_REGION_MARGIN = 10_000
+MATRIX_FALLBACK_WORKERS = 8
+
+# Graph pyramid levels, finest first: chain simplification distance (m) and intersection merge
+# distance (m); each level's intersections are merged from the previous level's. Merge distances
+# stay small because merging chains every node within 2x the distance, e.g. along whole arterials.
+# A query uses the coarsest level whose simplification distance still gives its route
+# PYRAMID_MIN_ROUTE_NODES nodes
+PYRAMID_LEVELS = ((1_000, 25), (GRAPH_SIMPLIFICATION_DIST, 50), (15_000, 75))
+PYRAMID_MIN_ROUTE_NODES = 6
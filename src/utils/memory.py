@@ -0,0 +1,131 @@
+import gc
+import os
+import resource
+import signal
+import sys
+import threading
+from typing import List
+
+from src.utils.constants import MEMORY_POLL_INTERVAL
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+MB = 1024**2
+
+
+def read_proc_status(field: str) -> int | None:
+    """Value of a /proc/self/status field in bytes, or None where procfs is unavailable."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def get_current_rss() -> int:
+    rss = read_proc_status('VmRSS')
+    return rss if rss is not None else get_peak_rss()
+
+def get_peak_rss() -> int:
+    peak = read_proc_status('VmHWM')
+    if peak is not None:
+        return peak
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024 # kB on Linux, bytes on macOS
+
+def reset_peak_rss() -> bool:
+    """Reset the process high-water mark to the current RSS (Linux only). Returns whether it worked."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def read_smaps_rollup(fields: List[str]) -> int | None:
+    """Sum of /proc/self/smaps_rollup fields in bytes, or None where it is unavailable."""
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            return sum(int(line.split()[1]) * 1024 for line in f if line.split(':')[0] in fields)
+    except OSError:
+        return None
+
+def get_private_memory() -> int:
+    """Memory only this process maps (USS). Shared-memory pages another process also touched are excluded."""
+    private = read_smaps_rollup(['Private_Clean', 'Private_Dirty'])
+    return private if private is not None else get_current_rss()
+
+
+class MemoryBudgetExceeded(MemoryError):
+    pass
+
+
+class PeakMemory:
+    """
+    Context manager reporting the peak RSS reached inside the block. With a budget, the
+    block is not started if RSS is already over it, and a watchdog thread polls RSS while
+    it runs: crossing the budget interrupts the main thread with MemoryBudgetExceeded.
+    Elsewhere than the main thread, or for spikes shorter than the poll interval, the
+    budget is only checked once the block has finished.
+    Where the high-water mark cannot be reset, the reported peak is the process-wide peak.
+    """
+    def __init__(self, name: str, budget_bytes: int | None = None, poll_interval: float = MEMORY_POLL_INTERVAL) -> None:
+        self.name = name
+        self.budget_bytes = budget_bytes
+        self.poll_interval = poll_interval
+        self.start_rss = 0
+        self.peak_rss = 0
+        self.exceeded_rss = 0
+        self.stopped = threading.Event()
+        self.watchdog: threading.Thread | None = None
+        self.previous_handler = None
+
+    def get_budget_error(self, rss: int) -> MemoryBudgetExceeded:
+        return MemoryBudgetExceeded(
+            f'{self.name} reached {rss / MB:.0f} MB, over the {self.budget_bytes / MB:.0f} MB budget'
+        )
+
+    def __enter__(self):
+        gc.collect()
+        self.is_reset = reset_peak_rss()
+        self.start_rss = get_current_rss()
+        if self.budget_bytes is None:
+            return self
+        if self.start_rss > self.budget_bytes:
+            raise self.get_budget_error(self.start_rss)
+        if threading.current_thread() is threading.main_thread() and hasattr(signal, 'SIGUSR1'):
+            self.previous_handler = signal.signal(signal.SIGUSR1, self.on_budget_exceeded)
+            self.watchdog = threading.Thread(target=self.watch, daemon=True)
+            self.watchdog.start()
+        return self
+
+    def watch(self):
+        while not self.stopped.wait(self.poll_interval):
+            rss = get_current_rss()
+            if rss > self.budget_bytes:
+                self.exceeded_rss = rss
+                os.kill(os.getpid(), signal.SIGUSR1)
+                return
+
+    def on_budget_exceeded(self, signum, frame):
+        if not self.stopped.is_set():
+            raise self.get_budget_error(self.exceeded_rss)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stopped.set()
+        if self.watchdog is not None:
+            self.watchdog.join()
+            signal.signal(signal.SIGUSR1, self.previous_handler)
+        self.peak_rss = get_peak_rss()
+        gc.collect()
+        scope = '' if self.is_reset else ' (process-wide)'
+        logger.info(
+            f'{self.name}: peak RSS {self.peak_rss / MB:.0f} MB{scope}, '
+            f'started at {self.start_rss / MB:.0f} MB, ended at {get_current_rss() / MB:.0f} MB'
+        )
+        if exc_type is None and self.budget_bytes is not None and self.peak_rss > self.budget_bytes:
+            raise MemoryBudgetExceeded(
+                f'{self.name} peaked at {self.peak_rss / MB:.0f} MB, over the {self.budget_bytes / MB:.0f} MB budget'
+            )
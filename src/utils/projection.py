@@ -0,0 +1,61 @@
+import numpy as np
+import pyproj
+import networkx as nx
+from functools import lru_cache
+from typing import Iterable, Tuple
+
+LATLON_CRS = 'EPSG:4326'
+# UTM zone 17N covers the whole GTA
+REGION_CRS = 'EPSG:32617'
+# Projected node coordinate attributes kept alongside x/y, and their types for ox.load_graphml
+PROJECTED_NODE_DTYPES = {'x_proj': float, 'y_proj': float}
+
+
+@lru_cache(maxsize=None)
+def get_transformer(from_crs: str = LATLON_CRS, to_crs: str = REGION_CRS) -> pyproj.Transformer:
+    return pyproj.Transformer.from_crs(from_crs, to_crs, always_xy=True)
+
+def project_coords(lon, lat, to_crs: str = REGION_CRS) -> Tuple[np.ndarray, np.ndarray]:
+    x, y = get_transformer(LATLON_CRS, to_crs).transform(np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+    return np.asarray(x), np.asarray(y)
+
+def unproject_coords(x, y, from_crs: str = REGION_CRS) -> Tuple[np.ndarray, np.ndarray]:
+    lon, lat = get_transformer(from_crs, LATLON_CRS).transform(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+    return np.asarray(lon), np.asarray(lat)
+
+def get_node_coords(G: nx.MultiDiGraph, nodes: Iterable[int] | None = None, projected: bool = False) -> np.ndarray:
+    """(N, 2) array of node (x, y), in lon/lat or in REGION_CRS metres."""
+    if hasattr(G, 'get_coords'):
+        # Array-backed graphs (CSRGraph) look the coordinates up in bulk
+        return G.get_coords(nodes, projected)
+    nodes = list(G.nodes) if nodes is None else list(nodes)
+    if projected and all('x_proj' in G.nodes[node] for node in nodes):
+        return np.array([(G.nodes[node]['x_proj'], G.nodes[node]['y_proj']) for node in nodes], dtype=np.float64).reshape(-1, 2)
+    coords = np.array([(G.nodes[node]['x'], G.nodes[node]['y']) for node in nodes], dtype=np.float64).reshape(-1, 2)
+    if projected:
+        return np.column_stack(project_coords(coords[:, 0], coords[:, 1]))
+    return coords
+
+def add_projected_coords(G: nx.MultiDiGraph) -> nx.MultiDiGraph:
+    """Store REGION_CRS coordinates of every node as x_proj/y_proj, projected in one call."""
+    nodes = list(G.nodes)
+    coords = get_node_coords(G, nodes)
+    x, y = project_coords(coords[:, 0], coords[:, 1])
+    nx.set_node_attributes(G, dict(zip(nodes, x.tolist())), 'x_proj')
+    nx.set_node_attributes(G, dict(zip(nodes, y.tolist())), 'y_proj')
+    return G
+
+def project_graph_nodes(G: nx.MultiDiGraph) -> nx.MultiDiGraph:
+    """
+    Copy of G with node x/y in REGION_CRS. Unlike ox.project_graph, edge geometries
+    are dropped rather than projected; osmnx rebuilds straight ones when needed.
+    """
+    G_proj = G.copy()
+    nodes = list(G_proj.nodes)
+    coords = get_node_coords(G_proj, nodes, projected=True)
+    nx.set_node_attributes(G_proj, dict(zip(nodes, coords[:, 0].tolist())), 'x')
+    nx.set_node_attributes(G_proj, dict(zip(nodes, coords[:, 1].tolist())), 'y')
+    for _, _, data in G_proj.edges(data=True):
+        data.pop('geometry', None)
+    G_proj.graph['crs'] = REGION_CRS
+    return G_proj
@@ -0,0 +1,39 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `acquire` reserves a token and sleeps until it is
+    available, so callers are admitted at no more than `rate` per second with
+    bursts of up to `capacity`.
+    """
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, returning how long (s) the caller must wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def set_rate(self, rate: float):
+        """Change the refill rate; tokens accrued so far are kept, the burst capacity is not changed."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.rate = rate
+
+    def acquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
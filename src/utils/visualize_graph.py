@@ -5,6 +5,8 @@ from folium import plugins
 import networkx as nx
 import time
 
+from src.helpers.polyline import Polyline
+
 def setup_folium_graph(G: nx.MultiDiGraph):
     center_lat = sum(node['y'] for node in G.nodes.values()) / len(G)
     center_lon = sum(node['x'] for node in G.nodes.values()) / len(G)
@@ -53,3 +55,7 @@ def visualize_graph(G: nx.MultiDiGraph, map: folium.Map, node_colour, show_edges
                 ).add_to(map)
     
     return map
+
+def visualize_polyline(polyline: Polyline, map: folium.Map, colour, weight=3, opacity=0.8):
+    folium.PolyLine(polyline.coords.tolist(), color=colour, weight=weight, opacity=opacity).add_to(map)
+    return map
@@ -0,0 +1,150 @@
+import json
+import math
+import threading
+import time
+import flexpolyline
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Tuple
+from urllib.parse import urlparse, parse_qs
+
+# Free-flow speed (m/s) used to turn straight-line distances into durations
+STUB_SPEED = 20
+
+
+def parse_latlon(value: str) -> Tuple[float, float]:
+    lat, lon = value.split(',')[:2]
+    return float(lat), float(lon)
+
+def get_distance(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6_371_000 * math.asin(math.sqrt(h))
+
+
+class StubHereServer:
+    """
+    Offline stand-in for the HERE routing API. Routes are straight lines through
+    origin, via points and destination. Every `throttle_every`-th request is answered
+    with 429 and every `fail_every`-th with 503, to exercise the client's retries.
+    `duration_factor`, if set, scales a route's durations given its points, to simulate traffic.
+    POST /v8/matrix answers straight-line travel times, or 404 without `matrix_enabled`.
+    """
+    def __init__(
+        self,
+        latency: float = 0.05,
+        throttle_every: int = 0,
+        fail_every: int = 0,
+        retry_after: float = 0.1,
+        duration_factor: Callable[[List[Tuple[float, float]]], float] | None = None,
+        matrix_enabled: bool = True
+    ) -> None:
+        self.latency = latency
+        self.duration_factor = duration_factor
+        self.matrix_enabled = matrix_enabled
+        self.throttle_every = throttle_every
+        self.fail_every = fail_every
+        self.retry_after = retry_after
+        self.request_count = 0
+        self.status_counts = Counter()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.get_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def next_status(self) -> int:
+        with self.lock:
+            self.request_count += 1
+            n = self.request_count
+            if self.throttle_every and n % self.throttle_every == 0:
+                status = 429
+            elif self.fail_every and n % self.fail_every == 0:
+                status = 503
+            else:
+                status = 200
+            self.status_counts[status] += 1
+            return status
+
+    def get_routes(self, query) -> dict:
+        points = [parse_latlon(query['origin'][0])]
+        points += [parse_latlon(via) for via in query.get('via', [])]
+        points.append(parse_latlon(query['destination'][0]))
+        factor = self.duration_factor(points) if self.duration_factor is not None else 1
+        sections = []
+        for a, b in zip(points[:-1], points[1:]):
+            length = get_distance(a, b)
+            sections.append({
+                'polyline': flexpolyline.encode([a, b]),
+                'summary': {'duration': round(factor * length / STUB_SPEED), 'length': round(length)}
+            })
+        return {'routes': [{'sections': sections}]}
+
+    def get_matrix(self, body: dict) -> dict:
+        origins = [(point['lat'], point['lng']) for point in body['origins']]
+        destinations = [(point['lat'], point['lng']) for point in body['destinations']]
+        travel_times = []
+        for a in origins:
+            for b in destinations:
+                factor = self.duration_factor([a, b]) if self.duration_factor is not None else 1
+                travel_times.append(round(factor * get_distance(a, b) / STUB_SPEED))
+        return {'matrix': {
+            'numOrigins': len(origins),
+            'numDestinations': len(destinations),
+            'travelTimes': travel_times,
+            'errorCodes': [0] * len(travel_times)
+        }}
+
+    def get_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                time.sleep(stub.latency)
+                status = stub.next_status()
+                if status != 200:
+                    self.send_json(status, {'error': 'stub'}, {'Retry-After': str(stub.retry_after)} if status == 429 else {})
+                    return
+                if url.path != '/v8/routes':
+                    self.send_json(404, {'error': f'Unknown path {url.path}'})
+                    return
+                self.send_json(200, stub.get_routes(parse_qs(url.query)))
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                time.sleep(stub.latency)
+                status = stub.next_status()
+                if status != 200:
+                    self.send_json(status, {'error': 'stub'}, {'Retry-After': str(stub.retry_after)} if status == 429 else {})
+                    return
+                if url.path != '/v8/matrix' or not stub.matrix_enabled:
+                    self.send_json(404, {'error': f'Unknown path {url.path}'})
+                    return
+                self.send_json(200, stub.get_matrix(body))
+
+            def send_json(self, status: int, body: dict, headers: dict = {}):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
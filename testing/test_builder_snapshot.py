@@ -0,0 +1,40 @@
+import time
+import numpy as np
+
+from src.builder_snapshot import MIN_MMAP_BYTES, save_builder_snapshot, load_builder_snapshot
+from src.build_route_graph import RouteGraphBuilder
+from src.build_traffic_routing_waypoints import TrafficWaypointsBuilder
+from src.helpers.interchange_connectors import ConnectorIndex
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+# Restoring must take at most this fraction of initializing the builders from intermediate results
+MAX_RESTORE_FRACTION = 0.25
+
+def test_builder_snapshot():
+    start_time = time.time()
+    route_builder, waypoints_builder, connector_index = RouteGraphBuilder(), TrafficWaypointsBuilder(), ConnectorIndex.load()
+    init_time = time.time() - start_time
+    save_builder_snapshot(route_builder, waypoints_builder, connector_index)
+
+    start_time = time.time()
+    restored_route_builder, restored_waypoints_builder, restored_connector_index = load_builder_snapshot()
+    restore_time = time.time() - start_time
+    logger.info(f'Initializing builders: {init_time:.2f} s, restoring snapshot: {restore_time:.2f} s')
+
+    assert restored_route_builder.combined_graph.number_of_edges() == route_builder.combined_graph.number_of_edges()
+    assert restored_route_builder.routing_graph.number_of_edges() == route_builder.routing_graph.number_of_edges()
+    assert np.array_equal(restored_route_builder.route_graph_cache.snap_index.xy, route_builder.route_graph_cache.snap_index.xy)
+    assert np.array_equal(restored_waypoints_builder.int_simp_mapping.old_ids, waypoints_builder.int_simp_mapping.old_ids)
+    assert len(restored_connector_index.connectors) == len(connector_index.connectors)
+    # Graphs come back as memory-mapped arrays rather than being rebuilt
+    for graph in [restored_route_builder.combined_graph, restored_waypoints_builder.major_ints_graph]:
+        arrays = [graph.node_ids, graph.x_proj, graph.indptr, graph.indices, graph.length, graph.travel_time]
+        assert all(isinstance(array, np.memmap) for array in arrays if array.nbytes >= MIN_MMAP_BYTES)
+    assert restored_route_builder.route_matcher.snap_index.node_ids is restored_route_builder.routing_graph.node_ids
+    assert restore_time <= MAX_RESTORE_FRACTION * init_time, f'Restoring took {restore_time:.2f} s of {init_time:.2f} s'
+    return restore_time
+
+
+if __name__ == '__main__':
+    test_builder_snapshot()
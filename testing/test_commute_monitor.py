@@ -0,0 +1,46 @@
+import asyncio
+
+from src.commute_monitor import CommuteEvent, CommuteMonitor
+from src.helpers.routing_client import RoutingClient
+from src.query_context import QueryContext
+from testing.stub_here_server import StubHereServer
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+def run_commute_monitor():
+    """Polls a stubbed commute whose toll route congests once worth it; returns the events and the answered polls."""
+    origin = 43.393262, -79.802492  # Appleby Line entrance
+    destination = 43.841385, -79.306418  # Kennedy Rd exit
+    # Toll route goes straight; the non-toll alternative detours inland
+    context = QueryContext(origin, destination)
+    context.waypoints = [[], ['43.700000,-79.700000']]
+
+    # Congestion on the toll route, raised once the monitor reports the toll route worth it
+    congestion = {'toll': 1.0}
+
+    # Polls price the legs of every route; the toll route's only leg goes straight from origin to destination
+    def duration_factor(points) -> float:
+        return congestion['toll'] if points == [origin, destination] else 1.0
+
+    def on_event(event: CommuteEvent):
+        if event.toll_worth_it:
+            congestion['toll'] = 2.0
+
+    with StubHereServer(latency=0.01, duration_factor=duration_factor) as stub:
+        client = RoutingClient(base_url=stub.base_url, matrix_base_url=stub.base_url)
+        monitor = CommuteMonitor(context, threshold_min=5, interval=0.05, jitter=0.2, routing_client=client, on_event=on_event)
+        events = asyncio.run(monitor.run(max_polls=4))
+    return events, stub.status_counts[200]
+
+
+def test_commute_monitor():
+    events, n_answered = run_commute_monitor()
+    for event in events:
+        logger.info(f'{event.time:%H:%M:%S.%f}: toll saves {event.toll_savings:.1f} min, worth it: {event.toll_worth_it}')
+    assert [event.toll_worth_it for event in events] == [True, False]
+    # One matrix request per poll covers every route
+    assert n_answered == 4
+
+
+if __name__ == '__main__':
+    test_commute_monitor()
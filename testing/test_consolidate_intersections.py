@@ -0,0 +1,46 @@
+import numpy as np
+import osmnx as ox
+
+from src.helpers.consolidate_intersections import consolidate_nodes
+from src.utils.projection import PROJECTED_NODE_DTYPES, project_graph_nodes
+from src.utils.timer import Timer
+from src.utils.get_directories import INTERMEDIATE_RESULTS_DIR
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+def get_clusters(G, projected_attrs):
+    x_attr, y_attr = ('x_proj', 'y_proj') if projected_attrs else ('x', 'y')
+    clusters = {}
+    for _, data in G.nodes(data=True):
+        original_ids = data['osmid_original']
+        original_ids = original_ids if isinstance(original_ids, list) else [original_ids]
+        clusters[frozenset(original_ids)] = (data[x_attr], data[y_attr])
+    return clusters
+
+def test_consolidate_intersections(merge_dist=50):
+    major_int_graph = ox.load_graphml(INTERMEDIATE_RESULTS_DIR / 'major_intersections.graphml', node_dtypes=PROJECTED_NODE_DTYPES)
+
+    with Timer('Consolidating intersections with osmnx', 'Consolidated intersections with osmnx'):
+        osmnx_graph = ox.simplification.consolidate_intersections(project_graph_nodes(major_int_graph), tolerance=merge_dist)
+    with Timer('Consolidating intersections with radius-neighbour clustering', 'Consolidated intersections with radius-neighbour clustering'):
+        custom_graph, offsets, old_ids = consolidate_nodes(major_int_graph, merge_dist)
+
+    osmnx_clusters = get_clusters(osmnx_graph, projected_attrs=False)
+    custom_clusters = get_clusters(custom_graph, projected_attrs=True)
+    common = set(osmnx_clusters) & set(custom_clusters)
+    centroid_diffs = [np.hypot(*np.subtract(osmnx_clusters[c], custom_clusters[c])) for c in common]
+
+    logger.info(f'osmnx nodes: {len(osmnx_graph)}, custom nodes: {len(custom_graph)}')
+    logger.info(f'Identical clusters: {len(common)} / {len(osmnx_clusters)}')
+    logger.info(f'Max centroid difference: {max(centroid_diffs)} m')
+
+    # Dead ends are discarded, as osmnx does
+    n_intersections = sum(1 for _, count in major_int_graph.nodes(data='street_count') if count > 1)
+    assert len(offsets) == len(custom_graph) + 1 and len(old_ids) == n_intersections
+    assert len(common) == len(osmnx_clusters) == len(custom_clusters)
+    # osmnx uses the centroid of the merged buffers, we use the mean of the merged nodes
+    assert max(centroid_diffs) <= merge_dist
+
+
+if __name__ == '__main__':
+    test_consolidate_intersections()
@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from src.departure_time_sweep import get_departure_times, run_departure_time_sweep
+from src.utils.get_directories import TEST_OUTPUTS_FOLDER
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+def test_departure_time_sweep():
+    origin = 43.393262, -79.802492  # Appleby Line entrance
+    destination = 43.841385, -79.306418  # Kennedy Rd exit
+
+    tomorrow = datetime.now(ZoneInfo('America/Toronto')).date() + timedelta(days=1)
+    start = datetime(tomorrow.year, tomorrow.month, tomorrow.day, 6, tzinfo=ZoneInfo('America/Toronto'))
+    departure_times = get_departure_times(start, start + timedelta(hours=14))
+
+    table = run_departure_time_sweep(origin, destination, departure_times)
+    assert len(table) == len(departure_times)
+
+    logger.info(f'\n{table.to_string(index=False)}')
+    table.to_csv(TEST_OUTPUTS_FOLDER / 'departure_time_sweep.csv', index=False)
+    return table
+
+
+if __name__ == '__main__':
+    test_departure_time_sweep()
@@ -1,7 +1,5 @@
-import folium
-
 from src.build_route_graph import RouteGraphBuilder
-from src.utils.visualize_graph import setup_folium_graph, visualize_graph
+from src.utils.visualize_graph import setup_folium_graph, visualize_graph, visualize_polyline
 from src.utils.get_directories import TEST_OUTPUTS_FOLDER
 
 def test_get_route_graph():
@@ -10,7 +8,7 @@ def test_get_route_graph():
 
     builder = RouteGraphBuilder()
 
-    route_graphs, polylines = builder.get_full_route_graph(origin[0], origin[1], destination[0], destination[1])
+    route_graphs, polylines, route_node_mappings = builder.get_full_route_graph(origin[0], origin[1], destination[0], destination[1])
 
     m = setup_folium_graph(builder.toll_graph)
     # m = visualize_graph(builder.toll_graph, m, 'red')
@@ -25,11 +23,11 @@ def test_get_route_graph():
     # m = visualize_graph(builder.toll_graph, m, 'red')
     # m = visualize_graph(builder.major_ints_graph, m, 'orange')
     for i, polyline in enumerate(polylines):
-        folium.PolyLine(polyline, color=colours[i], weight=3, opacity=0.8,).add_to(m)
+        m = visualize_polyline(polyline, m, colours[i])
 
     m.save(TEST_OUTPUTS_FOLDER / 'route_polylines.html')
 
-    return route_graphs, polylines, origin, destination
+    return route_graphs, polylines, route_node_mappings, origin, destination
 
 
 if __name__ == '__main__':
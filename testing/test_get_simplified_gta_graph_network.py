@@ -10,7 +10,7 @@ def test_get_simplified_gta_graph_network():
         major_int_graph,
         major_int_graph_simplified,
         simplified_toll_graph,
-        simplified_components
+        simplified_chains
     ) = get_simplified_gta_graph_network()
     # Create a visualization and save it to an html file
     # Create base map centered on the graph
@@ -19,10 +19,10 @@ def test_get_simplified_gta_graph_network():
         # m = visualize_graph(G, m, 'gray')
         # m = visualize_graph(major_int_graph_simplified, m, 'green')
         # m = visualize_graph(toll_graph, m, 'blue', True, True)
-        toll_graph_comp1 = get_subgraph_copy(simplified_toll_graph, simplified_components[0])
-        toll_graph_comp2 = get_subgraph_copy(simplified_toll_graph, simplified_components[1])
-        m = visualize_graph(toll_graph_comp1, m, 'red')
-        m = visualize_graph(toll_graph_comp2, m, 'purple')
+        colours = ['red', 'purple', 'blue', 'darkgreen', 'orange', 'black']
+        for i, chain in enumerate(simplified_chains):
+            toll_graph_chain = get_subgraph_copy(simplified_toll_graph, set(chain))
+            m = visualize_graph(toll_graph_chain, m, colours[i % len(colours)])
     m.save(TEST_OUTPUTS_FOLDER / '407_tagged_nodes_map.html')
 
     m = setup_folium_graph(major_int_graph_simplified)
@@ -0,0 +1,63 @@
+import multiprocessing
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from src.graph_arena import ArenaManifest, GraphArena
+from src.build_route_graph import RouteGraphBuilder
+from src.build_traffic_routing_waypoints import TrafficWaypointsBuilder
+from src.helpers.interchange_connectors import ConnectorIndex
+from src.utils.memory import MB, get_private_memory
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+N_WORKERS = 2
+# Private memory of an attached worker allowed, as a fraction of a worker that loads the builders itself
+MAX_ATTACHED_MEMORY_FRACTION = 0.5
+
+
+def measure_worker(manifest: ArenaManifest | None):
+    """
+    Seconds a fresh worker spends getting its builders, and its private memory (bytes) once
+    it has also routed across the routing graph, as queries do.
+    """
+    start_memory = get_private_memory()
+    start_time = time.time()
+    if manifest is None:
+        builders = RouteGraphBuilder(), TrafficWaypointsBuilder(), ConnectorIndex.load()
+    else:
+        arena = GraphArena.attach(manifest)
+        builders = arena.load_builders()
+    elapsed = time.time() - start_time
+    route_builder, waypoints_builder, _ = builders
+    G = route_builder.routing_graph
+    path = G.shortest_path(int(G.node_ids[0]), int(G.node_ids[-1]), weight='travel_time')
+    shared = not waypoints_builder.int_simp_mapping.old_ids.flags.writeable and not G.indices.flags.writeable
+    return elapsed, get_private_memory() - start_memory, route_builder.combined_graph.number_of_edges(), shared, len(path)
+
+def run_workers(manifest: ArenaManifest | None):
+    with ProcessPoolExecutor(N_WORKERS, mp_context=multiprocessing.get_context('spawn'), max_tasks_per_child=1) as executor:
+        return list(executor.map(measure_worker, [manifest] * N_WORKERS))
+
+def test_graph_arena():
+    route_builder = RouteGraphBuilder()
+    waypoints_builder, connector_index = TrafficWaypointsBuilder(), ConnectorIndex.load()
+
+    loaded = run_workers(None)
+    with GraphArena.create(route_builder, waypoints_builder, connector_index) as arena:
+        attached = run_workers(arena.manifest)
+
+    for name, results in [('Loading intermediate results', loaded), ('Attaching graph arena', attached)]:
+        times = [elapsed for elapsed, *_ in results]
+        memory = [private / MB for _, private, *_ in results]
+        logger.info(f'{name}: {np.mean(times):.2f} s and {np.mean(memory):.1f} MB private memory per worker')
+    for (_, _, n_edges, shared, path_length), (*_, loaded_path_length) in zip(attached, loaded):
+        assert n_edges == route_builder.combined_graph.number_of_edges()
+        assert shared and path_length == loaded_path_length
+    # Workers route on the arena's pages instead of private copies of the graphs
+    assert np.mean([private for _, private, *_ in attached]) < MAX_ATTACHED_MEMORY_FRACTION * np.mean([private for _, private, *_ in loaded])
+    return loaded, attached
+
+
+if __name__ == '__main__':
+    test_graph_arena()
@@ -0,0 +1,50 @@
+import time
+import numpy as np
+
+from src.build_route_graph import RouteGraphBuilder
+from src.helpers.graph_pyramid import load_intersection_mappings
+from testing.test_polyline_simplification import get_dense_chain_polyline
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+def test_graph_pyramid():
+    route_builder = RouteGraphBuilder()
+    pyramid = route_builder.pyramid
+    assert pyramid is not None, 'Run the graph_pyramid preprocessing stage first'
+    levels = pyramid.levels
+
+    # Coarser levels have fewer nodes, and every node of a finer level is represented exactly once
+    for finer, coarser in zip(levels[:-1], levels[1:]):
+        assert len(coarser.combined_graph) <= len(finer.combined_graph)
+        assert sorted(coarser.level_mapping.old_ids.tolist()) == sorted(finer.combined_graph.nodes)
+        assert set(coarser.level_mapping.new_ids.tolist()) == set(coarser.combined_graph.nodes)
+    original_nodes = sorted(route_builder.major_ints_graph.nodes)
+    for level, mapping in zip(levels, load_intersection_mappings()):
+        assert set(mapping.new_ids.tolist()) == set(level.major_ints_graph.nodes)
+        assert len(mapping.old_ids) == len(np.unique(mapping.old_ids))
+
+    assert pyramid.choose_level(1_000) is levels[0]
+    assert pyramid.choose_level(1_000_000) is levels[-1]
+
+    polyline = get_dense_chain_polyline(route_builder)
+    route_length = polyline.to_projected_linestring().length
+    node_counts = []
+    for level in levels:
+        start_time = time.time()
+        route_nodes = route_builder.match_toll_route(polyline, level)
+        route_graph = route_builder.build_route_graph(route_nodes, level.routing_graph)
+        node_counts.append(len(route_graph))
+        logger.info(
+            f'Level {level.index} ({level.simplification_dist} m, {len(level.combined_graph)} nodes): '
+            f'route graph of {len(route_graph)} nodes in {time.time() - start_time:.3f} s'
+        )
+    assert node_counts == sorted(node_counts, reverse=True)
+
+    chosen = route_builder.choose_level(polyline)
+    logger.info(f'{route_length / 1000:.1f} km route uses level {chosen.index}')
+    assert node_counts[chosen.index] >= min(pyramid.min_route_nodes, node_counts[0])
+    return node_counts
+
+
+if __name__ == '__main__':
+    test_graph_pyramid()
@@ -0,0 +1,45 @@
+import time
+import tracemalloc
+import osmnx as ox
+
+from src.helpers.graphml_loader import load_graphml_columns, QUERY_NODE_ATTRS, QUERY_EDGE_ATTRS
+from src.utils.projection import PROJECTED_NODE_DTYPES
+from src.utils.get_directories import INTERMEDIATE_RESULTS_DIR
+from src.utils.memory import MB
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+# Parsing overhead (peak above the loaded graph) allowed, as a fraction of the loaded graph
+MAX_PARSE_OVERHEAD = 0.05
+
+def measure(load):
+    tracemalloc.start()
+    start_time = time.time()
+    G = load()
+    elapsed = time.time() - start_time
+    allocated, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return G, elapsed, allocated, peak
+
+def test_graphml_loader(file_name: str = 'major_intersections.graphml'):
+    path = INTERMEDIATE_RESULTS_DIR / file_name
+    full_graph, full_time, full_bytes, full_peak = measure(lambda: ox.load_graphml(path, node_dtypes=PROJECTED_NODE_DTYPES))
+    graph, time_, bytes_, peak = measure(lambda: load_graphml_columns(path))
+    logger.info(
+        f'{file_name}: ox.load_graphml {full_time:.2f} s, {full_bytes / MB:.1f} MB (peak {full_peak / MB:.1f} MB); '
+        f'column projection {time_:.2f} s, {bytes_ / MB:.1f} MB (peak {peak / MB:.1f} MB)'
+    )
+    # Parsed elements are dropped as the stream goes, so they do not pile up on top of the graph
+    assert peak - bytes_ < MAX_PARSE_OVERHEAD * bytes_
+
+    assert set(graph.edges(keys=True)) == set(full_graph.edges(keys=True))
+    for node, data in graph.nodes(data=True):
+        assert data == {attr: full_graph.nodes[node][attr] for attr in QUERY_NODE_ATTRS if attr in full_graph.nodes[node]}
+    for u, v, key, data in graph.edges(keys=True, data=True):
+        full_data = full_graph.edges[u, v, key]
+        assert data == {attr: full_data[attr] for attr in QUERY_EDGE_ATTRS if attr in full_data}
+    return graph
+
+
+if __name__ == '__main__':
+    test_graphml_loader()
@@ -0,0 +1,42 @@
+import itertools
+
+from src.build_route_graph import RouteGraphBuilder
+from src.build_local_alternatives import LocalAlternativesBuilder
+from src.helpers.alternative_routes import get_path_overlap
+from src.utils.constants import ALTERNATIVE_MAX_OVERLAP
+from src.utils.visualize_graph import setup_folium_graph, visualize_graph, visualize_polyline
+from src.utils.get_directories import TEST_OUTPUTS_FOLDER
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+COLOURS = ['red', 'blue', 'green', 'purple', 'orange']
+
+def test_local_alternatives(k: int = 3):
+    origin = 43.393262, -79.802492  # Appleby Line entrance
+    destination = 43.841385, -79.306418  # Kennedy Rd exit
+
+    route_builder = RouteGraphBuilder()
+    alternatives_builder = LocalAlternativesBuilder(route_builder)
+    route_graphs, polylines, route_node_mappings = alternatives_builder.build_alternatives(
+        origin[0], origin[1], destination[0], destination[1], k
+    )
+    assert 0 < len(route_graphs) <= k
+
+    G = alternatives_builder.get_search_graph(avoid_tolls=True)
+    paths = [[mapping[i] for i in sorted(mapping)] for mapping in route_node_mappings]
+    for path, other_path in itertools.combinations(paths, 2):
+        assert get_path_overlap(G, path, other_path) <= ALTERNATIVE_MAX_OVERLAP
+    for route_graph, polyline, mapping in zip(route_graphs, polylines, route_node_mappings):
+        assert len(polyline) == len(mapping) == len(route_graph)
+        assert [node for node in route_graph.nodes if route_graph.in_degree(node) == 0] == [0]
+
+    m = setup_folium_graph(route_graphs[0])
+    for i, (route_graph, polyline) in enumerate(zip(route_graphs, polylines)):
+        visualize_polyline(polyline, m, COLOURS[i % len(COLOURS)])
+        visualize_graph(route_graph, m, COLOURS[i % len(COLOURS)])
+    m.save(TEST_OUTPUTS_FOLDER / 'local_alternatives.html')
+    return route_graphs, polylines, route_node_mappings
+
+
+if __name__ == '__main__':
+    test_local_alternatives()
@@ -0,0 +1,74 @@
+import time
+import numpy as np
+
+from src.build_route_graph import RouteGraphBuilder
+from src.build_local_alternatives import LocalAlternativesBuilder
+from src.helpers.interchange_connectors import ConnectorIndex
+from src.helpers.polyline import Polyline
+from testing.test_polyline_simplification import get_dense_chain_polyline, load_toll_chain
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+def densify(polyline: Polyline, points_per_segment: int = 10, noise: float = 1e-4) -> Polyline:
+    t = np.linspace(0, 1, points_per_segment, endpoint=False)[:, None]
+    coords = polyline.coords
+    dense = np.concatenate([start + t * (end - start) for start, end in zip(coords[:-1], coords[1:])] + [coords[-1:]])
+    return Polyline(dense + np.random.default_rng(0).normal(0, noise, dense.shape))
+
+def get_toll_route_path(route_builder: RouteGraphBuilder, connector_index: ConnectorIndex):
+    """Intersection, the first toll chain from its first entrance to its last exit, intersection."""
+    chain = load_toll_chain()['simplified_nodes']
+    entrances = [(i, c) for i, node in enumerate(chain) for c in connector_index.get_connectors(node) if c['kind'] == 'entrance']
+    exits = [(i, c) for i, node in enumerate(chain) for c in connector_index.get_connectors(node) if c['kind'] == 'exit']
+    (first, entrance), (last, exit) = entrances[0], exits[-1]
+    return [entrance['intersection_node']] + chain[first:last + 1] + [exit['intersection_node']]
+
+def is_connected_path(G, path):
+    return all(G.has_edge(u, v) for u, v in zip(path, path[1:]))
+
+def test_map_matching():
+    origin = 43.393262, -79.802492  # Appleby Line entrance
+    destination = 43.841385, -79.306418  # Kennedy Rd exit
+    route_builder = RouteGraphBuilder()
+
+    # Toll route: must stay on the carriageway the polyline travels along
+    polyline = get_dense_chain_polyline(route_builder)
+    start_time = time.time()
+    route_nodes = route_builder.match_toll_route(polyline)
+    path = list(route_nodes.values())
+    logger.info(f'Matched {len(polyline)} point toll polyline to {len(path)} nodes in {time.time() - start_time:.3f} s')
+    chain_nodes = set(load_toll_chain()['simplified_nodes'])
+    toll_path = [node for node in path if route_builder.routing_graph.nodes[node]['tag'] == 'toll_route']
+    assert toll_path and set(toll_path) <= chain_nodes
+    assert is_connected_path(route_builder.routing_graph, path)
+    assert sorted(route_nodes) == list(route_nodes)
+
+    # Toll route with non-toll ends: a noisy polyline entering the toll chain from an intersection and leaving it to another
+    true_path = get_toll_route_path(route_builder, ConnectorIndex.load())
+    path = list(route_builder.match_toll_route(densify(Polyline(route_builder.routing_graph.get_coords(true_path)[:, ::-1]))).values())
+    tags = [route_builder.routing_graph.nodes[node]['tag'] for node in path]
+    logger.info(f'Matched toll route to {tags.count("toll_route")} toll and {tags.count("None")} other nodes')
+    assert path[0] == true_path[0] and path[-1] == true_path[-1]
+    assert [node for node, tag in zip(path, tags) if tag == 'toll_route'] == true_path[1:-1]
+    assert is_connected_path(route_builder.routing_graph, path)
+
+    # Non-toll route: a noisy polyline along a known path through the intersection graph
+    alternatives_builder = LocalAlternativesBuilder(route_builder)
+    _, polylines, route_node_mappings = alternatives_builder.build_alternatives(
+        origin[0], origin[1], destination[0], destination[1], k=1
+    )
+    true_path = [route_node_mappings[0][i] for i in sorted(route_node_mappings[0])]
+    polyline = densify(polylines[0])
+    start_time = time.time()
+    paths, route_nodes = route_builder.major_ints_matcher.match(polyline)
+    path = [node for path in paths for node in path]
+    logger.info(f'Matched {len(polyline)} point polyline to {len(path)} nodes in {time.time() - start_time:.3f} s')
+    recall = len(set(path) & set(true_path)) / len(set(true_path))
+    logger.info(f'Recovered {recall:.1%} of the true path nodes')
+    assert all(is_connected_path(route_builder.major_ints_graph, path) for path in paths)
+    assert recall > 0.9
+    return path
+
+
+if __name__ == '__main__':
+    test_map_matching()
@@ -0,0 +1,58 @@
+import numpy as np
+from datetime import datetime, timedelta, timezone
+
+from src.departure_time_sweep import sweep_departure_times
+from src.get_connecting_routes import get_batched_durations, request_route_duration
+from src.helpers.matrix_routing import plan_matrix_batches, get_legs
+from src.helpers.routing_client import RoutingClient
+from src.query_context import QueryContext
+from testing.stub_here_server import StubHereServer
+from src.utils.constants import MATRIX_MAX_ORIGINS, MATRIX_MAX_DESTINATIONS
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+def get_matrix_trips():
+    """Trips from 20 origins to 4 destinations over each of the 3 returned via lists, enough for several matrix batches."""
+    origins = [f'{43.35 + 0.01 * i:.6f},-79.800000' for i in range(20)]
+    destinations = [f'{43.80 + 0.01 * i:.6f},-79.300000' for i in range(4)]
+    vias = [[], ['43.600000,-79.550000'], ['43.550000,-79.600000', '43.700000,-79.400000']]
+    return [(origin, destination, via) for origin in origins for destination in destinations for via in vias], vias
+
+
+def test_matrix_evaluation():
+    departure_time = datetime(2026, 1, 5, 12, tzinfo=timezone.utc)
+    trips, vias = get_matrix_trips()
+
+    batches = plan_matrix_batches([leg for trip in trips for leg in get_legs(trip)])
+    assert all(len(o) <= MATRIX_MAX_ORIGINS and len(d) <= MATRIX_MAX_DESTINATIONS for o, d in batches)
+
+    with StubHereServer(latency=0.01) as stub:
+        client = RoutingClient(base_url=stub.base_url, matrix_base_url=stub.base_url, requests_per_second=100)
+        batched = get_batched_durations(trips, departure_time, client)
+        n_batched_requests = stub.request_count
+        single = np.array([request_route_duration(*trip, departure_time, client)[0] for trip in trips[::7]])
+    logger.info(f'{len(trips)} trips in {n_batched_requests} matrix requests')
+    assert batched.shape == (len(trips),)
+    assert np.array_equal(batched[::7], single)
+    assert n_batched_requests == len(batches) < len(trips)
+
+    with StubHereServer(latency=0.01, matrix_enabled=False) as stub:
+        client = RoutingClient(base_url=stub.base_url, matrix_base_url=stub.base_url, requests_per_second=100)
+        fallback = get_batched_durations(trips[:24], departure_time, client)
+    assert np.array_equal(fallback, batched[:24])
+
+    # A departure time sweep prices all routes of each departure time with one matrix request
+    context = QueryContext((43.35, -79.8), (43.8, -79.3))
+    context.waypoints = vias
+    departure_times = [departure_time + timedelta(minutes=15 * i) for i in range(4)]
+    with StubHereServer(latency=0.01) as stub:
+        client = RoutingClient(base_url=stub.base_url, matrix_base_url=stub.base_url, requests_per_second=100)
+        table = sweep_departure_times(context, departure_times, routing_client=client)
+        single = [request_route_duration(*trip, departure_time, client)[0] for trip in context.trips]
+    assert stub.request_count == len(departure_times) + len(context.trips)
+    assert np.allclose(table['toll_duration_min'], single[0] / 60)
+    assert np.allclose(table['best_non_toll_duration_min'], min(single[1:]) / 60)
+
+
+if __name__ == '__main__':
+    test_matrix_evaluation()
@@ -0,0 +1,80 @@
+import json
+import time
+import numpy as np
+
+from src.build_route_graph import RouteGraphBuilder
+from src.build_traffic_routing_waypoints import TrafficWaypointsBuilder
+from src.helpers.csr_graph import CSRGraph
+from src.helpers.map_matching import MapMatcher
+from src.helpers.polyline import Polyline
+from src.utils.projection import get_node_coords
+from src.utils.get_directories import INTERMEDIATE_RESULTS_DIR
+from src.utils.constants import POLYLINE_SIMPLIFICATION_TOLERANCE
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+def load_toll_chain(index: int = 0) -> dict:
+    """A toll chain record (nodes, simplified_nodes, bearing, direction) of the preprocessed base graphs."""
+    with open(INTERMEDIATE_RESULTS_DIR / 'toll_chains.json', 'r', encoding='utf-8') as f:
+        return json.load(f)[index]
+
+def get_dense_chain_polyline(route_builder: RouteGraphBuilder, points_per_edge: int = 20, noise: float = 1e-5) -> Polyline:
+    """HERE-like polyline along the first toll chain: many slightly noisy points per edge."""
+    chain = load_toll_chain()['nodes']
+    lonlat = get_node_coords(route_builder.full_toll_graph, chain)
+    t = np.linspace(0, 1, points_per_edge, endpoint=False)[:, None]
+    dense = np.concatenate([start + t * (end - start) for start, end in zip(lonlat[:-1], lonlat[1:])] + [lonlat[-1:]])
+    dense += np.random.default_rng(0).normal(0, noise, dense.shape)
+    return Polyline(dense[:, ::-1])
+
+def get_chain_graph(route_builder: RouteGraphBuilder) -> CSRGraph:
+    """The simplified toll graph of the first toll chain, the carriageway get_dense_chain_polyline runs along."""
+    return route_builder.toll_graph.subgraph(load_toll_chain()['simplified_nodes'])
+
+def time_call(func, *args, **kwargs):
+    start_time = time.time()
+    result = func(*args, **kwargs)
+    return result, time.time() - start_time
+
+def test_polyline_simplification():
+    route_builder = RouteGraphBuilder()
+    waypoints_builder = TrafficWaypointsBuilder()
+    polyline = get_dense_chain_polyline(route_builder)
+    toll_graph = get_chain_graph(route_builder)
+
+    # Simplified toll edges carry the free-flow travel time along the chain edges they skip
+    chain = load_toll_chain()
+    skipped = chain['nodes'][:chain['nodes'].index(chain['simplified_nodes'][-1]) + 1]
+    assert np.isclose(
+        toll_graph.get_path_weight(chain['simplified_nodes'], 'travel_time'),
+        route_builder.full_toll_graph.get_path_weight(skipped, 'travel_time')
+    )
+
+    # Matching onto the full-resolution toll road, so the reduced polyline has nodes to lose
+    matcher = MapMatcher(route_builder.full_toll_graph)
+    (_, full_nodes), full_time = time_call(matcher.match, polyline, sample_spacing=None)
+    (_, reduced_nodes), reduced_time = time_call(matcher.match, polyline)
+    full_set, reduced_set = set(full_nodes.values()), set(reduced_nodes.values())
+    overlap = len(full_set & reduced_set) / len(full_set | reduced_set)
+    assert all(0 <= idx < len(polyline) for idx in reduced_nodes)
+    logger.info(f'Matching: {full_time:.3f} s -> {reduced_time:.3f} s ({full_time / reduced_time:.1f}x), node overlap {overlap:.1%}')
+    assert overlap > 0.95
+
+    node_ids = list(route_builder.full_toll_graph.nodes)
+    (_, _, full_dists), full_time = time_call(
+        waypoints_builder.get_closest_points_on_polyline, route_builder.full_toll_graph, node_ids, polyline, tolerance=None
+    )
+    (_, _, reduced_dists), reduced_time = time_call(
+        waypoints_builder.get_closest_points_on_polyline, route_builder.full_toll_graph, node_ids, polyline
+    )
+    simplified_points = len(polyline.get_simplified_indices(POLYLINE_SIMPLIFICATION_TOLERANCE))
+    logger.info(
+        f'Closest points: {len(polyline)} -> {simplified_points} polyline points, '
+        f'{full_time:.3f} s -> {reduced_time:.3f} s ({full_time / reduced_time:.1f}x), '
+        f'max distance change {np.abs(full_dists - reduced_dists).max():.2f} m'
+    )
+    assert np.abs(full_dists - reduced_dists).max() <= POLYLINE_SIMPLIFICATION_TOLERANCE + 1e-6
+
+
+if __name__ == '__main__':
+    test_polyline_simplification()
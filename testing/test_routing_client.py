@@ -0,0 +1,63 @@
+import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from src.helpers.routing_client import RoutingClient
+from src.get_connecting_routes import request_route_duration
+from testing.stub_here_server import StubHereServer
+from src.utils.timer import Timer
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+ORIGIN = '43.393262,-79.802492'  # Appleby Line entrance
+DESTINATION = '43.841385,-79.306418'  # Kennedy Rd exit
+
+def run_concurrent_queries():
+    """Queries a throttling, failing stub concurrently; returns the durations, the client and the stub."""
+    start = datetime(2026, 1, 5, 7, tzinfo=timezone.utc)
+    # 16 distinct trips, each requested 4 times concurrently with a few seconds of jitter
+    departure_times = [start + timedelta(minutes=15 * (i % 16), seconds=i % 7) for i in range(64)]
+
+    with StubHereServer(latency=0.2, throttle_every=5, fail_every=7) as stub:
+        client = RoutingClient(base_url=stub.base_url, requests_per_second=10, backoff_base=0.05)
+
+        def query(departure_time: datetime) -> float:
+            duration, _ = request_route_duration(ORIGIN, DESTINATION, [], departure_time, client)
+            return duration
+
+        with Timer('Querying stub routing server', 'Queried stub routing server'):
+            with ThreadPoolExecutor(max_workers=64) as executor:
+                durations = list(executor.map(query, departure_times))
+    return durations, client, stub
+
+
+def test_routing_client():
+    durations, client, stub = run_concurrent_queries()
+    client.log_metrics()
+    logger.info(f'Stub server responses: {dict(stub.status_counts)}')
+    metrics = client.metrics
+    assert len(set(durations)) == 1
+    assert metrics.deduplicated > 0
+    assert metrics.max_queue_depth > 1
+    assert metrics.requests == stub.request_count
+    assert metrics.retries == stub.status_counts[429] + stub.status_counts[503]
+    assert stub.status_counts[200] < len(durations)
+    # Throttling lowered the rate, successes raised it again
+    assert metrics.min_rate < client.max_rate and metrics.rate > metrics.min_rate
+    assert len(metrics.wait_times) <= metrics.wait_times.maxlen
+
+    # Errors never show the API key, and an absurd Retry-After is capped at the maximum backoff
+    with StubHereServer(latency=0.01, throttle_every=1, retry_after=3600) as stub:
+        client = RoutingClient(base_url=stub.base_url, max_retries=1, backoff_max=0.1)
+        start_time = time.time()
+        try:
+            client.get_routes({'origin': ORIGIN, 'destination': DESTINATION, 'apiKey': 'secret-key'})
+            assert False, 'The stub answers every request with 429'
+        except requests.HTTPError as e:
+            assert e.response.status_code == 429 and 'secret-key' not in str(e)
+        assert time.time() - start_time < 5
+
+
+if __name__ == '__main__':
+    test_routing_client()
@@ -0,0 +1,44 @@
+import numpy as np
+import time
+
+from src.get_simplified_gta_graph_network import get_simplified_gta_graph_network_staged, PREPROCESSING_STAGES
+from src.utils.constants import PREPROCESSING_MEMORY_BUDGET_MB
+from src.utils.memory import MB, MemoryBudgetExceeded, PeakMemory, get_current_rss
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+# Stages fed the connector search graph instead of the full drive graph
+SUBGRAPH_STAGES = ['toll_chains', 'interchange_connectors']
+
+def check_budget_interrupts(chunk_mb: int = 10, n_chunks: int = 40, budget_mb: int = 100) -> int:
+    """Allocate n_chunks chunks under a budget budget_mb above the current RSS; returns how many were allocated."""
+    chunks = []
+    try:
+        with PeakMemory('Budget check', get_current_rss() + budget_mb * MB):
+            for _ in range(n_chunks):
+                chunks.append(np.ones(chunk_mb * MB // 8))
+                time.sleep(0.01)
+        raise AssertionError('The memory budget was not enforced')
+    except MemoryBudgetExceeded as e:
+        logger.info(f'Interrupted after {len(chunks)} of {n_chunks} chunks: {e}')
+    return len(chunks)
+
+def test_staged_preprocessing(memory_budget_mb: float = PREPROCESSING_MEMORY_BUDGET_MB):
+    # The budget stops a block while it allocates, not once it has finished
+    assert check_budget_interrupts() < 40
+
+    peak_rss = get_simplified_gta_graph_network_staged(memory_budget_mb)
+    assert list(peak_rss) == list(PREPROCESSING_STAGES)
+
+    logger.info(f'Peak RSS per stage (budget {memory_budget_mb:.0f} MB):')
+    for stage_name, peak in peak_rss.items():
+        logger.info(f'\t{stage_name}: {peak / MB:.0f} MB')
+    assert all(peak <= memory_budget_mb * MB for peak in peak_rss.values())
+    # Only the first stage holds the full drive graph
+    for stage_name in SUBGRAPH_STAGES:
+        assert peak_rss[stage_name] < peak_rss['tag_graph'], f'{stage_name} peaked above tag_graph'
+    return peak_rss
+
+
+if __name__ == '__main__':
+    test_staged_preprocessing()
@@ -0,0 +1,44 @@
+import time
+import shapely
+from datetime import datetime, timezone
+
+from src.build_route_graph import RouteGraphBuilder
+from src.build_traffic_routing_waypoints import TrafficWaypointsBuilder
+from src.get_connecting_routes import request_route_duration
+from src.helpers.routing_client import RoutingClient
+from src.helpers.via_selection import ViaSelector
+from testing.stub_here_server import StubHereServer
+from testing.test_polyline_simplification import get_dense_chain_polyline
+from src.utils.setup_logger import get_logger
+logger = get_logger()
+
+def test_via_selection():
+    route_builder = RouteGraphBuilder()
+    waypoints_builder = TrafficWaypointsBuilder()
+    via_selector = ViaSelector(route_builder.routing_graph)
+
+    polyline = get_dense_chain_polyline(route_builder)
+    toll_nodes = route_builder.match_toll_route(polyline)
+    route_graph = route_builder.build_route_graph(toll_nodes, route_builder.routing_graph)
+
+    all_vias = waypoints_builder.build_waypoints([route_graph], [polyline], [toll_nodes])[0]
+    start_time = time.time()
+    selected_vias = waypoints_builder.build_waypoints([route_graph], [polyline], [toll_nodes], via_selector)[0]
+    logger.info(f'Via selection took {time.time() - start_time:.3f} s')
+    assert len(selected_vias) <= len(all_vias)
+    assert all(via in all_vias for via in selected_vias)
+
+    origin, destination = '{},{}'.format(*polyline[0]), '{},{}'.format(*polyline[-1])
+    with StubHereServer(latency=0.05) as stub:
+        client = RoutingClient(base_url=stub.base_url)
+        for name, vias in [('All', all_vias), ('Selected', selected_vias)]:
+            start_time = time.time()
+            _, returned_polyline = request_route_duration(origin, destination, vias, datetime.now(timezone.utc), client)
+            latency = time.time() - start_time
+            deviation = shapely.hausdorff_distance(returned_polyline.to_projected_linestring(), polyline.to_projected_linestring())
+            logger.info(f'{name} vias: {len(vias)}, request took {latency:.3f} s, {deviation:.0f} m from the original route')
+    return selected_vias
+
+
+if __name__ == '__main__':
+    test_via_selection()